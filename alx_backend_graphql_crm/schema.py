@@ -1,11 +1,18 @@
+import graphene
 
+from crm.schema import Query as CRMQuery, Mutation as CRMMutation, Subscription as CRMSubscription
 
 
+class Query(CRMQuery, graphene.ObjectType):
+    hello = graphene.String(default_value="Hello, GraphQL!")
 
-# Minimal schema for Task 0 compliance
-import graphene
 
-class Query(graphene.ObjectType):
-    hello = graphene.String(default_value="Hello, GraphQL!")
+class Mutation(CRMMutation, graphene.ObjectType):
+    pass
+
+
+class Subscription(CRMSubscription, graphene.ObjectType):
+    pass
+
 
-schema = graphene.Schema(query=Query)
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
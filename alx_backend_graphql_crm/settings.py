@@ -0,0 +1,10 @@
+"""
+Django settings for alx_backend_graphql_crm project.
+
+The full configuration (including the django-crontab and Celery settings)
+lives in ``crm/settings.py``; this module re-exports it so that
+``manage.py``, ``wsgi.py``, ``asgi.py`` and the Celery app all agree on a
+single settings module.
+"""
+
+from crm.settings import *  # noqa: F401,F403
@@ -17,10 +17,14 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, export_view, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    # Same schema for ASGI deployments (see asgi.py).
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    path("export/<str:kind>", export_view, name="crm-export"),
+    path("metrics", metrics_view, name="crm-metrics"),
 ]
@@ -0,0 +1,9 @@
+"""
+Throughput benchmarks for the CRM write and read paths.
+
+Each module is runnable from the project root, e.g.::
+
+    python -m crm.benchmarks.bulk_customers --sizes 1000 10000
+
+Benchmarks run against a throwaway test database, never ``db.sqlite3``.
+"""
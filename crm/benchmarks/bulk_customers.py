@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark BulkCreateCustomers: per-row legacy loop vs the chunked bulk engine.
+
+    python -m crm.benchmarks.bulk_customers [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import sys
+
+from crm.benchmarks.utils import clear_tables, print_table, setup_django, test_database, timed
+
+
+def legacy_bulk_create_customers(rows):
+    """The original BulkCreateCustomers.mutate loop, kept for comparison."""
+    from django.core.validators import RegexValidator
+    from crm.models import Customer
+
+    customers = []
+    errors = []
+    for idx, data in enumerate(rows):
+        name = data.get('name')
+        email = data.get('email')
+        phone = data.get('phone')
+        if not name or not email:
+            errors.append(f"Row {idx+1}: Name and email required")
+            continue
+        if Customer.objects.filter(email=email).exists():
+            errors.append(f"Row {idx+1}: Email already exists")
+            continue
+        if phone:
+            validator = RegexValidator(regex=r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
+            try:
+                validator(phone)
+            except Exception:
+                errors.append(f"Row {idx+1}: Invalid phone format")
+                continue
+        customer = Customer(name=name, email=email, phone=phone)
+        customer.save()
+        customers.append(customer)
+    return customers, errors
+
+
+def make_rows(count):
+    # Roughly 1% duplicates and 1% bad phones so the error paths are exercised.
+    rows = []
+    for i in range(count):
+        email = f"customer{i - 1 if i % 100 == 99 else i}@example.com"
+        phone = "bad" if i % 100 == 50 else f"+1555{i:07d}"
+        rows.append({'name': f"Customer {i}", 'email': email, 'phone': phone})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.db import transaction
+    from crm.bulk import bulk_create_customers
+    from crm.models import Customer
+
+    results = []
+    with test_database():
+        for size in args.sizes:
+            rows = make_rows(size)
+            timings = {}
+            for label, fn in (('legacy', legacy_bulk_create_customers), ('bulk', bulk_create_customers)):
+                clear_tables(Customer)
+                with transaction.atomic():
+                    (created, errors), elapsed = timed(fn, rows)
+                timings[label] = elapsed
+            results.append((
+                size,
+                f"{size / timings['legacy']:,.0f}",
+                f"{size / timings['bulk']:,.0f}",
+                f"{timings['legacy'] / timings['bulk']:.1f}x",
+            ))
+    print_table(('rows', 'legacy rows/s', 'bulk rows/s', 'speedup'), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
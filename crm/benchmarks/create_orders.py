@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark order creation throughput (orders/second).
+
+Compares the original CreateOrder body, the create_orders pipeline called
+once per order (what createOrder does) and the pipeline called once for
+the whole batch (what bulkCreateOrders does).
+
+    python -m crm.benchmarks.create_orders [--sizes 1000 10000] [--products-per-order 3]
+"""
+
+import argparse
+import sys
+
+from crm.benchmarks.utils import clear_tables, print_table, setup_django, test_database, timed
+
+
+def legacy_create_order(customer_id, product_ids):
+    """The original CreateOrder.mutate body, kept for comparison."""
+    from django.utils import timezone
+    from crm.models import Customer, Order, OrderLine, Product
+
+    customer = Customer.objects.get(pk=customer_id)
+    products = list(Product.objects.filter(pk__in=product_ids))
+    order = Order(customer=customer, order_date=timezone.now())
+    order.save()
+    OrderLine.objects.bulk_create(
+        OrderLine(order=order, product=p, unit_price=p.price, line_total=p.price) for p in products
+    )
+    order.total_amount = sum([p.price for p in products])
+    order.save()
+    return order
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--products-per-order', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from decimal import Decimal
+    from django.db import transaction
+    from crm.bulk import create_orders
+    from crm.models import Customer, Order, Product
+
+    def run_legacy(rows):
+        for row in rows:
+            legacy_create_order(row['customer_id'], row['product_ids'])
+
+    def run_single(rows):
+        for row in rows:
+            create_orders([row])
+
+    results = []
+    with test_database():
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", email=f"customer{i}@example.com") for i in range(100)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("9.99"), stock=0) for i in range(50)
+        )
+        for size in args.sizes:
+            rows = [
+                {
+                    'customer_id': customers[i % len(customers)].pk,
+                    'product_ids': [
+                        products[(i + j) % len(products)].pk for j in range(args.products_per_order)
+                    ],
+                }
+                for i in range(size)
+            ]
+            timings = {}
+            for label, fn in (('legacy', run_legacy), ('single', run_single), ('bulk', create_orders)):
+                clear_tables(Order)
+                Product.objects.update(stock=size)
+                with transaction.atomic():
+                    _, elapsed = timed(fn, rows)
+                timings[label] = elapsed
+            results.append((
+                size,
+                *(f"{size / timings[label]:,.0f}" for label in ('legacy', 'single', 'bulk')),
+            ))
+    print_table(('orders', 'legacy orders/s', 'createOrder orders/s', 'bulk orders/s'), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
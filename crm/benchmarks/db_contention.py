@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Mixed reads and writes from many processes on one SQLite file.
+
+Every process loops over requests that either create an order (the
+``createOrder`` path) or read a page of orders and the low-stock count,
+closing its connections at the end of each request the way Django does
+(``close_old_connections``). ``tuned`` runs with the project's database
+settings: WAL, synchronous=NORMAL, memory-mapped reads, BEGIN IMMEDIATE,
+persistent connections and reads on the read-only ``replica`` alias (in
+``read_from_replica()``, as for GraphQL queries).
+``baseline`` uses Django's defaults: a rollback journal, a connection per
+request and every read on the writer. ``locked`` counts the requests that
+still failed with a lock error after the write retries.
+
+    python -m crm.benchmarks.db_contention [--processes 1 4 8] [--requests 500] [--write-ratio 0.2]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from crm.benchmarks.utils import print_table, setup_django, test_database
+
+MODES = ('baseline', 'tuned')
+
+
+def configure(path, mode):
+    """Point both database aliases at ``path`` with the settings of ``mode``."""
+    from django.conf import settings
+
+    default, replica = settings.DATABASES['default'], settings.DATABASES['replica']
+    default['NAME'] = path
+    replica['NAME'] = f'file:{path}?mode=ro'
+    if mode == 'baseline':
+        default.update(CONN_MAX_AGE=0, OPTIONS={})
+        settings.CRM_READ_REPLICA = None
+
+
+def worker(path, mode, requests, write_ratio, customer_id, product_ids):
+    setup_django()
+    configure(path, mode)
+    from django.db import OperationalError, close_old_connections
+    from crm.bulk import create_orders
+    from crm.db import read_from_replica
+    from crm.models import Order, Product
+    from crm.stock import retry_on_conflict
+
+    rng = random.Random()
+    writes = locked = 0
+    began = time.perf_counter()
+    for _ in range(requests):
+        try:
+            if rng.random() < write_ratio:
+                retry_on_conflict(create_orders, [{'customer_id': customer_id, 'product_ids': rng.sample(product_ids, 2)}])
+                writes += 1
+            else:
+                with read_from_replica():
+                    list(Order.objects.select_related('customer').order_by('-pk')[:20])
+                    Product.objects.filter(stock__lte=10).count()
+        except OperationalError:
+            locked += 1
+        finally:
+            close_old_connections()
+    return writes, locked, time.perf_counter() - began
+
+
+def run(path, mode, processes, requests, write_ratio, customer_id, product_ids):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={'DELETE' if mode == 'baseline' else 'WAL'}")
+    connection.close()
+    context = multiprocessing.get_context('spawn')
+    arguments = [(path, mode, requests, write_ratio, customer_id, product_ids)] * processes
+    with context.Pool(processes) as pool:
+        results = pool.starmap(worker, arguments)
+    elapsed = max(result[2] for result in results)
+    return sum(r[0] for r in results), sum(r[1] for r in results), processes * requests / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=500, help="Requests per process.")
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--mode', choices=MODES, nargs='+', default=list(MODES))
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from decimal import Decimal
+    from django.db import connection
+    from crm.models import Customer, Product
+
+    if connection.vendor != 'sqlite':
+        parser.error("this benchmark measures SQLite settings")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'db_contention.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        with test_database():
+            configure(path, 'baseline')
+            customer = Customer.objects.create(name="Customer", email="customer@example.com")
+            product_ids = [
+                product.pk for product in Product.objects.bulk_create(
+                    Product(name=f"SKU {i}", price=Decimal("9.99"), stock=10 ** 9) for i in range(args.products)
+                )
+            ]
+            for mode in args.mode:
+                for processes in args.processes:
+                    writes, locked, rate = run(
+                        path, mode, processes, args.requests, args.write_ratio, customer.pk, product_ids,
+                    )
+                    results.append((mode, processes, f"{rate:,.0f}", writes, locked))
+    print_table(('mode', 'processes', 'requests/s', 'orders', 'locked'), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
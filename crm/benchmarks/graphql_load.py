@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Load-test the synchronous and asynchronous GraphQL views.
+
+Runs closed-loop clients (each sends its next request as soon as the
+previous one answers) against /graphql through the WSGI handler, served
+by a fixed pool of worker threads like a threaded WSGI server, and
+against /graphql/async through the ASGI handler. Reports requests/second
+and p50/p99 latency per concurrency level. ``--query-delay-ms`` adds a
+sleep to every SQL query to emulate a database across the network.
+
+    python -m crm.benchmarks.graphql_load [--concurrency 50 200 1000] [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crm.benchmarks.utils import print_table, setup_django, test_database
+
+QUERY = """
+    query ($first: Int) {
+        allOrders(first: $first, orderBy: ["-orderDate"]) {
+            edges { node { id totalAmount customer { name } products { name price } } }
+        }
+    }
+"""
+
+
+def seed(customers=200, products=100, orders=5000):
+    from decimal import Decimal
+    from crm.models import Customer, Order, OrderLine, Product
+
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com") for i in range(customers)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal("9.99"), stock=100) for i in range(products)
+    )
+    orders = Order.objects.bulk_create(
+        Order(customer=customers[i % len(customers)], total_amount=Decimal("19.98")) for i in range(orders)
+    )
+    OrderLine.objects.bulk_create(
+        OrderLine(
+            order_id=order.pk, product_id=products[(i + j) % len(products)].pk,
+            unit_price=Decimal("9.99"), line_total=Decimal("9.99"),
+        )
+        for i, order in enumerate(orders)
+        for j in range(2)
+    )
+
+
+def install_query_delay(delay):
+    """Sleep ``delay`` seconds in every query, on every connection."""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def slow(execute, sql, params, many, context):
+        time.sleep(delay)
+        return execute(sql, params, many, context)
+
+    def add_wrapper(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow)
+
+    connection_created.connect(add_wrapper, weak=False)
+    for connection in connections.all():
+        connection.close()
+
+
+async def run_clients(send, concurrency, total):
+    """Run ``concurrency`` closed-loop clients until ``total`` requests are sent."""
+    latencies = []
+    failures = 0
+    remaining = total
+
+    async def client():
+        nonlocal remaining, failures
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            ok = await send()
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return total / elapsed, statistics.median(latencies), p99, failures
+
+
+def is_success(response):
+    return response.status_code == 200 and 'errors' not in response.json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per run (at least 2 per client).")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--sync-workers', type=int, default=8, help="Threads of the emulated WSGI server.")
+    parser.add_argument('--async-workers', type=int, default=8, help="CRM_GRAPHQL_ASYNC_WORKERS for the async view.")
+    parser.add_argument('--query-delay-ms', type=float, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    import httpx
+    from django.core.asgi import get_asgi_application
+    from django.core.wsgi import get_wsgi_application
+    from django.test.utils import override_settings
+
+    payload = {'query': QUERY, 'variables': {'first': args.page_size}}
+    results = []
+    # Measure execution, not the response cache or the debug toolbar.
+    overrides = override_settings(
+        DEBUG=False, ALLOWED_HOSTS=['*'], CRM_RESPONSE_CACHE=None,
+        CRM_GRAPHQL_ASYNC_WORKERS=args.async_workers,
+    )
+    with overrides, test_database():
+        seed()
+        if args.query_delay_ms:
+            install_query_delay(args.query_delay_ms / 1000)
+        wsgi_app = get_wsgi_application()
+        asgi_app = get_asgi_application()
+        local = threading.local()
+
+        def post_sync():
+            if not hasattr(local, 'client'):
+                local.client = httpx.Client(transport=httpx.WSGITransport(app=wsgi_app), base_url='http://testserver')
+            return is_success(local.client.post('/graphql', json=payload))
+
+        async def bench(concurrency):
+            total = max(args.requests, concurrency * 2)
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(args.sync_workers) as wsgi_workers:
+                async def send_sync():
+                    return await loop.run_in_executor(wsgi_workers, post_sync)
+
+                sync = await run_clients(send_sync, concurrency, total)
+            transport = httpx.ASGITransport(app=asgi_app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver', timeout=None) as client:
+                async def send_async():
+                    return is_success(await client.post('/graphql/async', json=payload))
+
+                async_ = await run_clients(send_async, concurrency, total)
+            return sync, async_
+
+        for concurrency in args.concurrency:
+            for label, (rate, p50, p99, failures) in zip(('sync', 'async'), asyncio.run(bench(concurrency))):
+                results.append((
+                    concurrency, label, f"{rate:,.0f}", f"{p50 * 1000:,.1f}", f"{p99 * 1000:,.1f}", failures,
+                ))
+    print_table(('clients', 'view', 'req/s', 'p50 ms', 'p99 ms', 'failed'), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
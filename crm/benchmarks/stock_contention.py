@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Hammer order creation and restocking from many threads on the same SKUs.
+
+Every thread loops over random checkouts (``createOrder``'s path: a
+conditional stock reservation retried on conflict) with a restock of
+every SKU mixed in now and then. At the end the stock of each SKU must
+equal its initial stock, minus the order lines written for it, plus what
+the restocks added; any difference is a lost update. ``--legacy`` runs
+the same load through read-modify-write ``save()`` calls for comparison.
+
+    python -m crm.benchmarks.stock_contention [--threads 1 8 32] [--operations 2000] [--skus 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from crm.benchmarks.utils import print_table, setup_django, test_database
+
+RESTOCK_INCREMENT = 10
+
+
+def legacy_create_order(customer_id, product_ids):
+    """Read the stock, check it in Python and save() it back."""
+    from django.db import transaction
+    from crm.models import Order, OrderLine, Product
+
+    with transaction.atomic():
+        products = list(Product.objects.filter(pk__in=product_ids))
+        if any(product.stock < 1 for product in products):
+            return False
+        for product in products:
+            product.stock -= 1
+            product.save()
+        order = Order.objects.create(customer_id=customer_id, total_amount=sum(p.price for p in products))
+        OrderLine.objects.bulk_create(
+            OrderLine(order=order, product=p, unit_price=p.price, line_total=p.price) for p in products
+        )
+    return True
+
+
+def legacy_restock(product_ids):
+    from django.db import transaction
+    from crm.models import Product
+
+    with transaction.atomic():
+        for product in Product.objects.filter(pk__in=product_ids):
+            product.stock += RESTOCK_INCREMENT
+            product.save()
+    return len(product_ids)
+
+
+def create_order(customer_id, product_ids):
+    from crm.bulk import create_orders
+    from crm.stock import retry_on_conflict
+
+    [(order, _)] = retry_on_conflict(create_orders, [{'customer_id': customer_id, 'product_ids': product_ids}])
+    return order is not None
+
+
+def restock(product_ids):
+    from crm.bulk import restock_low_stock_products
+
+    return len(restock_low_stock_products(threshold=sys.maxsize, increment=RESTOCK_INCREMENT))
+
+
+def run(threads, operations, customer_id, product_ids, per_order, restock_every, legacy):
+    from django.db import DatabaseError, connections
+
+    order_fn, restock_fn = (legacy_create_order, legacy_restock) if legacy else (create_order, restock)
+    remaining = iter(range(operations))
+    lock = threading.Lock()
+    totals = Counter()
+
+    def worker():
+        rng = random.Random()
+        counts = Counter()
+        try:
+            while True:
+                with lock:
+                    n = next(remaining, None)
+                if n is None:
+                    break
+                try:
+                    if n % restock_every == 0:
+                        counts['restocked'] += restock_fn(product_ids) * RESTOCK_INCREMENT
+                    elif order_fn(customer_id, rng.sample(product_ids, per_order)):
+                        counts['orders'] += 1
+                    else:
+                        counts['rejected'] += 1
+                except DatabaseError:
+                    counts['failed'] += 1
+        finally:
+            connections.close_all()
+        with lock:
+            totals.update(counts)
+
+    began = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return totals, time.perf_counter() - began
+
+
+def lost_updates(initial_stock, restocked_per_sku):
+    from django.db.models import Count
+    from crm.models import Product
+
+    lost = 0
+    for product in Product.objects.annotate(sold=Count('order_lines')):
+        lost += abs(initial_stock + restocked_per_sku - product.sold - product.stock)
+    return lost
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--operations', type=int, default=2000, help="Checkouts and restocks per run.")
+    parser.add_argument('--skus', type=int, default=5)
+    parser.add_argument('--products-per-order', type=int, default=2)
+    parser.add_argument('--initial-stock', type=int, default=100)
+    parser.add_argument('--restock-every', type=int, default=20, help="One restock per this many operations.")
+    parser.add_argument('--legacy', action='store_true', help="Also run the read-modify-write version.")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from decimal import Decimal
+    from django.db import connection
+    from crm.models import Customer, Order, Product
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            # Threads need a database file: an in-memory test database is per connection.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'stock_contention.sqlite3')
+        with test_database():
+            customer = Customer.objects.create(name="Customer", email="customer@example.com")
+            for legacy in (False, True) if args.legacy else (False,):
+                for threads in args.threads:
+                    Order.objects.all().delete()
+                    Product.objects.all().delete()
+                    product_ids = [
+                        product.pk for product in Product.objects.bulk_create(
+                            Product(name=f"SKU {i}", price=Decimal("9.99"), stock=args.initial_stock)
+                            for i in range(args.skus)
+                        )
+                    ]
+                    totals, elapsed = run(
+                        threads, args.operations, customer.pk, product_ids,
+                        args.products_per_order, args.restock_every, legacy,
+                    )
+                    restocked_per_sku = totals['restocked'] // len(product_ids)
+                    results.append((
+                        'legacy' if legacy else 'reserve', threads, f"{args.operations / elapsed:,.0f}",
+                        totals['orders'], totals['rejected'], totals['failed'],
+                        lost_updates(args.initial_stock, restocked_per_sku),
+                    ))
+    print_table(('mode', 'threads', 'ops/s', 'orders', 'rejected', 'failed', 'lost units'), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
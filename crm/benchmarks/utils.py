@@ -0,0 +1,56 @@
+"""
+Shared harness for the benchmark scripts.
+"""
+
+import contextlib
+import os
+import sys
+import time
+
+# Make the project importable when a benchmark is run as a script.
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+
+def setup_django():
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    """Create a migrated throwaway database and destroy it afterwards."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def clear_tables(*models):
+    for model in models:
+        model.objects.all().delete()
+
+
+def timed(fn, *args, **kwargs):
+    """Run fn and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    line = '  '.join(f'{{:>{width}}}' for width in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
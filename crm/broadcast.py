@@ -0,0 +1,121 @@
+"""
+Publish/subscribe of CRM events for the GraphQL subscriptions.
+
+Writers publish a list of primary keys on a channel (``ORDERS_CHANNEL``
+when orders are created, ``STOCK_CHANNEL`` when stock changes); the
+receivers in ``crm/signals.py`` do so once the transaction commits.
+Subscribers iterate ``subscribe(channel)`` on the event loop.
+
+The backend is chosen with the ``CRM_BROADCAST_BACKEND`` setting (a dotted
+path):
+
+* ``InMemoryBackend`` (the default) delivers to subscribers of the same
+  process, so writes made by other processes (cron jobs, Celery workers,
+  other ASGI workers) are not seen.
+* ``ChannelLayerBackend`` fans out through a Django Channels channel layer
+  (e.g. Redis), across processes. It needs ``channels`` to be installed
+  and ``CHANNEL_LAYERS`` configured.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+ORDERS_CHANNEL = 'crm.orders'
+STOCK_CHANNEL = 'crm.stock'
+
+QUEUE_SIZE = 100
+
+
+def _deliver(queue, message):
+    # A subscriber that falls behind loses its oldest events, not the newest.
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class InMemoryBackend:
+    """Delivers messages to the subscribers of this process."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        """Deliver ``message`` to every subscriber; callable from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers[channel])
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, message)
+            except RuntimeError:
+                # The subscriber's loop was closed under it.
+                pass
+
+    def subscribers(self, channel):
+        with self._lock:
+            return len(self._subscribers[channel])
+
+    async def subscribe(self, channel):
+        """Yield the messages published on ``channel`` from now on."""
+        subscriber = (
+            asyncio.get_running_loop(),
+            asyncio.Queue(maxsize=getattr(settings, 'CRM_BROADCAST_QUEUE_SIZE', QUEUE_SIZE)),
+        )
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+
+
+class ChannelLayerBackend:
+    """Delivers messages through a Django Channels channel layer group."""
+
+    def __init__(self, alias='default'):
+        from channels.layers import get_channel_layer
+
+        self.layer = get_channel_layer(alias)
+
+    def publish(self, channel, message):
+        from asgiref.sync import async_to_sync
+
+        async_to_sync(self.layer.group_send)(channel, {'type': 'crm.event', 'message': message})
+
+    async def subscribe(self, channel):
+        name = await self.layer.new_channel()
+        await self.layer.group_add(channel, name)
+        try:
+            while True:
+                event = await self.layer.receive(name)
+                yield event['message']
+        finally:
+            await self.layer.group_discard(channel, name)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_broadcast():
+    """The process-wide backend configured by ``CRM_BROADCAST_BACKEND``."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'CRM_BROADCAST_BACKEND', None) or 'crm.broadcast.InMemoryBackend'
+                _backend = import_string(path)()
+    return _backend
+
+
+def reset_broadcast():
+    """Drop the process-wide backend, e.g. after changing its setting."""
+    global _backend
+    with _backend_lock:
+        _backend = None
@@ -0,0 +1,362 @@
+"""
+Set-based write paths for bulk mutations.
+
+Rows are validated in memory and written in chunks: one ``email__in``
+lookup and one ``bulk_create`` per chunk instead of a query and an insert
+per row. Errors are reported per row, in input order, with the same
+messages as the single-row mutations.
+"""
+
+import sqlite3
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Customer, CustomerDailySales, Order, OrderLine, Product, ProductDailySales
+from .response_cache import bump_versions
+from .rollups import record_orders
+from .search import get_search_backend
+from .signals import orders_created, stock_changed
+from .stock import reserve_stock, retry_on_conflict
+from .validators import phone_validator
+
+BULK_CHUNK_SIZE = 500
+LOW_STOCK_THRESHOLD = 10
+RESTOCK_INCREMENT = 10
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def create_customers(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Create customers from an iterable of mappings with name/email/phone.
+
+    Duplicate emails are rejected whether they already exist in the
+    database or appear earlier in the same input. Returns a list aligned
+    with ``rows`` holding ``(customer, None)`` for created customers and
+    ``(None, error)`` for rejected ones. Callers are responsible for the
+    surrounding transaction.
+    """
+    results = []
+    seen_emails = set()
+    for chunk in chunked(rows, chunk_size):
+        emails = {row.get('email') for row in chunk if row.get('email')}
+        existing = set(
+            Customer.objects.filter(email__in=emails).values_list('email', flat=True)
+        )
+        pending = []
+        for row in chunk:
+            name, email, phone = row.get('name'), row.get('email'), row.get('phone') or None
+            error = None
+            if not name or not email:
+                error = "Name and email required"
+            elif email in existing or email in seen_emails:
+                error = "Email already exists"
+            elif phone:
+                try:
+                    phone_validator(phone)
+                except ValidationError:
+                    error = "Invalid phone format"
+            if error:
+                results.append((None, error))
+            else:
+                seen_emails.add(email)
+                customer = Customer(name=name, email=email, phone=phone)
+                pending.append(customer)
+                results.append((customer, None))
+        created = Customer.objects.bulk_create(pending, batch_size=chunk_size)
+        # bulk_create sends no post_save, so index the new rows explicitly.
+        using = router.db_for_write(Customer)
+        get_search_backend(using).index(Customer, created, created=True)
+        if created:
+            bump_versions(Customer, using=using)
+    return results
+
+
+def bulk_create_customers(rows, chunk_size=BULK_CHUNK_SIZE, start=1):
+    """
+    Create customers like ``create_customers`` and return
+    ``(customers, errors)``, with row numbers in errors starting at ``start``.
+    """
+    customers = []
+    errors = []
+    for row_number, (customer, error) in enumerate(create_customers(rows, chunk_size), start):
+        if error:
+            errors.append(f"Row {row_number}: {error}")
+        else:
+            customers.append(customer)
+    return customers, errors
+
+
+def product_error(price, stock):
+    """Return the validation error for a product's price and stock, if any."""
+    if price <= 0:
+        return "Price must be positive"
+    if stock is not None and stock < 0:
+        return "Stock cannot be negative"
+    return None
+
+
+def create_products(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Create products from an iterable of mappings with name/price/stock.
+
+    Applies the same rules as the createProduct mutation. Returns a list
+    aligned with ``rows`` like ``create_customers``.
+    """
+    results = []
+    for chunk in chunked(rows, chunk_size):
+        pending = []
+        for row in chunk:
+            name, error = row.get('name'), None
+            try:
+                price = Decimal(str(row.get('price')))
+                if not price.is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
+                price, error = None, "Invalid price"
+            try:
+                stock = int(row['stock']) if row.get('stock') not in (None, '') else 0
+            except (TypeError, ValueError):
+                stock, error = None, error or "Invalid stock"
+            if not name:
+                error = "Name required"
+            error = error or product_error(price, stock)
+            if error:
+                results.append((None, error))
+            else:
+                product = Product(name=name, price=price, stock=stock)
+                pending.append(product)
+                results.append((product, None))
+        created = Product.objects.bulk_create(pending, batch_size=chunk_size)
+        using = router.db_for_write(Product)
+        get_search_backend(using).index(Product, created, created=True)
+        if created:
+            bump_versions(Product, using=using)
+            stock_changed.send(Product, pks=[product.pk for product in created], using=using)
+    return results
+
+
+def _to_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_datetime(value):
+    """Parse an ISO 8601 string (or pass a datetime through); None if invalid."""
+    if isinstance(value, str):
+        try:
+            value = parse_datetime(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime) and settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value if isinstance(value, datetime) else None
+
+
+def create_orders(rows, chunk_size=BULK_CHUNK_SIZE, adjust_stock=True):
+    """
+    Create orders from mappings with customer_id, product_ids and order_date.
+
+    Customers and products for all rows are fetched in one query each,
+    totals are computed from those prices, the stock of every product is
+    reserved once for all the orders it appears in (``reserve_stock``) and
+    the orders and their lines are written with ``bulk_create``. The daily
+    sales rollups are updated in the same transaction. With
+    ``adjust_stock=False`` (historical imports) stock is neither checked
+    nor decremented.
+
+    Returns a list aligned with ``rows`` holding ``(order, None)`` for created
+    orders and ``(None, error)`` for rejected ones. Raises ``StockConflict``
+    when a concurrent write took stock that was read as available; callers
+    are responsible for the surrounding transaction and should retry with
+    ``retry_on_conflict``.
+    """
+    parsed = []
+    for row in rows:
+        product_ids = row.get('product_ids') or []
+        parsed.append((
+            _to_pk(row.get('customer_id')),
+            [_to_pk(product_id) for product_id in product_ids],
+            row.get('order_date') or None,
+        ))
+
+    customer_ids = {customer_id for customer_id, _, _ in parsed if customer_id is not None}
+    customer_ids = set(
+        Customer.objects.filter(pk__in=customer_ids).values_list('pk', flat=True)
+    )
+    all_product_ids = {pk for _, product_ids, _ in parsed for pk in product_ids if pk is not None}
+    products = {
+        product.pk: product
+        for product in Product.objects.filter(pk__in=all_product_ids).only('price', 'stock')
+    }
+
+    remaining = {pk: product.stock for pk, product in products.items()}
+    results = []
+    orders = []
+    order_products = []
+    for customer_id, product_ids, order_date in parsed:
+        error = None
+        if customer_id not in customer_ids:
+            error = "Invalid customer ID"
+        elif not product_ids:
+            error = "At least one product must be selected"
+        elif len(set(product_ids)) != len(product_ids) or any(pk not in products for pk in product_ids):
+            error = "One or more product IDs are invalid"
+        elif adjust_stock and any(remaining[pk] < 1 for pk in product_ids):
+            error = "Insufficient stock for one or more products"
+        elif order_date is not None and _to_datetime(order_date) is None:
+            error = "Invalid order date"
+        if error:
+            results.append((None, error))
+            continue
+        for pk in product_ids:
+            remaining[pk] -= 1
+        order = Order(
+            customer_id=customer_id,
+            order_date=_to_datetime(order_date) if order_date is not None else timezone.now(),
+            total_amount=sum((products[pk].price for pk in product_ids), Decimal('0')),
+        )
+        orders.append(order)
+        order_products.append(product_ids)
+        results.append((order, None))
+
+    if adjust_stock:
+        sold = Counter(pk for product_ids in order_products for pk in product_ids)
+        reserve_stock(sold, using=router.db_for_write(Product), chunk_size=chunk_size)
+
+    Order.objects.bulk_create(orders, batch_size=chunk_size)
+    OrderLine.objects.bulk_create(
+        [
+            OrderLine(
+                order_id=order.pk, product_id=pk, quantity=1,
+                unit_price=products[pk].price, line_total=products[pk].price,
+            )
+            for order, product_ids in zip(orders, order_products)
+            for pk in product_ids
+        ],
+        batch_size=chunk_size,
+    )
+    if orders:
+        using = router.db_for_write(Order)
+        record_orders(
+            orders, order_products, {pk: product.price for pk, product in products.items()},
+            using=using, chunk_size=chunk_size,
+        )
+        bump_versions(Order, Product, CustomerDailySales, ProductDailySales, using=using)
+        orders_created.send(Order, pks=[order.pk for order in orders], using=using)
+    return results
+
+
+def supports_update_returning(connection):
+    """UPDATE ... RETURNING is available on PostgreSQL and SQLite >= 3.35."""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)
+
+
+def restock_low_stock_products(threshold=LOW_STOCK_THRESHOLD, increment=RESTOCK_INCREMENT,
+                               chunk_size=None):
+    """
+    Add ``increment`` to the stock of every product below ``threshold``.
+
+    The increment is applied in the database (``stock = stock + n``), so
+    concurrent writers never lose updates. With ``chunk_size`` the products
+    are restocked in primary-key order, one transaction per chunk, so the
+    write lock is released between chunks. Returns the updated products
+    ordered by primary key.
+    """
+    alias = router.db_for_write(Product)
+    connection = connections[alias]
+    restock = _restock_returning if supports_update_returning(connection) else _restock_fetch
+    updated = []
+    last_pk = None
+    while True:
+        chunk = retry_on_conflict(_restock_chunk, restock, connection, threshold, increment, chunk_size, last_pk,
+                                  using=alias)
+        updated.extend(chunk)
+        if not chunk_size or len(chunk) < chunk_size:
+            return updated
+        last_pk = chunk[-1].pk
+
+
+def _restock_chunk(restock, connection, threshold, increment, chunk_size, last_pk):
+    chunk = restock(connection, threshold, increment, chunk_size, last_pk)
+    if chunk:
+        bump_versions(Product, using=connection.alias)
+        stock_changed.send(Product, pks=[product.pk for product in chunk], using=connection.alias)
+    return chunk
+
+
+def _restock_returning(connection, threshold, increment, chunk_size, last_pk):
+    fields = Product._meta.concrete_fields
+    table = connection.ops.quote_name(Product._meta.db_table)
+    pk = connection.ops.quote_name(Product._meta.pk.column)
+    stock = connection.ops.quote_name(Product._meta.get_field('stock').column)
+    version = connection.ops.quote_name(Product._meta.get_field('version').column)
+    where = [f"{stock} < %s"]
+    params = [threshold]
+    if last_pk is not None:
+        where.append(f"{pk} > %s")
+        params.append(last_pk)
+    selection = f"SELECT {pk} FROM {table} WHERE {' AND '.join(where)}"
+    if chunk_size:
+        selection += f" ORDER BY {pk} LIMIT %s"
+        params.append(chunk_size)
+    sql = (
+        f"UPDATE {table} SET {stock} = {stock} + %s, {version} = {version} + 1 "
+        f"WHERE {pk} IN ({selection}) "
+        f"RETURNING {', '.join(connection.ops.quote_name(field.column) for field in fields)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [increment, *params])
+        rows = cursor.fetchall()
+    # Apply the same value converters the ORM would (e.g. Decimal for price).
+    cols = [field.get_col(Product._meta.db_table) for field in fields]
+    converters = [connection.ops.get_db_converters(col) + col.get_db_converters(connection) for col in cols]
+    products = []
+    for row in rows:
+        values = list(row)
+        for index, col in enumerate(cols):
+            for converter in converters[index]:
+                values[index] = converter(values[index], col, connection)
+        products.append(Product.from_db(connection.alias, [field.attname for field in fields], values))
+    return sorted(products, key=lambda product: product.pk)
+
+
+def _restock_fetch(connection, threshold, increment, chunk_size, last_pk):
+    candidates = (
+        Product.objects.using(connection.alias)
+        .select_for_update()
+        .filter(stock__lt=threshold)
+        .order_by('pk')
+    )
+    if last_pk is not None:
+        candidates = candidates.filter(pk__gt=last_pk)
+    if chunk_size:
+        candidates = candidates[:chunk_size]
+    pks = list(candidates.values_list('pk', flat=True))
+    if not pks:
+        return []
+    Product.objects.using(connection.alias).filter(pk__in=pks).update(
+        stock=F('stock') + increment, version=F('version') + 1,
+    )
+    return list(Product.objects.using(connection.alias).filter(pk__in=pks).order_by('pk'))
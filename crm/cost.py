@@ -0,0 +1,198 @@
+"""
+Static cost analysis of GraphQL operations.
+
+Before an operation runs, its selection is walked together with the
+variables to estimate how many objects it may load: a connection field
+costs the page it asks for (``first``/``last``, or the largest page when
+neither is given), a plain list field costs ``CRM_QUERY_LIST_SIZE``
+objects and any other object field costs one, each multiplied by the
+size of the lists it is nested in. ``edges``/``node``/``pageInfo`` are
+structure, not extra rows, and introspection is free.
+
+Operations deeper than ``CRM_QUERY_MAX_DEPTH``, costlier than
+``CRM_QUERY_MAX_COST`` or asking a connection for more than
+``RELAY_CONNECTION_MAX_LIMIT`` rows are rejected without being executed.
+``CRM_QUERY_COST_RATE = (cost, seconds)`` additionally gives every client
+a budget of cost per time window.
+"""
+
+import time
+
+import graphene
+from django.conf import settings
+from django.core.cache import cache
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode, FragmentSpreadNode, GraphQLError, GraphQLInt, InlineFragmentNode, get_named_type, is_list_type,
+    value_from_ast,
+)
+from graphql.type import get_nullable_type
+
+COST_RATE_KEY_PREFIX = 'crm:query-cost:'
+
+
+class QueryCost:
+    """The estimated cost and depth of one operation."""
+
+    def __init__(self, cost=0, depth=0):
+        self.cost = cost
+        self.depth = depth
+        self.errors = []
+        self.throttle = None
+
+    def as_extension(self):
+        extension = {
+            'requestedQueryCost': self.cost,
+            'maximumQueryCost': max_cost(),
+            'depth': self.depth,
+            'maximumDepth': max_depth(),
+        }
+        if self.throttle is not None:
+            extension['throttleStatus'] = self.throttle
+        return extension
+
+
+def max_cost():
+    return getattr(settings, 'CRM_QUERY_MAX_COST', None)
+
+
+def max_depth():
+    return getattr(settings, 'CRM_QUERY_MAX_DEPTH', None)
+
+
+def cost_error(message, code):
+    return GraphQLError(message, extensions={'code': code})
+
+
+def _is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, graphene.relay.Connection)
+
+
+def _page_size(field_node, variables, result):
+    """The number of rows a connection field asks for."""
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    sizes = []
+    for argument in field_node.arguments:
+        if argument.name.value not in ('first', 'last'):
+            continue
+        size = value_from_ast(argument.value, GraphQLInt, variables)
+        if isinstance(size, int):
+            sizes.append(size)
+    for size in sizes:
+        if max_limit is not None and size > max_limit:
+            result.errors.append(cost_error(
+                f"Requesting {size} records on the `{field_node.name.value}` connection exceeds "
+                f"the maximum page size of {max_limit} records.",
+                'PAGE_SIZE_EXCEEDED',
+            ))
+    if sizes:
+        return max(0, min(sizes))
+    # Without first/last the connection returns its largest page.
+    return max_limit if max_limit is not None else getattr(settings, 'CRM_QUERY_LIST_SIZE', 10)
+
+
+def _walk(parent_type, selection_set, fragments, variables, multiplier, depth, result, structural=False):
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragmentNode):
+            _walk(parent_type, selection.selection_set, fragments, variables, multiplier, depth, result, structural)
+            continue
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                _walk(parent_type, fragment.selection_set, fragments, variables, multiplier, depth, result,
+                      structural)
+            continue
+        if not isinstance(selection, FieldNode):
+            continue
+        name = selection.name.value
+        fields = getattr(parent_type, 'fields', None) or {}
+        if name.startswith('__') or name not in fields:
+            continue
+        result.depth = max(result.depth, depth)
+        field_type = fields[name].type
+        named_type = get_named_type(field_type)
+        if selection.selection_set is None:
+            continue
+        child_structural = False
+        if _is_connection(named_type):
+            count = multiplier * _page_size(selection, variables, result)
+            result.cost += count
+            child_multiplier = count
+        elif _is_connection(parent_type):
+            # edges / pageInfo: the page was already counted.
+            child_multiplier = multiplier
+            child_structural = name == 'edges'
+        elif structural:
+            # edges { node }
+            child_multiplier = multiplier
+        elif is_list_type(get_nullable_type(field_type)):
+            child_multiplier = multiplier * getattr(settings, 'CRM_QUERY_LIST_SIZE', 10)
+            result.cost += child_multiplier
+        else:
+            child_multiplier = multiplier
+            result.cost += multiplier
+        _walk(named_type, selection.selection_set, fragments, variables, child_multiplier, depth + 1, result,
+              child_structural)
+
+
+def analyze_operation(schema, document, operation_ast, variables=None):
+    """
+    Return the QueryCost of ``operation_ast``; its ``errors`` list the
+    limits the operation exceeds.
+    """
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if definition.kind == 'fragment_definition'
+    }
+    root_type = schema.get_root_type(operation_ast.operation)
+    result = QueryCost()
+    if root_type is not None:
+        _walk(root_type, operation_ast.selection_set, fragments, variables or {}, 1, 1, result)
+    if max_depth() is not None and result.depth > max_depth():
+        result.errors.append(cost_error(
+            f"Query depth {result.depth} exceeds the maximum depth of {max_depth()}.", 'QUERY_TOO_DEEP'
+        ))
+    if max_cost() is not None and result.cost > max_cost():
+        result.errors.append(cost_error(
+            f"Query cost {result.cost} exceeds the maximum cost of {max_cost()}.", 'QUERY_TOO_COMPLEX'
+        ))
+    return result
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def charge(result, request):
+    """
+    Charge the operation's cost to the client's budget for the current
+    window (``CRM_QUERY_COST_RATE``) and reject it once the budget is spent.
+    """
+    rate = getattr(settings, 'CRM_QUERY_COST_RATE', None)
+    if not rate:
+        return
+    budget, seconds = rate
+    window = int(time.time() // seconds)
+    key = f'{COST_RATE_KEY_PREFIX}{client_key(request)}:{window}'
+    cache.add(key, 0, timeout=seconds)
+    try:
+        spent = cache.incr(key, result.cost)
+    except ValueError:
+        # Expired between add and incr: start a new window.
+        cache.set(key, result.cost, timeout=seconds)
+        spent = result.cost
+    result.throttle = {
+        'maximumAvailable': budget,
+        'currentlyAvailable': max(0, budget - spent),
+        'resetsIn': seconds - int(time.time() % seconds),
+    }
+    if spent > budget:
+        result.errors.append(cost_error(
+            f"Query cost budget of {budget} per {seconds}s exhausted; retry in {result.throttle['resetsIn']}s.",
+            'QUERY_COST_THROTTLED',
+        ))
@@ -3,12 +3,9 @@ Django-crontab heartbeat logger for CRM application health monitoring.
 """
 
 
-import datetime
 import os
-import sys
-from django.conf import settings
-from gql.transport.requests import RequestsHTTPTransport
-from gql import gql, Client as GqlClient
+
+from crm.joblog import job_logger
 
 
 def log_crm_heartbeat():
@@ -17,22 +14,14 @@ def log_crm_heartbeat():
     Optionally queries the GraphQL hello field to verify endpoint responsiveness.
     """
     
-    # Format current time as DD/MM/YYYY-HH:MM:SS
-    now = datetime.datetime.now()
-    timestamp = now.strftime('%d/%m/%Y-%H:%M:%S')
-    
-    # Base heartbeat message
-    heartbeat_message = f"{timestamp} CRM is alive"
+    # Base heartbeat message (the job log prefixes DD/MM/YYYY-HH:MM:SS)
+    heartbeat_message = "CRM is alive"
     
     # Optional: Test GraphQL endpoint responsiveness
     graphql_status = ""
     try:
         # Import here to avoid circular imports
-        from graphene.test import Client
-        from alx_backend_graphql_crm.schema import schema
-        
-        # Create GraphQL test client
-        client = Client(schema)
+        from crm.graphql_client import get_client
         
         # Execute hello query
         query = '''
@@ -41,9 +30,9 @@ def log_crm_heartbeat():
         }
         '''
         
-        result = client.execute(query)
+        result = get_client().execute(query)
         
-        if result.get('data') and result['data'].get('hello') == 'Hello, GraphQL!':
+        if result and result.get('hello') == 'Hello, GraphQL!':
             graphql_status = " - GraphQL endpoint responsive"
         else:
             graphql_status = " - GraphQL endpoint error"
@@ -54,22 +43,8 @@ def log_crm_heartbeat():
     # Complete message with GraphQL status
     full_message = heartbeat_message + graphql_status
     
-    # Log to file (append mode)
-    log_file_path = '/tmp/crm_heartbeat_log.txt'
-    
-    try:
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(full_message + '\n')
-    except Exception as e:
-        # Fallback: log to a local file if /tmp is not accessible (Windows)
-        fallback_path = os.path.join(settings.BASE_DIR, 'crm_heartbeat_log.txt')
-        try:
-            with open(fallback_path, 'a') as log_file:
-                log_file.write(full_message + '\n')
-        except Exception as fallback_error:
-            # Last resort: print to stdout
-            print(f"Heartbeat logging failed: {e}, {fallback_error}")
-            print(full_message)
+    # Buffered, rotating job log
+    job_logger('heartbeat').info(full_message)
 
 
 def update_low_stock():
@@ -79,16 +54,12 @@ def update_low_stock():
     Runs every 12 hours via django-crontab.
     """
     
-    # Format current time for logging
-    now = datetime.datetime.now()
-    timestamp = now.strftime('%d/%m/%Y-%H:%M:%S')
+    log = job_logger('low_stock')
     
     try:
-        # Use gql HTTP client to call the mutation
-        url = "http://localhost:8000/graphql"
-        transport = RequestsHTTPTransport(url=url, verify=True, retries=3)
-        client = GqlClient(transport=transport, fetch_schema_from_transport=False)
-        mutation = gql('''
+        # Shared client: in-process, or pooled HTTP when CRM_GRAPHQL_URL is set
+        from crm.graphql_client import get_client
+        mutation = '''
             mutation {
                 updateLowStockProducts {
                     updatedProducts {
@@ -100,58 +71,32 @@ def update_low_stock():
                     count
                 }
             }
-        ''')
-        result = client.execute(mutation)
-        log_file_path = '/tmp/low_stock_updates_log.txt'
-        log_messages = [f"[{timestamp}] Low stock update job started"]
+        '''
+        result = get_client().execute(mutation)
+        log.info("Low stock update job started")
         if result.get('updateLowStockProducts'):
             mutation_result = result['updateLowStockProducts']
             updated_products = mutation_result.get('updatedProducts', [])
             message = mutation_result.get('message', 'No message')
             count = mutation_result.get('count', 0)
-            log_messages.append(f"[{timestamp}] {message}")
+            log.info(message, extra={'fields': {'count': count}})
             if updated_products:
-                log_messages.append(f"[{timestamp}] Updated products:")
+                log.info("Updated products:")
                 for product in updated_products:
                     product_name = product.get('name', 'Unknown')
                     new_stock = product.get('stock', 0)
                     product_id = product.get('id', 'Unknown')
-                    log_messages.append(f"[{timestamp}] - Product ID {product_id}: {product_name} (New stock: {new_stock})")
+                    log.info(
+                        f"- Product ID {product_id}: {product_name} (New stock: {new_stock})",
+                        extra={'fields': {'product_id': product_id, 'stock': new_stock}},
+                    )
             else:
-                log_messages.append(f"[{timestamp}] No products required restocking")
+                log.info("No products required restocking")
         else:
             error_msg = result.get('errors', 'Unknown GraphQL error')
-            log_messages.append(f"[{timestamp}] GraphQL mutation failed: {error_msg}")
-        try:
-            with open(log_file_path, 'a') as log_file:
-                for msg in log_messages:
-                    log_file.write(msg + '\n')
-                log_file.write('\n')
-        except Exception as e:
-            fallback_path = os.path.join(settings.BASE_DIR, 'low_stock_updates_log.txt')
-            try:
-                with open(fallback_path, 'a') as log_file:
-                    for msg in log_messages:
-                        log_file.write(msg + '\n')
-                    log_file.write('\n')
-            except Exception as fallback_error:
-                print(f"Low stock logging failed: {e}, {fallback_error}")
-                for msg in log_messages:
-                    print(msg)
+            log.error(f"GraphQL mutation failed: {error_msg}")
     except Exception as e:
-        error_timestamp = datetime.datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
-        error_message = f"[{error_timestamp}] Low stock update job failed: {str(e)}"
-        try:
-            log_file_path = '/tmp/low_stock_updates_log.txt'
-            with open(log_file_path, 'a') as log_file:
-                log_file.write(error_message + '\n\n')
-        except:
-            try:
-                fallback_path = os.path.join(settings.BASE_DIR, 'low_stock_updates_log.txt')
-                with open(fallback_path, 'a') as log_file:
-                    log_file.write(error_message + '\n\n')
-            except:
-                print(error_message)
+        log.error(f"Low stock update job failed: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 """
 GraphQL-based Order Reminder Script
-Queries for pending orders from the last 7 days and logs reminders.
+Sends one reminder per customer for the orders placed since the last run
+(the last 7 days on the first run) and logs them. See crm/reminders.py.
 """
 
 import os
 import sys
-import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import argparse
 
 # Add Django project to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -17,93 +16,46 @@ sys.path.append(project_root)
 # Configure Django settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
-def get_recent_orders():
-    """Query GraphQL endpoint for orders from the last 7 days"""
-    
-    # GraphQL endpoint URL
-    url = "http://localhost:8000/graphql"
-    
-    # Create transport and client
-    transport = RequestsHTTPTransport(url=url)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-    
-    # Calculate date 7 days ago
-    seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).isoformat()
-    
-    # GraphQL query for recent orders
-    query = gql("""
-        query GetRecentOrders($orderDateGte: DateTime!) {
-            allOrders(filter: { orderDateGte: $orderDateGte }) {
-                edges {
-                    node {
-                        id
-                        orderDate
-                        customer {
-                            email
-                            name
-                        }
-                        totalAmount
-                    }
-                }
-            }
-        }
-    """)
-    
-    # Execute query
-    variables = {"orderDateGte": seven_days_ago}
-    result = client.execute(query, variable_values=variables)
-    
-    return result['allOrders']['edges']
+STATE_FILE = '/tmp/order_reminders_state.json'
 
-def log_order_reminders(orders):
-    """Log order reminders to file with timestamp"""
-    
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_file = '/tmp/order_reminders_log.txt'
-    
-    with open(log_file, 'a') as f:
-        f.write(f"[{timestamp}] Order reminders processed:\n")
-        
-        if not orders:
-            f.write(f"[{timestamp}] No pending orders found in the last 7 days.\n")
-        else:
-            for order_edge in orders:
-                order = order_edge['node']
-                order_id = order['id']
-                customer_email = order['customer']['email']
-                customer_name = order['customer']['name']
-                order_date = order['orderDate']
-                total_amount = order['totalAmount']
-                
-                f.write(f"[{timestamp}] Order ID: {order_id}, Customer: {customer_name} ({customer_email}), Date: {order_date}, Amount: ${total_amount}\n")
-        
-        f.write(f"[{timestamp}] Total orders processed: {len(orders)}\n\n")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send order reminders")
+    parser.add_argument('--state', default=STATE_FILE, help="High-water mark file")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent sends")
+    parser.add_argument('--processes', action='store_true', help="Send from a process pool instead of threads")
+    parser.add_argument('--email', action='store_true', help="Email customers instead of only logging")
+    parser.add_argument('--page-size', type=int, default=500, help="Orders fetched per GraphQL request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main function to process order reminders"""
+    args = parse_args(argv)
     try:
-        # Get recent orders from GraphQL
-        orders = get_recent_orders()
-        
-        # Log the reminders
-        log_order_reminders(orders)
-        
+        import django
+        django.setup()
+        from crm.reminders import EmailSender, LogSender, run_reminders
+
+        sender = EmailSender() if args.email else LogSender()
+        orders, sent, failed = run_reminders(
+            args.state, sender=sender, workers=args.workers,
+            processes=args.processes, page_size=args.page_size,
+        )
+
         # Print success message
-        print("Order reminders processed!")
-        
+        print(f"Order reminders processed! ({orders} orders, {sent} reminders, {failed} failed)")
+
         return 0
-        
+
     except Exception as e:
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        error_message = f"[{timestamp}] ERROR: Failed to process order reminders: {str(e)}\n"
-        
         # Log error
-        with open('/tmp/order_reminders_log.txt', 'a') as f:
-            f.write(error_message)
-        
+        from crm.joblog import job_logger
+        job_logger('order_reminders').error(f"ERROR: Failed to process order reminders: {str(e)}")
+
         # Print error
         print(f"Error processing order reminders: {str(e)}")
-        
+
         return 1
 
 if __name__ == "__main__":
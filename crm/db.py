@@ -0,0 +1,60 @@
+"""
+Read/write splitting between the writer and a read replica.
+
+``ReplicaRouter`` sends writes to the default database, and reads too
+unless they run inside ``read_from_replica()``: the GraphQL views, the
+WebSocket handler and the in-process ``LocalClient`` enter it around query
+operations only, which tolerate the replica lag. Everything else (the
+admin, sessions and auth, cron jobs and Celery tasks, mutations that must
+read what they just wrote) reads the writer. A transaction on the writer,
+which may hold uncommitted rows, keeps its reads there even inside
+``read_from_replica()``.
+
+A replica that is a test mirror of the writer is ignored: it is a second
+connection to the test database, which would not see the test's
+uncommitted data.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads = ContextVar('crm_db_replica_reads', default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """Route the reads of the enclosed block to the read replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_alias():
+    alias = getattr(settings, 'CRM_READ_REPLICA', None)
+    if alias is None or alias == DEFAULT_DB_ALIAS or alias not in settings.DATABASES:
+        return None
+    if connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return None
+    return alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the writer.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != getattr(settings, 'CRM_READ_REPLICA', None)
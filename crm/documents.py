@@ -0,0 +1,148 @@
+"""
+Parsed-document cache and automatic persisted queries for /graphql.
+
+Every operation is keyed by the SHA-256 of its text. Documents that parse
+and validate are kept in a bounded in-process LRU, so a repeated operation
+skips ``parse`` and ``validate`` entirely.
+
+Persisted queries follow the Apollo protocol: the client sends
+``extensions.persistedQuery.sha256Hash`` without the query text, and on a
+``PersistedQueryNotFound`` error retries once with the text, which
+registers it in the Django cache (``CRM_PERSISTED_QUERY_CACHE``) so that
+every worker process can resolve the hash from then on. Only texts that
+parse and validate are registered, for ``CRM_PERSISTED_QUERY_TIMEOUT``
+seconds.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, parse, validate
+
+PERSISTED_QUERY_VERSION = 1
+PERSISTED_QUERY_KEY_PREFIX = 'crm:persisted-query:'
+PERSISTED_QUERY_TIMEOUT = 24 * 60 * 60
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping; ``None`` values are not supported."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+# Validated DocumentNodes keyed by query hash.
+document_cache = LRUCache(getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', 500))
+
+
+def persisted_query_store():
+    return caches[getattr(settings, 'CRM_PERSISTED_QUERY_CACHE', 'default')]
+
+
+def persisted_query_error(message, code):
+    return GraphQLError(message, extensions={'code': code})
+
+
+def resolve_persisted_query(query, extensions):
+    """
+    Return ``(query, sha256)`` for a request, applying the persisted-query
+    extension when present. Raises GraphQLError for unknown or mismatched
+    hashes. A text sent with its hash is not registered here: the caller
+    does so with ``register_persisted_query`` once it validated.
+    """
+    persisted = (extensions or {}).get('persistedQuery')
+    if not persisted:
+        return query, (query_hash(query) if query else None)
+    if persisted.get('version') != PERSISTED_QUERY_VERSION:
+        raise persisted_query_error('Unsupported persisted query version', 'PERSISTED_QUERY_NOT_SUPPORTED')
+    sha256 = persisted.get('sha256Hash')
+    if not isinstance(sha256, str):
+        raise persisted_query_error('Persisted query hash is required', 'BAD_REQUEST')
+    sha256 = sha256.lower()
+    if query:
+        if query_hash(query) != sha256:
+            raise persisted_query_error('provided sha does not match query', 'BAD_REQUEST')
+        return query, sha256
+    if sha256 in document_cache:
+        # Already parsed in this process; the text is not needed.
+        return None, sha256
+    query = persisted_query_store().get(PERSISTED_QUERY_KEY_PREFIX + sha256)
+    if query is None:
+        raise persisted_query_error('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+    return query, sha256
+
+
+def register_persisted_query(sha256, query):
+    """Make a validated query text resolvable by its hash in every process."""
+    timeout = getattr(settings, 'CRM_PERSISTED_QUERY_TIMEOUT', PERSISTED_QUERY_TIMEOUT)
+    persisted_query_store().set(PERSISTED_QUERY_KEY_PREFIX + sha256, query, timeout=timeout)
+
+
+def get_document(schema, query, sha256, validation_rules=None, max_errors=None, tracer=None):
+    """
+    Return ``(document, errors)`` for the query, from the cache when possible.
+
+    ``schema`` is a ``GraphQLSchema``. Only documents that validate cleanly
+    are cached; a cached entry is trusted without re-reading ``query``.
+    ``tracer`` (a ``crm.tracing.Tracer``) times parsing and validation.
+    """
+    document = document_cache.get(sha256)
+    if document is not None:
+        return document, []
+    if query is None:
+        # Evicted between resolve_persisted_query and here.
+        query = persisted_query_store().get(PERSISTED_QUERY_KEY_PREFIX + sha256)
+        if query is None:
+            return None, [persisted_query_error('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')]
+    try:
+        with tracer.phase('parsing') if tracer else nullcontext():
+            document = parse(query)
+    except GraphQLError as error:
+        return None, [error]
+    with tracer.phase('validation') if tracer else nullcontext():
+        errors = validate(schema, document, validation_rules, max_errors)
+    if errors:
+        return None, errors
+    document_cache.set(sha256, document)
+    return document, []
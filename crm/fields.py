@@ -0,0 +1,76 @@
+"""
+Connection fields used by the CRM schema.
+"""
+
+import graphene
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+
+from .optimizer import optimize_connection_queryset
+from .pagination import keyset_ordering, keyset_page, order_queryset, parse_ordering
+
+
+class CRMFilterConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that orders by ``orderBy``, supports opt-in
+    keyset pagination (``keyset: true``), shapes its queryset to the
+    selection set and lets the node type prepare its DataLoaders once the
+    page of nodes is known.
+
+    Node types opt in to loader priming by defining
+    ``prime_loaders(nodes, info)``.
+    """
+
+    def __init__(self, type_, *args, order_by=None, **kwargs):
+        kwargs.setdefault('keyset', graphene.Boolean())
+        super().__init__(type_, *args, **kwargs)
+        # DjangoFilterConnectionField accepts order_by but never exposes it.
+        if order_by is not None:
+            self._base_args = {**(self._base_args or {}), 'order_by': order_by}
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        if args.get('keyset'):
+            if args.get('offset') is not None:
+                raise GraphQLError("offset cannot be combined with keyset pagination")
+            field, descending = keyset_ordering(queryset.model, args.get('order_by'))
+            ordering = [(field, descending)] if field else []
+        else:
+            ordering = parse_ordering(queryset.model, args.get('order_by'))
+        queryset = order_queryset(queryset, ordering)
+        # Runs before resolve_connection slices out the requested page.
+        return optimize_connection_queryset(
+            queryset, info, extra_only=[field.name for field, _ in ordering]
+        )
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not args.get('keyset'):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+        queryset = maybe_queryset(iterable)
+        ordering = keyset_ordering(queryset.model, args.get('order_by'))
+        rows, cursors, page_info = keyset_page(queryset, args, ordering, max_limit)
+        result = connection(
+            edges=[connection.Edge(node=row, cursor=cursor) for row, cursor in zip(rows, cursors)],
+            page_info=page_info,
+        )
+        result.iterable = queryset
+        # Counted only if totalCount is selected (CountableConnection).
+        result.length = None
+        return result
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        prime_loaders = getattr(connection._meta.node, 'prime_loaders', None)
+        if prime_loaders is not None and hasattr(result, 'edges'):
+            prime_loaders([edge.node for edge in result.edges], info)
+        return result
@@ -1,22 +1,30 @@
 import django_filters
+from django.db import connections
 from .models import Customer, Product, Order
+from .search import SearchFilter
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
-    email = django_filters.CharFilter(field_name='email', lookup_expr='icontains')
-    created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
-    created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
+    name = SearchFilter(field_name='name')
+    email = SearchFilter(field_name='email')
+    search = SearchFilter(fields=('name', 'email'))
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
 
     def filter_phone_pattern(self, queryset, name, value):
+        # On SQLite, a prefix match as a range so the phone index can be
+        # used; LIKE (which startswith compiles to there) never uses it.
+        # The range is only right under binary collation, so other
+        # databases keep startswith.
+        if connections[queryset.db].vendor == 'sqlite':
+            return queryset.filter(phone__gte=value, phone__lt=value + '\U0010ffff')
         return queryset.filter(phone__startswith=value)
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at', 'phone']
+        fields = ['name', 'email', 'phone']
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
+    name = SearchFilter(field_name='name')
+    search = SearchFilter(fields=('name',))
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
@@ -37,10 +45,14 @@ class OrderFilter(django_filters.FilterSet):
     total_amount__lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date__gte = django_filters.DateFilter(field_name='order_date', lookup_expr='gte')
     order_date__lte = django_filters.DateFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='product__name', lookup_expr='icontains')
-    product_id = django_filters.NumberFilter(field_name='product__id', lookup_expr='exact')
+    customer_name = SearchFilter(field_name='customer__name')
+    product_name = SearchFilter(field_name='products__name')
+    search = SearchFilter(fields=('customer__name', 'products__name'))
+    product_id = django_filters.NumberFilter(field_name='products__id', lookup_expr='exact')
 
     class Meta:
         model = Order
-        fields = ['total_amount', 'order_date', 'customer__name', 'product__name', 'product__id']
+        # No exact products__name filter: across the to-many relation it
+        # would repeat an order once per matching product (product_name
+        # matches through a pk subquery instead).
+        fields = ['total_amount', 'order_date', 'customer__name', 'products__id']
@@ -0,0 +1,155 @@
+"""
+Shared GraphQL client for cron jobs, Celery tasks and scripts.
+
+``get_client()`` returns one client per process. By default
+(``CRM_GRAPHQL_URL = None``) it executes operations in-process against the
+project schema, with no HTTP round trip and no schema download. When
+``CRM_GRAPHQL_URL`` is set it talks to that endpoint over a pooled
+keep-alive ``requests`` session, validating every operation against the
+local schema first so that a malformed query never leaves the process.
+Parsed documents are cached (``crm.documents``) in both modes.
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import OperationType, execute, get_operation_ast
+
+from .db import read_from_replica
+from .documents import get_document, query_hash
+from .loaders import CRMLoaders
+
+
+class GraphQLClientError(Exception):
+    """The operation returned errors; ``data`` holds any partial result."""
+
+    def __init__(self, errors, data=None):
+        self.errors = errors
+        self.data = data
+        messages = [error.get('message', str(error)) if isinstance(error, dict) else str(error) for error in errors]
+        super().__init__('; '.join(messages))
+
+
+def local_schema():
+    return graphene_settings.SCHEMA.graphql_schema
+
+
+def _document(query):
+    document, errors = get_document(local_schema(), query, query_hash(query))
+    if errors:
+        raise GraphQLClientError(errors)
+    return document
+
+
+class LocalClient:
+    """Runs operations directly against the project schema."""
+
+    def execute(self, query, variables=None, operation_name=None):
+        # A fresh context per operation, like a request: loaders and their
+        # caches must not outlive it.
+        context = SimpleNamespace(loaders=CRMLoaders(), user=None)
+        document = _document(query)
+        operation = get_operation_ast(document, operation_name)
+        reads = nullcontext()
+        if operation is not None and operation.operation == OperationType.QUERY:
+            # Only queries read the replica, like in the GraphQL views.
+            reads = read_from_replica()
+        with reads:
+            result = execute(
+                local_schema(), document, context_value=context,
+                variable_values=variables, operation_name=operation_name,
+            )
+        if result.errors:
+            raise GraphQLClientError(result.errors, result.data)
+        return result.data
+
+
+class HTTPClient:
+    """Posts operations to a GraphQL endpoint over a keep-alive session."""
+
+    RETRY_STATUSES = (502, 503, 504)
+    RETRY_BACKOFF = 0.2
+
+    def __init__(self, url, timeout=30, retries=3, pool_size=4, headers=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        # urllib3's default allowed_methods exclude POST, so only failed
+        # connects (nothing was sent) are retried here; gateway errors are
+        # retried by execute(), for queries only.
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, backoff_factor=self.RETRY_BACKOFF),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def execute(self, query, variables=None, operation_name=None):
+        operation = get_operation_ast(_document(query), operation_name)
+        payload = {'query': query, 'variables': variables or {}}
+        if operation_name:
+            payload['operationName'] = operation_name
+        # A mutation may have committed before the gateway gave up on it:
+        # repeating it could restock twice or duplicate an order.
+        query_only = operation is not None and operation.operation == OperationType.QUERY
+        attempts = self.retries + 1 if query_only else 1
+        for attempt in range(attempts):
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            if response.status_code not in self.RETRY_STATUSES or attempt == attempts - 1:
+                break
+            time.sleep(self.RETRY_BACKOFF * 2 ** attempt)
+        try:
+            result = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise
+        if result.get('errors'):
+            raise GraphQLClientError(result['errors'], result.get('data'))
+        response.raise_for_status()
+        return result['data']
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client configured by ``CRM_GRAPHQL_URL``."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                url = getattr(settings, 'CRM_GRAPHQL_URL', None)
+                if url:
+                    _client = HTTPClient(
+                        url,
+                        timeout=getattr(settings, 'CRM_GRAPHQL_CLIENT_TIMEOUT', 30),
+                        retries=getattr(settings, 'CRM_GRAPHQL_CLIENT_RETRIES', 3),
+                        pool_size=getattr(settings, 'CRM_GRAPHQL_CLIENT_POOL_SIZE', 4),
+                    )
+                else:
+                    _client = LocalClient()
+    return _client
+
+
+def reset_client():
+    """Drop the process-wide client, e.g. after changing its settings."""
+    global _client
+    with _client_lock:
+        if isinstance(_client, HTTPClient):
+            _client.close()
+        _client = None
@@ -0,0 +1,199 @@
+"""
+Buffered, rotating logs for the cron jobs and Celery tasks.
+
+``job_logger(name)`` returns the logger of one of the ``JOB_LOGS``. Each
+log file is opened once per process and written through a buffer; a
+background thread flushes every ``CRM_JOB_LOG_FLUSH_INTERVAL`` seconds and
+the logging module flushes at exit, so a job never pays an open or a flush
+per line. Files rotate when they grow past ``CRM_JOB_LOG_MAX_BYTES`` or
+when a new ``CRM_JOB_LOG_ROTATE_INTERVAL`` period starts, keeping
+``CRM_JOB_LOG_BACKUP_COUNT`` old files. ``CRM_JOB_LOG_FORMAT = 'json'``
+writes JSON lines (with any ``extra={'fields': {...}}`` of the record)
+instead of the classic text lines.
+
+Logs go to ``CRM_JOB_LOG_DIR``, then ``BASE_DIR`` if that is not writable,
+then stdout.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# name -> (file name, text format, date format)
+JOB_LOGS = {
+    'heartbeat': ('crm_heartbeat_log.txt', '%(asctime)s %(message)s', '%d/%m/%Y-%H:%M:%S'),
+    'low_stock': ('low_stock_updates_log.txt', '[%(asctime)s] %(message)s', '%d/%m/%Y-%H:%M:%S'),
+    'report': ('crm_report_log.txt', '%(asctime)s - %(message)s', '%Y-%m-%d %H:%M:%S'),
+    'order_reminders': ('order_reminders_log.txt', '[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'),
+}
+
+LOGGER_PREFIX = 'crm.jobs.'
+
+
+class JSONLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'job': record.name[len(LOGGER_PREFIX):],
+            'level': record.levelname.lower(),
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, cls=DjangoJSONEncoder)
+
+
+class JobLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that buffers writes until flush() (called by the
+    background flusher) and also rotates on time periods.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, rotate_interval=None, buffer_size=65536):
+        self.rotate_interval = rotate_interval
+        self.buffer_size = buffer_size
+        self.period = None
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+
+    def _period(self, timestamp):
+        return int(timestamp // self.rotate_interval) if self.rotate_interval else None
+
+    def _open(self, mode=None):
+        stream = open(self.baseFilename, mode or self.mode, buffering=self.buffer_size, encoding=self.encoding)
+        stat = os.fstat(stream.fileno())
+        # Tracked here because tell() on a text stream flushes its buffer.
+        self.size = stat.st_size
+        # A file last written in an earlier period rotates on the next record.
+        self.period = self._period(stat.st_mtime) if stat.st_size else self._period(time.time())
+        return stream
+
+    def shouldRollover(self, record):
+        # Unlike the base class, no stat() per record; another process
+        # rotating the file is only noticed by flush().
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.size >= self.maxBytes:
+            return True
+        return self.rotate_interval is not None and self._period(time.time()) != self.period
+
+    def doRollover(self):
+        if self.backupCount > 0:
+            super().doRollover()
+        else:
+            # No backups kept: start the file over.
+            self.stream.close()
+            self.stream = self._open('w')
+        self.period = self._period(time.time())
+
+    def emit(self, record):
+        # StreamHandler.emit without the flush after every record.
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            message = self.format(record) + self.terminator
+            self.stream.write(message)
+            # Bytes, not characters: the file is UTF-8.
+            self.size += len(message.encode(self.encoding))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if self.stream is None:
+                return
+            self.stream.flush()
+            try:
+                moved = not os.path.samestat(os.stat(self.baseFilename), os.fstat(self.stream.fileno()))
+            except FileNotFoundError:
+                moved = True
+            if moved:
+                # Rotated (or removed) by another process: follow the path.
+                self.stream.close()
+                self.stream = self._open()
+
+
+_handlers = {}
+_lock = threading.Lock()
+_flusher = None
+_stop = threading.Event()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _make_handler(name):
+    filename, fmt, datefmt = JOB_LOGS[name]
+    handler = None
+    for directory in (_setting('CRM_JOB_LOG_DIR', '/tmp'), settings.BASE_DIR):
+        try:
+            handler = JobLogHandler(
+                os.path.join(directory, filename),
+                max_bytes=_setting('CRM_JOB_LOG_MAX_BYTES', 0),
+                backup_count=_setting('CRM_JOB_LOG_BACKUP_COUNT', 0),
+                rotate_interval=_setting('CRM_JOB_LOG_ROTATE_INTERVAL', None),
+            )
+            break
+        except OSError:
+            continue
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+    if _setting('CRM_JOB_LOG_FORMAT', 'text') == 'json':
+        handler.setFormatter(JSONLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(fmt, datefmt))
+    return handler
+
+
+def _flush_loop():
+    while not _stop.wait(_setting('CRM_JOB_LOG_FLUSH_INTERVAL', 1.0)):
+        flush_job_logs()
+
+
+def job_logger(name):
+    """The logger writing to the job log ``name`` (a key of JOB_LOGS)."""
+    global _flusher
+    logger = logging.getLogger(LOGGER_PREFIX + name)
+    if name not in _handlers:
+        with _lock:
+            if name not in _handlers:
+                handler = _make_handler(name)
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                _handlers[name] = handler
+                if _flusher is None:
+                    _stop.clear()
+                    _flusher = threading.Thread(target=_flush_loop, name='crm-job-log-flusher', daemon=True)
+                    _flusher.start()
+    return logger
+
+
+def flush_job_logs():
+    for handler in list(_handlers.values()):
+        handler.flush()
+
+
+def close_job_logs():
+    """Flush and close every job log, e.g. before changing their settings."""
+    global _flusher
+    with _lock:
+        _stop.set()
+        for name, handler in _handlers.items():
+            logging.getLogger(LOGGER_PREFIX + name).removeHandler(handler)
+            handler.close()
+        _handlers.clear()
+        _flusher = None
+
+
+atexit.register(close_job_logs)
@@ -0,0 +1,90 @@
+"""
+Per-request DataLoaders for the CRM schema.
+
+graphene-django executes resolvers synchronously, so these loaders batch
+eagerly instead of on the event loop: a connection field enqueues the keys
+of every node on the page it just resolved, and the first ``load()`` call
+fetches the whole queue in a single query.
+"""
+
+from collections import defaultdict
+
+from .models import Customer, OrderLine
+
+
+class DataLoader:
+    """Synchronous batching loader with a per-instance result cache."""
+
+    def __init__(self, batch_load_fn):
+        # batch_load_fn(keys) must return a list of values aligned with keys
+        self.batch_load_fn = batch_load_fn
+        self._cache = {}
+        self._queue = {}
+
+    def enqueue(self, keys):
+        """Queue keys so the next dispatch fetches them in the same batch."""
+        for key in keys:
+            if key not in self._cache:
+                self._queue[key] = None
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue[key] = None
+            self.dispatch()
+        return self._cache[key]
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.enqueue(keys)
+        return [self.load(key) for key in keys]
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+
+    def clear(self, key):
+        self._cache.pop(key, None)
+
+    def dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        if keys:
+            self._cache.update(zip(keys, self.batch_load_fn(keys)))
+
+
+def load_customers(customer_ids):
+    customers = Customer.objects.in_bulk(customer_ids)
+    return [customers.get(customer_id) for customer_id in customer_ids]
+
+
+def load_lines_by_order(order_ids):
+    lines = defaultdict(list)
+    for line in OrderLine.objects.filter(order_id__in=order_ids).select_related('product').order_by('pk'):
+        lines[line.order_id].append(line)
+    return [lines[order_id] for order_id in order_ids]
+
+
+def load_products_by_order(order_ids):
+    return [[line.product for line in lines] for lines in load_lines_by_order(order_ids)]
+
+
+class CRMLoaders:
+    """The set of loaders shared by every resolver of one request."""
+
+    def __init__(self):
+        self.customer_by_id = DataLoader(load_customers)
+        self.products_by_order_id = DataLoader(load_products_by_order)
+        self.lines_by_order_id = DataLoader(load_lines_by_order)
+
+
+def get_loaders(context):
+    """Return the loaders attached to the request context, creating them once."""
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        try:
+            context.loaders = loaders
+        except AttributeError:
+            # No mutable context (e.g. schema.execute without context_value):
+            # fall back to an unshared loader, which is still correct.
+            pass
+    return loaders
@@ -0,0 +1,105 @@
+"""
+Report which filter combinations of the CRM filter sets can use an index.
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for every filter of
+CustomerFilter, ProductFilter and OrderFilter, and every combination of up
+to ``--max-combination`` filters, and flags the plans that still scan a
+whole table.
+"""
+
+import datetime
+import itertools
+import re
+
+import django_filters
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.filters import CustomerFilter, OrderFilter, ProductFilter
+
+FILTERSETS = (CustomerFilter, ProductFilter, OrderFilter)
+
+# SQLite: "SCAN crm_order" ("SCAN ... USING INDEX" is an index walk and
+# "SCAN ... VIRTUAL TABLE INDEX" an FTS lookup). PostgreSQL: "Seq Scan on".
+FULL_SCAN_PATTERNS = (
+    re.compile(r'\bSCAN (?!.*\b(?:USING|VIRTUAL TABLE INDEX)\b)(?P<table>\w+)'),
+    re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+)
+
+
+def sample_value(filter_):
+    if isinstance(filter_, django_filters.BooleanFilter):
+        return 'true'
+    if isinstance(filter_, django_filters.DateTimeFilter):
+        return datetime.datetime(2024, 1, 1).isoformat()
+    if isinstance(filter_, django_filters.DateFilter):
+        return datetime.date(2024, 1, 1).isoformat()
+    if isinstance(filter_, django_filters.NumberFilter):
+        return '10'
+    if isinstance(filter_, django_filters.CharFilter):
+        return '555'
+    return None
+
+
+def full_scans(plan):
+    tables = []
+    for line in plan.splitlines():
+        for pattern in FULL_SCAN_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                tables.append(match.group('table'))
+    return tables
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every CRM filter combination and report the ones that still scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-combination', type=int, default=2,
+            help="Largest number of filters combined in one query (default: 2).",
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help="Print the full plan for every combination.",
+        )
+        parser.add_argument(
+            '--fail-on-scan', action='store_true',
+            help="Exit with an error if any combination scans a table.",
+        )
+
+    def handle(self, *args, **options):
+        checked = 0
+        scanning = []
+        for filterset_class in FILTERSETS:
+            model = filterset_class._meta.model
+            filters = {
+                name: sample_value(filter_)
+                for name, filter_ in filterset_class.base_filters.items()
+                if sample_value(filter_) is not None
+            }
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{filterset_class.__name__} ({model.__name__})"))
+            for size in range(1, options['max_combination'] + 1):
+                for names in itertools.combinations(sorted(filters), size):
+                    data = {name: filters[name] for name in names}
+                    filterset = filterset_class(data=data, queryset=model._default_manager.all())
+                    if not filterset.is_valid():
+                        self.stdout.write(self.style.WARNING(f"  skipped {', '.join(names)}: {filterset.errors}"))
+                        continue
+                    plan = filterset.qs.explain()
+                    tables = full_scans(plan)
+                    checked += 1
+                    label = ', '.join(names)
+                    if tables:
+                        scanning.append((filterset_class.__name__, label))
+                        self.stdout.write(self.style.ERROR(f"  SCAN   {label}  ({', '.join(tables)})"))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f"  INDEX  {label}"))
+                    if options['verbose_plans']:
+                        for line in plan.splitlines():
+                            self.stdout.write(f"           {line}")
+
+        summary = f"{len(scanning)} of {checked} filter combinations still scan a table on {connection.vendor}."
+        if scanning and options['fail_on_scan']:
+            raise CommandError(summary)
+        self.stdout.write(summary)
@@ -0,0 +1,64 @@
+"""
+Export customers, products or orders as NDJSON or CSV.
+
+Filters use the same names as the GraphQL filter arguments of the
+matching connection field (``--filter order_date__gte=2024-01-01``).
+"""
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from crm.export import EXPORT_CHUNK_SIZE, EXPORTS, FORMATS, ExportError, export_stream
+
+
+class Command(BaseCommand):
+    help = "Stream a CRM table to a file or stdout as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help="Output format (default: ndjson).")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--output', '-o', default='-', help="File to write (default: stdout).")
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="Filter set argument; may be repeated.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help=f"Rows fetched per database round trip (default: {EXPORT_CHUNK_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid filter '{item}', expected NAME=VALUE")
+            params.appendlist(name, value)
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+        try:
+            stream = export_stream(
+                options['kind'], params, options['format'], options['gzip'], options['chunk_size']
+            )
+        except ExportError as error:
+            raise CommandError(str(error))
+
+        began = time.perf_counter()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for data in stream:
+                output.write(data)
+                written += len(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options['output'] != '-':
+            elapsed = time.perf_counter() - began
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} bytes to {options['output']} in {elapsed:.2f}s"
+            ))
@@ -0,0 +1,77 @@
+"""
+Bulk-load customers, products or orders from a CSV or NDJSON file.
+
+Rows are validated with the same rules as the createCustomer,
+createProduct and createOrder mutations and written in chunked
+transactions. Re-running the same command resumes after the last
+committed chunk; ``--restart`` starts over. Orders reference existing
+customer and product ids and, unless ``--adjust-stock`` is given, leave
+product stock untouched.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.bulk import BULK_CHUNK_SIZE
+from crm.importer import IMPORT_FORMATS, ImportFormatError, detect_format, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import customers, products or orders from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=('customers', 'products', 'orders'))
+        parser.add_argument('path', help="CSV or NDJSON file, optionally .gz compressed.")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Input format (default: from the file name).")
+        parser.add_argument(
+            '--chunk-size', type=int, default=BULK_CHUNK_SIZE,
+            help=f"Rows per transaction (default: {BULK_CHUNK_SIZE}).",
+        )
+        parser.add_argument(
+            '--errors', help="NDJSON file rejected rows are appended to (default: <path>.errors.ndjson).",
+        )
+        parser.add_argument(
+            '--checkpoint', help="Checkpoint name (default: the kind and absolute path of the file).",
+        )
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+        parser.add_argument(
+            '--adjust-stock', action='store_true',
+            help="Check and decrement product stock for imported orders.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"No such file '{path}'")
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+        try:
+            fmt = options['format'] or detect_format(path)
+        except ImportFormatError as error:
+            raise CommandError(str(error))
+        key = options['checkpoint'] or f"{options['kind']}:{os.path.abspath(path)}"
+        errors_path = options['errors'] or f"{path}.errors.ndjson"
+
+        def progress(checkpoint, rate):
+            self.stdout.write(
+                f"{checkpoint.rows} rows ({checkpoint.created} created, {checkpoint.failed} rejected), "
+                f"{rate:.0f} rows/s"
+            )
+
+        with open(errors_path, 'a', encoding='utf-8') as errors_file:
+            try:
+                checkpoint = import_rows(
+                    options['kind'], read_rows(path, fmt), key,
+                    chunk_size=options['chunk_size'], errors_file=errors_file,
+                    restart=options['restart'], adjust_stock=options['adjust_stock'],
+                    progress=progress,
+                )
+            except ImportFormatError as error:
+                raise CommandError(str(error))
+        if os.path.getsize(errors_path) == 0:
+            os.remove(errors_path)
+        summary = f"Imported {checkpoint.created} {options['kind']}, rejected {checkpoint.failed}"
+        if checkpoint.failed:
+            summary += f" (see {errors_path})"
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,29 @@
+"""
+Install the search backend's tables and indexes (see crm/search.py).
+
+Migration 0003 installs the backend chosen at migration time; run this
+after changing ``CRM_SEARCH_BACKEND`` or upgrading to a SQLite with the
+FTS5 trigram tokenizer. Installing rebuilds the index from the tables.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from crm.search import install_search_backend
+
+
+class Command(BaseCommand):
+    help = "Install (or, with --uninstall, drop) the configured CRM search backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database alias (default: default).")
+        parser.add_argument('--uninstall', action='store_true', help="Drop the backend's tables and indexes.")
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        backend = install_search_backend(options['database'], uninstall=options['uninstall'])
+        action = "Uninstalled" if options['uninstall'] else "Installed"
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(f"{action} {type(backend).__name__} in {elapsed:.2f}s"))
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from crm.search import install_search_backend
+    install_search_backend(schema_editor.connection.alias)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from crm.search import install_search_backend
+    install_search_backend(schema_editor.connection.alias, uninstall=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
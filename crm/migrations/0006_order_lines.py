@@ -0,0 +1,106 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_prices(apps, schema_editor):
+    # Existing links become one-unit lines at today's price, the closest
+    # record of what they sold for.
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    Product = apps.get_model('crm', 'Product')
+    price = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    OrderLine.objects.using(schema_editor.connection.alias).update(unit_price=price, line_total=price)
+
+
+class Migration(migrations.Migration):
+    """
+    Turn the auto-created Order.products table into the OrderLine model.
+
+    The existing table is adopted as-is (state only), renamed, and then
+    given the quantity and price snapshot columns.
+    """
+
+    dependencies = [
+        ('crm', '0005_import_support'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderLine',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='crm.order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='crm.product')),
+                    ],
+                    options={
+                        'db_table': 'crm_order_products',
+                        'unique_together': {('order', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='crm.OrderLine', to='crm.product'),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='orderline',
+            table=None,
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(snapshot_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderline',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderline',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='orderline',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='order_line_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='order',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='crm.order'),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='crm.product'),
+        ),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(fields=['product', 'order', 'quantity', 'line_total'], name='order_line_product_idx'),
+        ),
+    ]
@@ -1,10 +1,16 @@
 from django.db import models
+from django.utils import timezone
 
 class Customer(models.Model):
 	name = models.CharField(max_length=100)
 	email = models.EmailField(unique=True)
 	phone = models.CharField(max_length=20, blank=True, null=True)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['phone'], name='customer_phone_idx'),
+		]
+
 	def __str__(self):
 		return f"{self.name} ({self.email})"
 
@@ -12,15 +18,98 @@ class Product(models.Model):
 	name = models.CharField(max_length=100)
 	price = models.DecimalField(max_digits=10, decimal_places=2)
 	stock = models.PositiveIntegerField(default=0)
+	# Incremented by every stock change, for optimistic locking (crm/stock.py).
+	version = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['stock'], name='product_stock_idx'),
+			models.Index(fields=['price'], name='product_price_idx'),
+		]
 
 	def __str__(self):
 		return self.name
 
 class Order(models.Model):
 	customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-	products = models.ManyToManyField(Product, related_name='orders')
-	order_date = models.DateTimeField(auto_now_add=True)
+	products = models.ManyToManyField(Product, related_name='orders', through='OrderLine')
+	order_date = models.DateTimeField(default=timezone.now)
 	total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+			models.Index(fields=['customer', 'order_date'], name='order_customer_date_idx'),
+			models.Index(fields=['total_amount'], name='order_total_amount_idx'),
+		]
+
 	def __str__(self):
 		return f"Order #{self.id} for {self.customer.name}"
+
+class OrderLine(models.Model):
+	"""A product on an order, with the quantity and the price it was sold at."""
+	# The unique constraint and the product index cover lookups by either
+	# key, so the foreign keys need no index of their own.
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', db_index=False)
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_lines', db_index=False)
+	quantity = models.PositiveIntegerField(default=1)
+	unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+	line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['order', 'product'], name='order_line_uniq'),
+		]
+		indexes = [
+			# Revenue by product reads only this index. The summed columns
+			# are keys rather than INCLUDE columns, which SQLite lacks.
+			models.Index(
+				fields=['product', 'order', 'quantity', 'line_total'], name='order_line_product_idx',
+			),
+		]
+
+	def __str__(self):
+		return f"{self.quantity} x {self.product_id} on order #{self.order_id}"
+
+class CustomerDailySales(models.Model):
+	"""Per-customer, per-day order totals maintained by crm.rollups."""
+	customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_sales')
+	day = models.DateField()
+	order_count = models.PositiveIntegerField(default=0)
+	revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	units = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['customer', 'day'], name='customer_daily_sales_uniq'),
+		]
+		indexes = [
+			models.Index(fields=['day'], name='customer_sales_day_idx'),
+		]
+
+class ProductDailySales(models.Model):
+	"""Per-product, per-day sales totals maintained by crm.rollups."""
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+	day = models.DateField()
+	order_count = models.PositiveIntegerField(default=0)
+	revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	units = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['product', 'day'], name='product_daily_sales_uniq'),
+		]
+		indexes = [
+			models.Index(fields=['day'], name='product_sales_day_idx'),
+		]
+
+class ImportCheckpoint(models.Model):
+	"""Progress of a resumable import_crm run, saved with each committed chunk."""
+	key = models.CharField(max_length=255, unique=True)
+	rows = models.PositiveBigIntegerField(default=0)
+	created = models.PositiveBigIntegerField(default=0)
+	failed = models.PositiveBigIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.key}: {self.rows} rows"
@@ -0,0 +1,92 @@
+"""
+Selection-set aware queryset optimizer.
+
+Walks the GraphQL selection of a connection field and narrows the queryset
+to what the client asked for: forward foreign keys become
+``select_related``, many-to-many and reverse relations become
+``prefetch_related`` (with their own optimized querysets) and plain columns
+are pruned with ``only()``.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def collect_fields(selection_sets, fragments):
+    """
+    Merge the fields selected by ``selection_sets``, following fragments.
+
+    Returns a dict mapping each response field name to the list of its
+    child selection sets.
+    """
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                children = fields.setdefault(selection.name.value, [])
+                if selection.selection_set is not None:
+                    children.append(selection.selection_set)
+                continue
+            if isinstance(selection, InlineFragmentNode):
+                nested = collect_fields([selection.selection_set], fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is None:
+                    continue
+                nested = collect_fields([fragment.selection_set], fragments)
+            else:
+                continue
+            for name, children in nested.items():
+                fields.setdefault(name, []).extend(children)
+    return fields
+
+
+def connection_node_selections(info):
+    """Return the selection sets applied to ``edges { node }`` of a connection."""
+    fields = collect_fields([node.selection_set for node in info.field_nodes], info.fragments)
+    edges = collect_fields(fields.get('edges', []), info.fragments)
+    return edges.get('node', [])
+
+
+def optimize_queryset(queryset, selection_sets, fragments, extra_only=()):
+    """Apply select_related/prefetch_related/only for the given selections."""
+    only, select_related, prefetch_related = set(extra_only), set(), []
+    _plan(queryset.model, selection_sets, fragments, '', only, select_related, prefetch_related)
+    if select_related:
+        queryset = queryset.select_related(*sorted(select_related))
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset.only(*sorted(only))
+
+
+def optimize_connection_queryset(queryset, info, extra_only=()):
+    return optimize_queryset(queryset, connection_node_selections(info), info.fragments, extra_only)
+
+
+def _plan(model, selection_sets, fragments, prefix, only, select_related, prefetch_related):
+    only.add(prefix + model._meta.pk.name)
+    for name, children in collect_fields(selection_sets, fragments).items():
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            # Computed or custom-resolved field: leave it to its resolver.
+            continue
+        path = prefix + field.name
+        if field.many_to_many or field.one_to_many:
+            # A reverse foreign key prefetch joins back on the remote column.
+            extra_only = (field.field.name,) if field.one_to_many else ()
+            related = optimize_queryset(
+                field.related_model._default_manager.all(), children, fragments, extra_only
+            )
+            prefetch_related.append(Prefetch(path, queryset=related))
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            only.add(path)
+            select_related.add(path)
+            _plan(field.related_model, children, fragments, path + '__',
+                  only, select_related, prefetch_related)
+        elif field.concrete:
+            only.add(path)
@@ -0,0 +1,149 @@
+"""
+Ordering and keyset pagination for the CRM connection fields.
+
+Keyset cursors encode ``(order_by value, pk)`` of the last row seen, and the
+next page is selected with a ``WHERE`` on those values instead of an
+``OFFSET``, so deep pages cost the same as the first one. ``totalCount``
+on a keyset page is only computed when selected.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene.utils.str_converters import to_snake_case
+from graphql import GraphQLError
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+
+
+def parse_ordering(model, order_by):
+    """Turn ``orderBy`` strings like ``-orderDate`` into (field, descending) pairs."""
+    ordering = []
+    for item in order_by or []:
+        descending = item.startswith('-')
+        name = to_snake_case(item.lstrip('-'))
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.concrete or field.is_relation:
+            raise GraphQLError(f"Cannot order {model.__name__} by '{item}'")
+        ordering.append((field, descending))
+    return ordering
+
+
+def order_queryset(queryset, ordering):
+    """Apply the ordering with the primary key as the final tie-breaker."""
+    descending = ordering[-1][1] if ordering else False
+    terms = [('-' if desc else '') + field.name for field, desc in ordering]
+    terms.append('-pk' if descending else 'pk')
+    return queryset.order_by(*terms)
+
+
+def keyset_ordering(model, order_by):
+    ordering = parse_ordering(model, order_by)
+    if len(ordering) > 1:
+        raise GraphQLError("Keyset pagination supports a single orderBy field")
+    if ordering and ordering[0][0].null:
+        raise GraphQLError(f"Cannot use keyset pagination on nullable field '{order_by[0]}'")
+    return ordering[0] if ordering else (None, False)
+
+
+def encode_cursor(field, instance):
+    # value_to_string keeps full precision (DjangoJSONEncoder truncates datetimes).
+    value = field.value_to_string(instance) if field else None
+    payload = json.dumps([field.name if field else None, value, instance.pk])
+    return base64.b64encode((KEYSET_CURSOR_PREFIX + payload).encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    try:
+        decoded = base64.b64decode(cursor).decode()
+        if not decoded.startswith(KEYSET_CURSOR_PREFIX):
+            raise ValueError
+        name, value, pk = json.loads(decoded[len(KEYSET_CURSOR_PREFIX):])
+    except (ValueError, TypeError):
+        raise GraphQLError("Invalid keyset cursor")
+    if name != (field.name if field else None):
+        raise GraphQLError("Cursor does not match the requested orderBy")
+    return (field.to_python(value) if field else None), pk
+
+
+def seek(field, descending, cursor, forward):
+    """Rows strictly after (forward) or before the cursor in the given ordering."""
+    value, pk = cursor
+    lookup = 'gt' if forward != descending else 'lt'
+    if field is None:
+        return Q(**{f'pk__{lookup}': pk})
+    return Q(**{f'{field.name}__{lookup}': value}) | Q(**{field.name: value, f'pk__{lookup}': pk})
+
+
+def keyset_page(queryset, args, ordering, max_limit):
+    """
+    Return (rows, cursors, page_info) for a queryset ordered by ``ordering``.
+
+    Fetches one extra row to learn whether another page exists.
+    """
+    field, descending = ordering
+    first, last = args.get('first'), args.get('last')
+    after, before = args.get('after'), args.get('before')
+    if after:
+        queryset = queryset.filter(seek(field, descending, decode_cursor(after, field), forward=True))
+    if before:
+        queryset = queryset.filter(seek(field, descending, decode_cursor(before, field), forward=False))
+
+    if last is not None and first is None:
+        rows = list(queryset.reverse()[:last + 1])
+        has_previous_page = len(rows) > last
+        rows = rows[:last][::-1]
+        has_next_page = bool(before)
+    else:
+        limit = first if first is not None else max_limit
+        rows = list(queryset[:limit + 1] if limit is not None else queryset)
+        has_next_page = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if last is not None:
+            rows = rows[-last:] if last else []
+        has_previous_page = bool(after)
+
+    cursors = [encode_cursor(field, row) for row in rows]
+    page_info = PageInfo(
+        start_cursor=cursors[0] if cursors else None,
+        end_cursor=cursors[-1] if cursors else None,
+        has_previous_page=has_previous_page,
+        has_next_page=has_next_page,
+    )
+    return rows, cursors, page_info
+
+
+def approximate_count(queryset):
+    """
+    Cheap row estimate for an unfiltered queryset, exact count otherwise.
+
+    Uses pg_class.reltuples on PostgreSQL and sqlite_stat1 (populated by
+    ANALYZE) on SQLite, falling back to COUNT(*) when no statistics exist.
+    """
+    if queryset.query.where:
+        return queryset.count()
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    estimate = None
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                # The first number of every stat row is the table's row count.
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+                estimate = int(row[0].split()[0]) if row else None
+    if estimate is None or estimate < 0:
+        return queryset.count()
+    return estimate
@@ -0,0 +1,260 @@
+"""
+Streaming order reminder pipeline.
+
+Recent orders are fetched page by page with keyset pagination (oldest
+first). Each page is folded into one reminder per customer and
+dispatched to a sender from a thread or process pool before the next
+page is fetched, and every send is logged to the buffered
+``order_reminders`` job log (``crm.joblog``). Memory grows with the page
+size, never with the number of orders.
+
+The state file keeps a high-water mark: the next run starts
+``safety_window`` before the newest order date seen, so an order that
+committed late with an earlier date is still found, and skips the orders
+already reminded in that window (their ids are kept in the state). A
+failed send holds the start back to that order's date, so it is retried
+on the next run; successful ones are not sent again. The first run looks
+back ``since_days`` days.
+"""
+
+import datetime
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+
+REMINDER_PAGE_SIZE = 500
+REMINDER_LOOKBACK_DAYS = 7
+REMINDER_SAFETY_WINDOW = datetime.timedelta(minutes=10)
+
+RECENT_ORDERS_QUERY = """
+    query RecentOrders($since: Date, $after: String, $first: Int!) {
+        allOrders(orderDate_Gte: $since, orderBy: ["orderDate"], keyset: true, first: $first, after: $after) {
+            edges {
+                node { id orderDate totalAmount customer { id name email } }
+            }
+            pageInfo { hasNextPage endCursor }
+        }
+    }
+"""
+
+
+def fetch_order_pages(client, since=None, after=None, page_size=REMINDER_PAGE_SIZE):
+    """Yield the orders after ``after`` (or since ``since``), one page (list) at a time."""
+    while True:
+        variables = {'since': since.isoformat() if since else None, 'after': after, 'first': page_size}
+        page = client.execute(RECENT_ORDERS_QUERY, variables)['allOrders']
+        yield [edge['node'] for edge in page['edges']]
+        if not page['pageInfo']['hasNextPage']:
+            return
+        after = page['pageInfo']['endCursor']
+
+
+def order_date_cursor(moment):
+    """The keyset cursor of the ``orderBy: ["orderDate"]`` rows from ``moment`` on."""
+    from .models import Order
+    from .pagination import encode_cursor
+
+    # pk 0 sorts before every order placed at ``moment``.
+    return encode_cursor(Order._meta.get_field('order_date'), SimpleNamespace(order_date=moment, pk=0))
+
+
+def parse_order_date(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+class ReminderBatch:
+    """One reminder per customer, folded from a stream of orders."""
+
+    def __init__(self):
+        self.reminders = {}
+        self.order_count = 0
+
+    def add(self, order):
+        customer = order['customer']
+        reminder = self.reminders.get(customer['id'])
+        if reminder is None:
+            reminder = self.reminders[customer['id']] = {
+                'customer_id': customer['id'],
+                'name': customer['name'],
+                'email': customer['email'],
+                'order_ids': [],
+                'total': Decimal('0'),
+                'last_order_date': None,
+            }
+        reminder['order_ids'].append(order['id'])
+        reminder['total'] += Decimal(str(order['totalAmount']))
+        reminder['last_order_date'] = order['orderDate']
+        self.order_count += 1
+
+    def consume(self, orders):
+        for order in orders:
+            self.add(order)
+        return self
+
+
+class LogSender:
+    """Default sender: the reminder is the log line written for it."""
+
+    def send(self, reminder):
+        return None
+
+
+class StubSender:
+    """Records reminders instead of sending them (thread pools only)."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminder):
+        self.sent.append(reminder)
+
+
+class EmailSender:
+    """Emails each customer through Django's configured email backend."""
+
+    def __init__(self, from_email=None):
+        self.from_email = from_email
+
+    def send(self, reminder):
+        from django.core.mail import send_mail
+
+        count = len(reminder['order_ids'])
+        send_mail(
+            "Your recent orders",
+            f"Hello {reminder['name']}, you placed {count} order(s) totalling ${reminder['total']} "
+            f"since our last reminder.",
+            self.from_email,
+            [reminder['email']],
+        )
+
+
+def _send(sender, reminder):
+    try:
+        sender.send(reminder)
+    except Exception as error:
+        return reminder, error
+    return reminder, None
+
+
+def dispatch(pages, sender, workers=4, processes=False):
+    """
+    Send the reminders of each page (an iterable of lists) from one pool;
+    yield ``(reminder, error)`` in order. A page is only pulled once the
+    previous one was sent.
+    """
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        for reminders in pages:
+            yield from executor.map(_send, [sender] * len(reminders), reminders)
+
+
+def format_reminder(reminder, error):
+    line = (
+        f"Reminder for {reminder['name']} ({reminder['email']}): "
+        f"{len(reminder['order_ids'])} order(s), ${reminder['total']}, last on {reminder['last_order_date']}"
+    )
+    if error is not None:
+        line += f" - FAILED: {error}"
+    return line
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or not ({'scan_from', 'after'} & set(state)):
+        return None
+    return state
+
+
+def save_state(path, scan_from, newest, reminded):
+    # Replace atomically so a crash never leaves a truncated state file.
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'scan_from': scan_from.isoformat(),
+            'newest': newest.isoformat(),
+            # Order id -> order date of the orders reminded since scan_from.
+            'reminded': {order_id: order_date.isoformat() for order_id, order_date in reminded.items()},
+            'saved_at': datetime.datetime.now().isoformat(),
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def run_reminders(state_path, log=None, client=None, sender=None, workers=4, processes=False,
+                  page_size=REMINDER_PAGE_SIZE, since_days=REMINDER_LOOKBACK_DAYS,
+                  safety_window=REMINDER_SAFETY_WINDOW):
+    """
+    Run the pipeline once and return ``(orders processed, reminders sent,
+    reminders failed)``. ``log`` defaults to the ``order_reminders`` job log.
+    """
+    if client is None:
+        from .graphql_client import get_client
+        client = get_client()
+    if log is None:
+        from .joblog import job_logger
+        log = job_logger('order_reminders')
+    sender = sender or LogSender()
+
+    state = load_state(state_path)
+    if state is None:
+        since, after, newest, reminded = datetime.date.today() - datetime.timedelta(days=since_days), None, None, {}
+    elif 'scan_from' not in state:
+        # A keyset cursor saved before the safety window existed.
+        since, after, newest, reminded = None, state['after'], None, {}
+    else:
+        since, after = None, order_date_cursor(parse_order_date(state['scan_from']))
+        newest = parse_order_date(state['newest'])
+        reminded = {order_id: parse_order_date(value) for order_id, value in state['reminded'].items()}
+
+    totals = {'orders': 0, 'reminders': 0}
+    # Order id -> order date for the page being sent.
+    page_dates = {}
+
+    def pages():
+        nonlocal newest
+        for orders in fetch_order_pages(client, since=since, after=after, page_size=page_size):
+            orders = [order for order in orders if order['id'] not in reminded]
+            page_dates.clear()
+            for order in orders:
+                page_dates[order['id']] = parse_order_date(order['orderDate'])
+            if page_dates:
+                newest = max(page_dates.values()) if newest is None else max(newest, *page_dates.values())
+            batch = ReminderBatch().consume(orders)
+            totals['orders'] += batch.order_count
+            totals['reminders'] += len(batch.reminders)
+            yield list(batch.reminders.values())
+
+    log.info("Order reminders processed:")
+    failed = 0
+    failed_from = None
+    for reminder, error in dispatch(pages(), sender, workers, processes):
+        dates = [page_dates[order_id] for order_id in reminder['order_ids']]
+        if error is None:
+            reminded.update(zip(reminder['order_ids'], dates))
+        else:
+            failed += 1
+            oldest = min(dates)
+            failed_from = oldest if failed_from is None else min(failed_from, oldest)
+        fields = {'customer_id': reminder['customer_id'], 'orders': len(reminder['order_ids'])}
+        log.log(logging.ERROR if error else logging.INFO, format_reminder(reminder, error), extra={'fields': fields})
+    if not totals['reminders']:
+        log.info("No new orders since the last run.")
+    sent = totals['reminders'] - failed
+    log.info(f"Total orders processed: {totals['orders']}, reminders sent: {sent}, failed: {failed}")
+
+    if newest is not None:
+        # Only after every reminder was dispatched: a crash re-sends, never
+        # skips. The next run re-scans the safety window, or from the oldest
+        # failed order, skipping the orders already reminded there.
+        scan_from = newest - safety_window
+        if failed_from is not None:
+            scan_from = min(scan_from, failed_from)
+        reminded = {order_id: order_date for order_id, order_date in reminded.items() if order_date >= scan_from}
+        save_state(state_path, scan_from, newest, reminded)
+    return totals['orders'], sent, failed
@@ -0,0 +1,145 @@
+"""
+Database-side aggregates for the CRM report and the ``crmSummary`` field.
+
+Counts and revenue are computed with ``COUNT``/``SUM`` in the database, so
+a summary costs a fixed number of queries and revenue stays an exact
+``Decimal`` whatever the size of the orders table. ``sales_series`` reads
+the daily rollups (``crm/rollups.py``) instead of the raw orders.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, DateField, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+
+from .models import Customer, CustomerDailySales, Order, ProductDailySales
+
+GROUP_BY_DAY = 'day'
+GROUP_BY_WEEK = 'week'
+GROUP_BY_CUSTOMER = 'customer'
+GROUP_BY_MONTH = 'month'
+
+
+def _revenue():
+    field = Order._meta.get_field('total_amount')
+    output_field = DecimalField(max_digits=field.max_digits, decimal_places=field.decimal_places)
+    return Coalesce(Sum('total_amount'), Value(Decimal('0')), output_field=output_field)
+
+
+def _money(value):
+    # SQLite sums decimals as floats and Django only quantizes plain column
+    # values, so round back to the column's scale (exact below 15 digits).
+    places = Order._meta.get_field('total_amount').decimal_places
+    return Decimal(value or 0).quantize(Decimal(1).scaleb(-places))
+
+
+def crm_summary(group_by=None, start=None, end=None):
+    """
+    Return customer/order counts and revenue, optionally grouped.
+
+    ``start``/``end`` bound ``order_date`` (inclusive/exclusive). Groups are
+    dicts with ``key``, ``label``, ``order_count`` and ``revenue``, ordered
+    by period or customer id.
+    """
+    orders = Order.objects.all()
+    if start is not None:
+        orders = orders.filter(order_date__gte=start)
+    if end is not None:
+        orders = orders.filter(order_date__lt=end)
+
+    summary = orders.aggregate(
+        order_count=Count('pk'),
+        customers_with_orders=Count('customer', distinct=True),
+        revenue=_revenue(),
+    )
+    summary['revenue'] = _money(summary['revenue'])
+    summary['customer_count'] = Customer.objects.count()
+    summary['groups'] = _groups(orders, group_by) if group_by else []
+    return summary
+
+
+def _groups(orders, group_by):
+    if group_by == GROUP_BY_CUSTOMER:
+        rows = (
+            orders.order_by()
+            .values('customer_id', 'customer__name')
+            .annotate(order_count=Count('pk'), revenue=_revenue())
+            .order_by('customer_id')
+        )
+        return [
+            {
+                'key': str(row['customer_id']),
+                'label': row['customer__name'],
+                'order_count': row['order_count'],
+                'revenue': _money(row['revenue']),
+            }
+            for row in rows
+        ]
+    if group_by == GROUP_BY_DAY:
+        period = TruncDate('order_date')
+    elif group_by == GROUP_BY_WEEK:
+        period = TruncWeek('order_date', output_field=DateField())
+    else:
+        raise ValueError(f"Unknown summary grouping '{group_by}'")
+    rows = (
+        orders.order_by()
+        .annotate(period=period)
+        .values('period')
+        .annotate(order_count=Count('pk'), revenue=_revenue())
+        .order_by('period')
+    )
+    return [
+        {
+            'key': row['period'].isoformat(),
+            'label': row['period'].isoformat(),
+            'order_count': row['order_count'],
+            'revenue': _money(row['revenue']),
+        }
+        for row in rows
+    ]
+
+
+def sales_series(interval=GROUP_BY_DAY, start=None, end=None, customer_id=None, product_id=None):
+    """
+    Order count, revenue and units per day, week or month in ``[start, end)``.
+
+    Reads the product rollup when ``product_id`` is given and the customer
+    rollup otherwise, so the cost depends on the number of days in range,
+    not on the number of orders.
+    """
+    if customer_id is not None and product_id is not None:
+        raise ValueError("Filter sales by customer or by product, not both")
+    if product_id is not None:
+        rows = ProductDailySales.objects.filter(product_id=product_id)
+    else:
+        rows = CustomerDailySales.objects.all()
+        if customer_id is not None:
+            rows = rows.filter(customer_id=customer_id)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lt=end)
+    if interval == GROUP_BY_DAY:
+        period = F('day')
+    elif interval == GROUP_BY_WEEK:
+        period = TruncWeek('day')
+    elif interval == GROUP_BY_MONTH:
+        period = TruncMonth('day')
+    else:
+        raise ValueError(f"Unknown sales interval '{interval}'")
+    rows = (
+        rows.order_by()
+        .annotate(period=period)
+        .values('period')
+        .annotate(order_count=Sum('order_count'), revenue=Sum('revenue'), units=Sum('units'))
+        .order_by('period')
+    )
+    return [
+        {
+            'period': row['period'],
+            'order_count': row['order_count'],
+            'revenue': _money(row['revenue']),
+            'units': row['units'],
+        }
+        for row in rows
+    ]
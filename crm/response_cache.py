@@ -0,0 +1,171 @@
+"""
+Response cache for read-only GraphQL operations.
+
+A query's result is stored under a key built from the normalized document
+hash, the operation name, the variables, the user and the current version
+of every CRM model the operation reads. Writes never delete cache entries:
+they bump the version counter of the model they touch (``bump_versions``),
+which changes the key of every dependent response.
+
+Versions live in the Django cache alias ``CRM_RESPONSE_CACHE``; responses
+live there too, behind a small in-process LRU (``CRM_RESPONSE_CACHE_SIZE``
+entries). Processes only agree on the versions when that alias is a cache
+they all share (Redis, Memcached): with a per-process backend such as
+``LocMemCache``, writes made by another process (a cron job, a Celery task,
+another web worker) leave this process serving stale responses until they
+expire. The cache is off (``None``) unless configured. Signals bump versions
+for ``save()``/``delete()``/m2m changes; code that writes with
+``bulk_create``, ``update()`` or raw SQL has to call ``bump_versions``
+itself.
+"""
+
+import hashlib
+import json
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from graphql import get_named_type, print_ast
+
+from .documents import LRUCache
+from .optimizer import collect_fields
+
+VERSION_KEY_PREFIX = 'crm:model-version:'
+RESPONSE_KEY_PREFIX = 'crm:response:'
+
+# Responses keyed by their full cache key, as (expires_at, data).
+response_front_cache = LRUCache(getattr(settings, 'CRM_RESPONSE_CACHE_SIZE', 1000))
+# (document hash, operation name) -> (normalized hash, model labels).
+operation_plan_cache = LRUCache(getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', 500))
+
+
+def response_cache():
+    alias = getattr(settings, 'CRM_RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def crm_model_labels():
+    return tuple(sorted(model._meta.label_lower for model in apps.get_app_config('crm').get_models()))
+
+
+def _bump(labels):
+    cache = response_cache()
+    if cache is None:
+        return
+    for label in labels:
+        key = VERSION_KEY_PREFIX + label
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing (never read or evicted): any fresh value will do.
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_versions(*models, using=DEFAULT_DB_ALIAS):
+    """
+    Invalidate every cached response that reads any of ``models``.
+
+    Bumps now and again when the surrounding transaction commits, so a
+    response computed from pre-commit data cannot be cached under the
+    new version.
+    """
+    labels = sorted({model._meta.label_lower for model in models})
+    _bump(labels)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: _bump(labels), using=using)
+
+
+def model_versions(labels):
+    cache = response_cache()
+    keys = [VERSION_KEY_PREFIX + label for label in labels]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _type_model(graphql_type):
+    meta = getattr(getattr(graphql_type, 'graphene_type', None), '_meta', None)
+    model = getattr(meta, 'model', None)
+    if model is None and getattr(meta, 'node', None) is not None:
+        # Connection types: ``totalCount`` alone still reads the node model.
+        model = getattr(meta.node._meta, 'model', None)
+    return model
+
+
+def _selected_models(graphql_type, selection_sets, fragments, models):
+    graphql_type = get_named_type(graphql_type)
+    model = _type_model(graphql_type)
+    if model is not None:
+        models.add(model._meta.label_lower)
+    fields = getattr(graphql_type, 'fields', None)
+    if not fields:
+        return
+    for name, children in collect_fields(selection_sets, fragments).items():
+        if name in fields and children:
+            _selected_models(fields[name].type, children, fragments, models)
+
+
+def operation_plan(schema, document, sha256, operation_ast):
+    """
+    Return ``(normalized hash, model labels)`` for a query operation.
+
+    Root fields whose type does not map to a model (scalars, aggregate
+    objects) are assumed to read every CRM model.
+    """
+    operation_name = operation_ast.name.value if operation_ast.name else None
+    plan = operation_plan_cache.get((sha256, operation_name))
+    if plan is not None:
+        return plan
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if definition.kind == 'fragment_definition'
+    }
+    query_type = schema.query_type
+    models = set()
+    for name, children in collect_fields([operation_ast.selection_set], fragments).items():
+        if name.startswith('__'):
+            continue
+        field_models = set()
+        _selected_models(query_type.fields[name].type, children, fragments, field_models)
+        models |= field_models or set(crm_model_labels())
+    normalized = hashlib.sha256(print_ast(document).encode('utf-8')).hexdigest()
+    plan = (normalized, tuple(sorted(models)))
+    operation_plan_cache.set((sha256, operation_name), plan)
+    return plan
+
+
+def response_key(plan, operation_name, variables, user):
+    normalized, labels = plan
+    user_key = user.pk if user is not None and user.is_authenticated else None
+    parts = json.dumps(
+        [normalized, operation_name, variables or {}, user_key, list(labels), model_versions(labels)],
+        sort_keys=True,
+        cls=DjangoJSONEncoder,
+    )
+    return RESPONSE_KEY_PREFIX + hashlib.sha256(parts.encode('utf-8')).hexdigest()
+
+
+def get_response(key):
+    entry = response_front_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    data = response_cache().get(key)
+    if data is not None:
+        response_front_cache.set(key, (time.monotonic() + _timeout(), data))
+    return data
+
+
+def set_response(key, data):
+    response_cache().set(key, data, timeout=_timeout())
+    response_front_cache.set(key, (time.monotonic() + _timeout(), data))
+
+
+def _timeout():
+    return getattr(settings, 'CRM_RESPONSE_CACHE_TIMEOUT', 300)
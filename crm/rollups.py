@@ -0,0 +1,193 @@
+"""
+Daily sales rollups per customer and per product.
+
+``record_orders`` is called by ``create_orders`` in the same transaction as
+the order inserts, so the rollups commit (or roll back) together with the
+orders. Each call folds the new orders into one delta per (customer, day)
+and (product, day) and applies them with ``INSERT ... ON CONFLICT DO
+UPDATE SET n = n + excluded.n``.
+
+Orders written any other way (admin edits, deletes, raw SQL) are not
+tracked; ``manage.py rebuild_rollups`` recomputes a date range from the
+raw orders. Days are calendar days in the current time zone, matching
+``TruncDate``.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CustomerDailySales, Order, OrderLine, ProductDailySales
+
+ROLLUP_CHUNK_SIZE = 500
+
+# Rollup model -> the foreign key it is keyed on besides ``day``.
+ROLLUPS = {
+    CustomerDailySales: 'customer',
+    ProductDailySales: 'product',
+}
+
+TOTALS = ('order_count', 'revenue', 'units')
+
+
+def _day(value):
+    return timezone.localdate(value) if settings.USE_TZ else value.date()
+
+
+def _day_start(day):
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def _new_totals():
+    return {'order_count': 0, 'revenue': Decimal('0'), 'units': 0}
+
+
+def order_deltas(orders, order_products, prices):
+    """
+    Fold orders into ``{model: {(key_id, day): totals}}``.
+
+    ``order_products`` is aligned with ``orders`` and ``prices`` maps each
+    product id to the unit price it was sold at.
+    """
+    deltas = {model: defaultdict(_new_totals) for model in ROLLUPS}
+    for order, product_ids in zip(orders, order_products):
+        day = _day(order.order_date)
+        totals = deltas[CustomerDailySales][(order.customer_id, day)]
+        totals['order_count'] += 1
+        totals['revenue'] += order.total_amount
+        totals['units'] += len(product_ids)
+        for pk in product_ids:
+            totals = deltas[ProductDailySales][(pk, day)]
+            totals['order_count'] += 1
+            totals['revenue'] += prices[pk]
+            totals['units'] += 1
+    return deltas
+
+
+def record_orders(orders, order_products, prices, using=DEFAULT_DB_ALIAS, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Add newly created orders to the rollups."""
+    for model, deltas in order_deltas(orders, order_products, prices).items():
+        apply_deltas(model, deltas, using, chunk_size)
+
+
+def apply_deltas(model, deltas, using=DEFAULT_DB_ALIAS, chunk_size=ROLLUP_CHUNK_SIZE):
+    if not deltas:
+        return
+    connection = connections[using]
+    items = sorted(deltas.items())
+    if not connection.features.supports_update_conflicts_with_target:
+        _apply_deltas_orm(model, items, using)
+        return
+    quote = connection.ops.quote_name
+    key_column = model._meta.get_field(ROLLUPS[model]).column
+    revenue_field = model._meta.get_field('revenue')
+    table = quote(model._meta.db_table)
+    columns = [key_column, 'day', *TOTALS]
+    updates = ', '.join(f"{quote(name)} = {table}.{quote(name)} + excluded.{quote(name)}" for name in TOTALS)
+    max_rows = (connection.features.max_query_params or chunk_size * len(columns)) // len(columns)
+    batch_size = min(chunk_size, max_rows)
+    placeholder = '({})'.format(', '.join(['%s'] * len(columns)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            params = []
+            for (key, day), totals in batch:
+                params += [
+                    key,
+                    connection.ops.adapt_datefield_value(day),
+                    totals['order_count'],
+                    connection.ops.adapt_decimalfield_value(
+                        totals['revenue'], revenue_field.max_digits, revenue_field.decimal_places
+                    ),
+                    totals['units'],
+                ]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+                f"VALUES {', '.join([placeholder] * len(batch))} "
+                f"ON CONFLICT ({quote(key_column)}, {quote('day')}) DO UPDATE SET {updates}",
+                params,
+            )
+
+
+def _apply_deltas_orm(model, items, using):
+    key_field = ROLLUPS[model] + '_id'
+    manager = model._default_manager.using(using)
+    for (key, day), totals in items:
+        updated = manager.filter(**{key_field: key, 'day': day}).update(
+            **{name: F(name) + totals[name] for name in TOTALS}
+        )
+        if not updated:
+            manager.create(**{key_field: key, 'day': day}, **totals)
+
+
+def rebuild_rollups(start=None, end=None, using=DEFAULT_DB_ALIAS, chunk_size=ROLLUP_CHUNK_SIZE):
+    """
+    Recompute the rollups for days in ``[start, end)`` from the raw orders.
+
+    Product revenue and units come from the order lines, i.e. the quantity
+    and the price each product was sold at. Returns the number of rows
+    written per rollup model.
+    """
+    orders = Order.objects.using(using).order_by()
+    if start is not None:
+        orders = orders.filter(order_date__gte=_day_start(start))
+    if end is not None:
+        orders = orders.filter(order_date__lt=_day_start(end))
+    lines = OrderLine.objects.using(using).filter(order__in=orders.values('pk')).order_by()
+
+    with transaction.atomic(using=using):
+        customer_rows, product_rows = _rollup_rows(orders, lines, chunk_size)
+        written = {}
+        for model, rows in ((CustomerDailySales, customer_rows), (ProductDailySales, product_rows)):
+            existing = model._default_manager.using(using)
+            if start is not None:
+                existing = existing.filter(day__gte=start)
+            if end is not None:
+                existing = existing.filter(day__lt=end)
+            existing.delete()
+            key_field = ROLLUPS[model] + '_id'
+            model._default_manager.using(using).bulk_create(
+                (model(**{key_field: key, 'day': day}, **totals) for (key, day), totals in sorted(rows.items())),
+                batch_size=chunk_size,
+            )
+            written[model] = len(rows)
+    return written
+
+
+def _rollup_rows(orders, lines, chunk_size):
+    customer_rows = defaultdict(_new_totals)
+    by_customer = (
+        orders.annotate(day=TruncDate('order_date'))
+        .values('customer_id', 'day')
+        .annotate(order_count=Count('pk'), revenue=Sum('total_amount'))
+    )
+    for row in by_customer.iterator(chunk_size):
+        totals = customer_rows[(row['customer_id'], row['day'])]
+        totals['order_count'] = row['order_count']
+        totals['revenue'] = row['revenue']
+    units = (
+        lines.annotate(day=TruncDate('order__order_date'))
+        .values('order__customer_id', 'day')
+        .annotate(units=Sum('quantity'))
+    )
+    for row in units.iterator(chunk_size):
+        customer_rows[(row['order__customer_id'], row['day'])]['units'] = row['units']
+
+    by_product = (
+        lines.annotate(day=TruncDate('order__order_date'))
+        .values('product_id', 'day')
+        .annotate(order_count=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum('line_total'))
+    )
+    product_rows = {
+        (row['product_id'], row['day']): {name: row[name] for name in TOTALS}
+        for row in by_product.iterator(chunk_size)
+    }
+
+    return customer_rows, product_rows
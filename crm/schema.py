@@ -1,39 +1,158 @@
 # ...existing code...
 
 import graphene
-from graphene_django import DjangoObjectType, DjangoFilterConnectionField
-from .models import Customer, Product, Order
+from graphene_django import DjangoObjectType
+from .models import Customer, Product, Order, OrderLine
+from .fields import CRMFilterConnectionField
 from .filters import CustomerFilter, ProductFilter, OrderFilter
 from crm.models import Product
 
 class Query(graphene.ObjectType):
     ping = graphene.String(default_value="pong")
     hello = graphene.String(default_value="Hello, GraphQL!")
-    all_customers = DjangoFilterConnectionField(lambda: CustomerType, filterset_class=CustomerFilter, order_by=graphene.List(graphene.String))
-    all_products = DjangoFilterConnectionField(lambda: ProductType, filterset_class=ProductFilter, order_by=graphene.List(graphene.String))
-    all_orders = DjangoFilterConnectionField(lambda: OrderType, filterset_class=OrderFilter, order_by=graphene.List(graphene.String))
+    all_customers = CRMFilterConnectionField(lambda: CustomerType, filterset_class=CustomerFilter, order_by=graphene.List(graphene.String))
+    all_products = CRMFilterConnectionField(lambda: ProductType, filterset_class=ProductFilter, order_by=graphene.List(graphene.String))
+    all_orders = CRMFilterConnectionField(lambda: OrderType, filterset_class=OrderFilter, order_by=graphene.List(graphene.String))
+    crm_summary = graphene.Field(
+        lambda: CRMSummaryType,
+        group_by=graphene.Argument(lambda: SummaryGroupBy),
+        start=graphene.DateTime(),
+        end=graphene.DateTime(),
+    )
+
+    sales_series = graphene.List(
+        lambda: SalesPointType,
+        interval=graphene.Argument(lambda: SalesInterval, default_value="day"),
+        start=graphene.Date(),
+        end=graphene.Date(),
+        customer_id=graphene.ID(),
+        product_id=graphene.ID(),
+    )
+
+    def resolve_crm_summary(root, info, group_by=None, start=None, end=None):
+        return crm_summary(group_by.value if group_by else None, start, end)
+
+    def resolve_sales_series(root, info, interval="day", start=None, end=None, customer_id=None, product_id=None):
+        return sales_series(getattr(interval, "value", interval), start, end, customer_id, product_id)
 import graphene
 from graphene_django import DjangoObjectType
 from .models import Customer, Product, Order
-from django.core.validators import RegexValidator
 from django.db import transaction
-from django.utils import timezone
+from .broadcast import ORDERS_CHANNEL, STOCK_CHANNEL
+from .bulk import (
+    LOW_STOCK_THRESHOLD, RESTOCK_INCREMENT, bulk_create_customers, create_orders,
+    product_error, restock_low_stock_products,
+)
+from .loaders import get_loaders
+from .pagination import approximate_count
+from .reports import (
+    GROUP_BY_CUSTOMER, GROUP_BY_DAY, GROUP_BY_MONTH, GROUP_BY_WEEK, crm_summary, sales_series,
+)
+from .stock import StockConflict, retry_on_conflict, set_stock
+from .subscriptions import model_events
+from .validators import phone_validator
 
 # Types
+class CountableConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(approximate=graphene.Boolean(default_value=False))
+
+    def resolve_total_count(root, info, approximate=False):
+        # Keyset pages leave length unset so COUNT(*) only runs when asked for.
+        if root.length is not None:
+            return root.length
+        if approximate:
+            return approximate_count(root.iterable)
+        return root.iterable.count()
+
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
         fields = ("id", "name", "email", "phone")
+        use_connection = True
+        connection_class = CountableConnection
 
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "version")
+        use_connection = True
+        connection_class = CountableConnection
+
+class OrderLineType(DjangoObjectType):
+    class Meta:
+        model = OrderLine
+        fields = ("id", "product", "quantity", "unit_price", "line_total")
 
 class OrderType(DjangoObjectType):
+    customer = graphene.Field(CustomerType)
+    products = graphene.List(ProductType)
+    lines = graphene.List(OrderLineType)
+
     class Meta:
         model = Order
-        fields = ("id", "customer", "products", "order_date", "total_amount")
+        fields = ("id", "customer", "products", "lines", "order_date", "total_amount")
+        use_connection = True
+        connection_class = CountableConnection
+
+    @classmethod
+    def prime_loaders(cls, orders, info):
+        # Reuse relations the optimizer already joined or prefetched, then
+        # queue the rest so the first lookup fetches the whole page at once.
+        loaders = get_loaders(info.context)
+        for order in orders:
+            if Order._meta.get_field("customer").is_cached(order):
+                loaders.customer_by_id.prime(order.customer_id, order.customer)
+            prefetched = getattr(order, "_prefetched_objects_cache", {})
+            if "products" in prefetched:
+                loaders.products_by_order_id.prime(order.pk, list(prefetched["products"]))
+            if "lines" in prefetched:
+                loaders.lines_by_order_id.prime(order.pk, list(prefetched["lines"]))
+        # The optimizer defers customer_id when no customer was selected.
+        if orders and "customer_id" not in orders[0].get_deferred_fields():
+            loaders.customer_by_id.enqueue(order.customer_id for order in orders)
+        loaders.products_by_order_id.enqueue(order.pk for order in orders)
+        loaders.lines_by_order_id.enqueue(order.pk for order in orders)
+
+    def resolve_customer(root, info):
+        return get_loaders(info.context).customer_by_id.load(root.customer_id)
+
+    def resolve_products(root, info):
+        return get_loaders(info.context).products_by_order_id.load(root.pk)
+
+    def resolve_lines(root, info):
+        return get_loaders(info.context).lines_by_order_id.load(root.pk)
+
+class SummaryGroupBy(graphene.Enum):
+    DAY = GROUP_BY_DAY
+    WEEK = GROUP_BY_WEEK
+    CUSTOMER = GROUP_BY_CUSTOMER
+
+class CRMSummaryGroupType(graphene.ObjectType):
+    key = graphene.String()
+    label = graphene.String()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+class CRMSummaryType(graphene.ObjectType):
+    customer_count = graphene.Int()
+    customers_with_orders = graphene.Int()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    groups = graphene.List(CRMSummaryGroupType)
+
+class SalesInterval(graphene.Enum):
+    DAY = GROUP_BY_DAY
+    WEEK = GROUP_BY_WEEK
+    MONTH = GROUP_BY_MONTH
+
+class SalesPointType(graphene.ObjectType):
+    period = graphene.Date()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    units = graphene.Int()
 
 # Mutations
 class CustomerInput(graphene.InputObjectType):
@@ -54,9 +173,8 @@ class CreateCustomer(graphene.Mutation):
         if Customer.objects.filter(email=email).exists():
             return CreateCustomer(message="Email already exists")
         if phone:
-            validator = RegexValidator(regex=r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
             try:
-                validator(phone)
+                phone_validator(phone)
             except Exception:
                 return CreateCustomer(message="Invalid phone format")
         customer = Customer(name=name, email=email, phone=phone)
@@ -72,28 +190,7 @@ class BulkCreateCustomers(graphene.Mutation):
 
     @transaction.atomic
     def mutate(self, info, input):
-        customers = []
-        errors = []
-        for idx, data in enumerate(input):
-            name = data.name
-            email = data.email
-            phone = data.phone
-            if not name or not email:
-                errors.append(f"Row {idx+1}: Name and email required")
-                continue
-            if Customer.objects.filter(email=email).exists():
-                errors.append(f"Row {idx+1}: Email already exists")
-                continue
-            if phone:
-                validator = RegexValidator(regex=r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
-                try:
-                    validator(phone)
-                except Exception:
-                    errors.append(f"Row {idx+1}: Invalid phone format")
-                    continue
-            customer = Customer(name=name, email=email, phone=phone)
-            customer.save()
-            customers.append(customer)
+        customers, errors = bulk_create_customers(input)
         return BulkCreateCustomers(customers=customers, errors=errors)
 
 class CreateProduct(graphene.Mutation):
@@ -106,10 +203,9 @@ class CreateProduct(graphene.Mutation):
     message = graphene.String()
 
     def mutate(self, info, name, price, stock=0):
-        if price <= 0:
-            return CreateProduct(message="Price must be positive")
-        if stock is not None and stock < 0:
-            return CreateProduct(message="Stock cannot be negative")
+        error = product_error(price, stock)
+        if error:
+            return CreateProduct(message=error)
         product = Product(name=name, price=price, stock=stock or 0)
         product.save()
         return CreateProduct(product=product, message="Product created successfully")
@@ -123,46 +219,61 @@ class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
     message = graphene.String()
 
-    @transaction.atomic
     def mutate(self, info, customer_id, product_ids, order_date=None):
-        try:
-            customer = Customer.objects.get(pk=customer_id)
-        except Customer.DoesNotExist:
-            return CreateOrder(message="Invalid customer ID")
-        if not product_ids:
-            return CreateOrder(message="At least one product must be selected")
-        products = list(Product.objects.filter(pk__in=product_ids))
-        if len(products) != len(product_ids):
-            return CreateOrder(message="One or more product IDs are invalid")
-        order = Order(customer=customer, order_date=order_date or timezone.now())
-        order.save()
-        order.products.set(products)
-        total = sum([p.price for p in products])
-        order.total_amount = total
-        order.save()
+        # Rerun on a stock conflict: the retry sees the stock that is left.
+        [(order, error)] = retry_on_conflict(
+            create_orders, [{"customer_id": customer_id, "product_ids": product_ids, "order_date": order_date}]
+        )
+        if error:
+            return CreateOrder(message=error)
         return CreateOrder(order=order, message="Order created successfully")
 
+class OrderInput(graphene.InputObjectType):
+    customer_id = graphene.ID(required=True)
+    product_ids = graphene.List(graphene.ID, required=True)
+    order_date = graphene.DateTime()
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, input):
+        orders = []
+        errors = []
+        for idx, (order, error) in enumerate(retry_on_conflict(create_orders, input)):
+            if error:
+                errors.append(f"Row {idx+1}: {error}")
+            else:
+                orders.append(order)
+        # Batch the customer/products lookups of the returned orders.
+        OrderType.prime_loaders(orders, info)
+        return BulkCreateOrders(orders=orders, errors=errors)
+
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass
+        threshold = graphene.Int()
+        increment = graphene.Int()
+        chunk_size = graphene.Int()
 
     # Return fields
     updated_products = graphene.List(ProductType)
     message = graphene.String()
     count = graphene.Int()
 
-    def mutate(self, info):
+    def mutate(self, info, threshold=None, increment=None, chunk_size=None):
+        threshold = LOW_STOCK_THRESHOLD if threshold is None else threshold
+        increment = RESTOCK_INCREMENT if increment is None else increment
+        if increment <= 0:
+            return UpdateLowStockProducts(updated_products=[], message="Increment must be positive", count=0)
+        if chunk_size is not None and chunk_size <= 0:
+            return UpdateLowStockProducts(updated_products=[], message="Chunk size must be positive", count=0)
         try:
-            # Query products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            
-            updated_products = []
-            for product in low_stock_products:
-                # Increment stock by 10 (simulating restocking)
-                product.stock += 10
-                product.save()
-                updated_products.append(product)
-            
+            # Single UPDATE ... SET stock = stock + increment per chunk
+            updated_products = restock_low_stock_products(threshold, increment, chunk_size)
+
             count = len(updated_products)
             message = f"Successfully updated {count} low-stock products"
             
@@ -178,9 +289,59 @@ class UpdateLowStockProducts(graphene.Mutation):
                 count=0
             )
 
+class UpdateProductStock(graphene.Mutation):
+    class Arguments:
+        id = graphene.ID(required=True)
+        stock = graphene.Int(required=True)
+        version = graphene.Int(required=True)
+
+    product = graphene.Field(ProductType)
+    message = graphene.String()
+
+    def mutate(self, info, id, stock, version):
+        # Compare-and-set: fails if the product changed since it was read at ``version``.
+        if stock < 0:
+            return UpdateProductStock(message="Stock cannot be negative")
+        try:
+            product_id = int(id)
+        except (TypeError, ValueError):
+            return UpdateProductStock(message="Product not found")
+        try:
+            set_stock(product_id, stock, version)
+        except StockConflict as e:
+            product = Product.objects.filter(pk=product_id).first()
+            if product is None:
+                return UpdateProductStock(message="Product not found")
+            return UpdateProductStock(product=product, message=str(e))
+        return UpdateProductStock(product=Product.objects.get(pk=product_id), message="Stock updated successfully")
+
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
+    update_product_stock = UpdateProductStock.Field()
+
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderType)
+    stock_changed = graphene.Field(ProductType, threshold=graphene.Int())
+
+    async def subscribe_order_created(root, info):
+        def load(pks):
+            return list(Order.objects.filter(pk__in=pks).order_by("pk"))
+
+        async for order in model_events(ORDERS_CHANNEL, load):
+            yield order
+
+    async def subscribe_stock_changed(root, info, threshold=None):
+        # Only products left below ``threshold``, when given.
+        def load(pks):
+            products = Product.objects.filter(pk__in=pks).order_by("pk")
+            if threshold is not None:
+                products = products.filter(stock__lt=threshold)
+            return list(products)
+
+        async for product in model_events(STOCK_CHANNEL, load):
+            yield product
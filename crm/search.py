@@ -0,0 +1,269 @@
+"""
+Pluggable substring search for the CRM filter sets.
+
+``icontains`` cannot use a B-tree index, so the name/email filters and the
+``search`` argument of the connection fields go through a search backend
+instead:
+
+* ``SQLiteFTSBackend`` keeps an FTS5 ``trigram`` table per model in sync
+  (via the signals in ``crm/signals.py`` and explicit calls from the bulk
+  write paths, which send no signals).
+* ``PostgresTrigramBackend`` adds ``pg_trgm`` GIN indexes that PostgreSQL
+  uses for the ``icontains`` lookup directly.
+* ``IContainsBackend`` is the plain fallback.
+
+The backend is chosen with the ``CRM_SEARCH_BACKEND`` setting (a dotted
+path); when unset it is picked from the database vendor. Migration 0003
+installs it; ``manage.py install_search_index`` (re)installs it after the
+setting or the SQLite version changed. Until its tables exist, searches
+fall back to ``IContainsBackend`` instead of failing, and a database
+system check (``manage.py check --database default``) warns. A process
+notices an index installed by another one when it restarts.
+"""
+
+import sqlite3
+
+import django_filters
+from django.conf import settings
+from django.core import checks
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from django_filters.constants import EMPTY_VALUES
+
+from .models import Customer, Product
+
+# Model fields kept in the search index.
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name',),
+}
+
+
+class IContainsBackend:
+    """Unindexed ``icontains`` matching; correct everywhere, fast nowhere."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def is_installed(self):
+        return True
+
+    def index(self, model, instances, created=False):
+        pass
+
+    def remove(self, model, pks):
+        pass
+
+    def matching(self, model, field, term):
+        """Return an expression or queryset of the pks of ``model`` matching ``term``."""
+        manager = model._default_manager.using(self.connection.alias)
+        return manager.filter(**{f'{field}__icontains': term}).values('pk')
+
+    def filter(self, queryset, paths, term):
+        """Filter ``queryset`` to rows where any of ``paths`` contains ``term``."""
+        condition = Q()
+        for path in paths:
+            *relation, field = path.split('__')
+            model = queryset.model
+            for name in relation:
+                model = model._meta.get_field(name).related_model
+            matching = self.matching(model, field, term)
+            if relation:
+                # Go through a pk subquery so to-many paths do not duplicate rows.
+                matching = (
+                    queryset.model._default_manager.using(self.connection.alias)
+                    .filter(**{'__'.join(relation) + '__pk__in': matching})
+                    .values('pk')
+                )
+            condition |= Q(pk__in=matching)
+        return queryset.filter(condition)
+
+
+class SQLiteFTSBackend(IContainsBackend):
+    """FTS5 trigram tables, one per model in SEARCH_FIELDS, keyed by rowid = pk."""
+
+    # The trigram tokenizer cannot match anything shorter than a trigram.
+    MIN_TERM_LENGTH = 3
+
+    def table(self, model):
+        return self.connection.ops.quote_name(f'{model._meta.db_table}_fts')
+
+    def columns(self, model):
+        return [model._meta.get_field(field).column for field in SEARCH_FIELDS[model]]
+
+    def install(self):
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                columns = ', '.join(quote(column) for column in self.columns(model))
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(model)} "
+                    f"USING fts5({columns}, tokenize='trigram')"
+                )
+                # Rebuilt from scratch: a reinstall must not duplicate rows.
+                cursor.execute(f"DELETE FROM {self.table(model)}")
+                cursor.execute(
+                    f"INSERT INTO {self.table(model)}(rowid, {columns}) "
+                    f"SELECT {quote(model._meta.pk.column)}, {columns} FROM {quote(model._meta.db_table)}"
+                )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                cursor.execute(f"DROP TABLE IF EXISTS {self.table(model)}")
+
+    def is_installed(self):
+        tables = set(self.connection.introspection.table_names())
+        return all(f'{model._meta.db_table}_fts' in tables for model in SEARCH_FIELDS)
+
+    def index(self, model, instances, created=False):
+        if model not in SEARCH_FIELDS:
+            return
+        fields = SEARCH_FIELDS[model]
+        rows = [(obj.pk, *(getattr(obj, field) for field in fields)) for obj in instances]
+        if not rows:
+            return
+        if not created:
+            self.remove(model, [row[0] for row in rows])
+        columns = ', '.join(self.connection.ops.quote_name(column) for column in self.columns(model))
+        placeholder = '({})'.format(', '.join(['%s'] * (len(fields) + 1)))
+        batch_size = self.connection.features.max_query_params // (len(fields) + 1)
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f"INSERT INTO {self.table(model)}(rowid, {columns}) "
+                    f"VALUES {', '.join([placeholder] * len(batch))}",
+                    [value for row in batch for value in row],
+                )
+
+    def remove(self, model, pks):
+        if model not in SEARCH_FIELDS or not pks:
+            return
+        pks = list(pks)
+        batch_size = self.connection.features.max_query_params
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                cursor.execute(
+                    f"DELETE FROM {self.table(model)} WHERE rowid IN ({', '.join(['%s'] * len(batch))})",
+                    batch,
+                )
+
+    def matching(self, model, field, term):
+        if field not in SEARCH_FIELDS.get(model, ()) or len(term) < self.MIN_TERM_LENGTH:
+            return super().matching(model, field, term)
+        column = model._meta.get_field(field).column
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        table = self.table(model)
+        return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [f'{column} : {phrase}'])
+
+
+class PostgresTrigramBackend(IContainsBackend):
+    """
+    pg_trgm GIN indexes on the expression PostgreSQL's icontains compiles to.
+
+    Queries are plain icontains lookups, so they work (unindexed) whether
+    or not the indexes are installed.
+    """
+
+    def index_name(self, model, column):
+        return self.connection.ops.quote_name(f'{model._meta.db_table}_{column}_trgm')
+
+    def install(self):
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for model, fields in SEARCH_FIELDS.items():
+                for field in fields:
+                    column = model._meta.get_field(field).column
+                    cursor.execute(
+                        f"CREATE INDEX IF NOT EXISTS {self.index_name(model, column)} "
+                        f"ON {quote(model._meta.db_table)} USING gin (UPPER({quote(column)}::text) gin_trgm_ops)"
+                    )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            for model, fields in SEARCH_FIELDS.items():
+                for field in fields:
+                    column = model._meta.get_field(field).column
+                    cursor.execute(f"DROP INDEX IF EXISTS {self.index_name(model, column)}")
+
+
+def default_backend_path(connection):
+    if connection.vendor == 'postgresql':
+        return 'crm.search.PostgresTrigramBackend'
+    if connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34):
+        return 'crm.search.SQLiteFTSBackend'
+    return 'crm.search.IContainsBackend'
+
+
+def configured_search_backend(using=DEFAULT_DB_ALIAS):
+    """The backend ``CRM_SEARCH_BACKEND`` selects, installed or not."""
+    connection = connections[using]
+    path = getattr(settings, 'CRM_SEARCH_BACKEND', None) or default_backend_path(connection)
+    return import_string(path)(connection)
+
+
+# (alias, database name, backend class) -> whether the backend is installed.
+_installed = {}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """The configured backend, or IContainsBackend while it is not installed."""
+    backend = configured_search_backend(using)
+    key = (using, backend.connection.settings_dict['NAME'], type(backend))
+    if key not in _installed:
+        _installed[key] = backend.is_installed()
+    return backend if _installed[key] else IContainsBackend(backend.connection)
+
+
+def install_search_backend(using=DEFAULT_DB_ALIAS, uninstall=False):
+    """Install (or drop) the configured backend's tables and indexes."""
+    backend = configured_search_backend(using)
+    if uninstall:
+        backend.uninstall()
+    else:
+        backend.install()
+    _installed.clear()
+    return backend
+
+
+@checks.register(checks.Tags.database)
+def check_search_backend(app_configs, databases=None, **kwargs):
+    warnings = []
+    for alias in databases or ():
+        backend = configured_search_backend(alias)
+        if not backend.is_installed():
+            warnings.append(checks.Warning(
+                f"{type(backend).__name__} is not installed on database '{alias}'; "
+                f"name and search filters fall back to unindexed icontains.",
+                hint=f"Run 'manage.py install_search_index --database {alias}'.",
+                id='crm.W001',
+            ))
+    return warnings
+
+
+class SearchFilter(django_filters.CharFilter):
+    """
+    CharFilter that matches substrings through the search backend.
+
+    Matches ``field_name`` by default, or any of ``fields`` when given.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.search_fields = fields
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return get_search_backend(qs.db).filter(qs, self.search_fields or (self.field_name,), value)
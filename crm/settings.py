@@ -45,8 +45,94 @@ INSTALLED_APPS = [
 # Graphene settings
 GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
+    # Largest page a connection field will return in one request
+    'RELAY_CONNECTION_MAX_LIMIT': 1000,
+    # WebSocket endpoint GraphiQL sends subscriptions to (see asgi.py)
+    'SUBSCRIPTION_PATH': '/graphql',
+    # No DjangoDebug middleware, which graphene-django adds when DEBUG is on:
+    # the schema has no _debug field to report to, and the middleware
+    # wraps the cursor of every connection (the replica included) and
+    # never unwraps it.
+    'MIDDLEWARE': [],
 }
 
+# Substring search backend for the name/email filters (dotted path to a
+# class in crm.search). None picks one from the database vendor.
+CRM_SEARCH_BACKEND = None
+
+# Parsed and validated GraphQL documents kept per process, the cache alias
+# persisted-query texts are registered in (shared across processes) and
+# how long a registered text is kept, in seconds.
+CRM_DOCUMENT_CACHE_SIZE = 500
+CRM_PERSISTED_QUERY_CACHE = 'default'
+CRM_PERSISTED_QUERY_TIMEOUT = 24 * 60 * 60
+
+# Cache alias for query responses and model version counters (None turns
+# the response cache off), the in-process front tier size and entry TTL.
+# The alias must be shared by every process that writes CRM data (web
+# workers, cron jobs, Celery workers, import_crm), e.g. a Redis cache: the
+# default local-memory cache is per process, so writes made elsewhere would
+# not invalidate this process's responses. Off until such a cache is set up.
+CRM_RESPONSE_CACHE = None
+CRM_RESPONSE_CACHE_SIZE = 1000
+CRM_RESPONSE_CACHE_TIMEOUT = 300
+
+# Worker threads (and so database connections) of the async GraphQL view;
+# None uses the ThreadPoolExecutor default.
+CRM_GRAPHQL_ASYNC_WORKERS = None
+
+# Most operations accepted in one batched request (a JSON array POSTed to
+# /graphql); None for no limit.
+CRM_GRAPHQL_MAX_BATCH_SIZE = 20
+
+# GraphQL query cost limits (see crm/cost.py): the most objects and the
+# deepest nesting an operation may request, the assumed length of plain
+# list fields and an optional per-client (cost, seconds) budget. The page
+# size limit is GRAPHENE['RELAY_CONNECTION_MAX_LIMIT'].
+CRM_QUERY_MAX_COST = 50000
+CRM_QUERY_MAX_DEPTH = 10
+CRM_QUERY_LIST_SIZE = 10
+CRM_QUERY_COST_RATE = None
+
+# Fraction of GraphQL operations traced into the /metrics histograms, and
+# whether clients may ask for a trace in the response (extensions.tracing).
+CRM_TRACING_SAMPLE_RATE = 0.01
+CRM_TRACING_IN_RESPONSE = DEBUG
+
+# GraphQL endpoint of the shared client used by cron jobs and tasks
+# (crm/graphql_client.py); None executes operations in-process. Timeout,
+# retries and keep-alive pool size only apply to the HTTP client.
+CRM_GRAPHQL_URL = None
+CRM_GRAPHQL_CLIENT_TIMEOUT = 30
+CRM_GRAPHQL_CLIENT_RETRIES = 3
+CRM_GRAPHQL_CLIENT_POOL_SIZE = 4
+
+# Attempts and base backoff (seconds, doubled per attempt) when a stock
+# reservation or restock conflicts with a concurrent write (crm/stock.py).
+CRM_STOCK_RETRY_ATTEMPTS = 5
+CRM_STOCK_RETRY_BACKOFF = 0.01
+
+# GraphQL subscriptions over WebSocket (crm/subscriptions.py, served by
+# asgi.py): path, event backend (dotted path; crm.broadcast.ChannelLayerBackend
+# fans out across processes), events buffered per subscriber, keep-alive
+# interval of the graphql-ws protocol and how long a client has to send
+# connection_init (seconds).
+CRM_SUBSCRIPTION_PATH = '/graphql'
+CRM_BROADCAST_BACKEND = 'crm.broadcast.InMemoryBackend'
+CRM_BROADCAST_QUEUE_SIZE = 100
+CRM_SUBSCRIPTION_KEEPALIVE = 15
+CRM_SUBSCRIPTION_INIT_TIMEOUT = 10
+
+# Cron job and task logs (crm/joblog.py): directory, 'text' or 'json'
+# lines, rotation by size and/or time period (seconds, None for size only),
+# rotated files kept and how often buffered lines are flushed (seconds).
+CRM_JOB_LOG_DIR = '/tmp'
+CRM_JOB_LOG_FORMAT = 'text'
+CRM_JOB_LOG_MAX_BYTES = 10 * 1024 * 1024
+CRM_JOB_LOG_ROTATE_INTERVAL = None
+CRM_JOB_LOG_BACKUP_COUNT = 5
+CRM_JOB_LOG_FLUSH_INTERVAL = 1.0
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,13 +167,47 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite runs in WAL mode, so readers never block the writer nor it them,
+# with synchronous=NORMAL (durable at checkpoints, safe with WAL) and reads
+# through a memory map. A locked database is waited on for
+# SQLITE_BUSY_TIMEOUT seconds instead of failing, and write transactions
+# take the write lock up front (BEGIN IMMEDIATE) so that two of them queue
+# on that timeout rather than deadlocking when both upgrade from a read.
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_BUSY_TIMEOUT = 20
+
+# Connections are kept for CONN_MAX_AGE seconds and checked before reuse.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': f'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read-only connection to the same file, used by GraphQL query
+    # operations (see crm/db.py). Point it at a real replica when there is one.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+# Reads of GraphQL query operations go to CRM_READ_REPLICA (a DATABASES
+# alias, None to read from the writer); all other reads use the writer.
+DATABASE_ROUTERS = ['crm.db.ReplicaRouter']
+CRM_READ_REPLICA = 'replica'
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
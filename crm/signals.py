@@ -0,0 +1,78 @@
+"""
+Model signal receivers for the CRM app.
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .broadcast import ORDERS_CHANNEL, STOCK_CHANNEL, get_broadcast
+from .models import Customer, Order, OrderLine, Product
+from .response_cache import bump_versions
+from .search import get_search_backend
+
+# Sent by the set-based write paths (crm/bulk.py, crm/stock.py), which
+# bypass the model signals, with ``pks`` and ``using``.
+orders_created = Signal()
+stock_changed = Signal()
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, created, using, **kwargs):
+    get_search_backend(using).index(sender, [instance], created=created)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    get_search_backend(using).remove(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_responses(sender, using, **kwargs):
+    bump_versions(sender, using=using)
+
+
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def invalidate_cached_order_lines(sender, using, **kwargs):
+    bump_versions(Order, Product, using=using)
+
+
+@receiver(m2m_changed, sender=OrderLine)
+def invalidate_cached_order_products(sender, instance, action, model, using, **kwargs):
+    if action.startswith('post_'):
+        bump_versions(type(instance), model, using=using)
+
+
+def publish_on_commit(channel, pks, using):
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: get_broadcast().publish(channel, pks), using=using)
+
+
+@receiver(post_save, sender=Order)
+def publish_created_order(sender, instance, created, using, **kwargs):
+    if created:
+        publish_on_commit(ORDERS_CHANNEL, [instance.pk], using)
+
+
+@receiver(post_save, sender=Product)
+def publish_saved_product(sender, instance, using, **kwargs):
+    publish_on_commit(STOCK_CHANNEL, [instance.pk], using)
+
+
+@receiver(orders_created)
+def publish_created_orders(sender, pks, using, **kwargs):
+    publish_on_commit(ORDERS_CHANNEL, pks, using)
+
+
+@receiver(stock_changed)
+def publish_stock_changes(sender, pks, using, **kwargs):
+    publish_on_commit(STOCK_CHANNEL, pks, using)
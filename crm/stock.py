@@ -0,0 +1,100 @@
+"""
+Stock reservation with conditional updates and optimistic locking.
+
+Stock is never written back from a value read earlier. Reservations are
+``UPDATE ... SET stock = stock - n WHERE stock >= n``: when fewer rows
+match than were asked for, another transaction took the stock first and
+``StockConflict`` rolls the reservation back. Absolute writes
+(``set_stock``) compare the product's ``version``, which every stock
+change increments, so they fail instead of overwriting a change they did
+not see.
+
+``retry_on_conflict`` runs a unit of work in its own transaction (or
+savepoint) and repeats it with jittered exponential backoff on a
+conflict, or on a lock error when it owns the whole transaction.
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+
+from .models import Product
+from .response_cache import bump_versions
+from .signals import stock_changed
+
+RETRY_ATTEMPTS = 5
+RETRY_BACKOFF = 0.01
+
+
+class StockConflict(Exception):
+    """A concurrent write changed the stock this operation relied on."""
+
+
+def _chunks(pks, size):
+    # Sorted, so concurrent reservations lock rows in the same order.
+    pks = sorted(pks)
+    size = size or len(pks)
+    for start in range(0, len(pks), size):
+        yield pks[start:start + size]
+
+
+def reserve_stock(quantities, using=DEFAULT_DB_ALIAS, chunk_size=None):
+    """
+    Take ``quantities[pk]`` units of every product or raise StockConflict.
+
+    One conditional UPDATE per distinct quantity (and chunk). Callers run
+    this in a transaction so that a conflict undoes the partial reservation.
+    """
+    by_quantity = {}
+    for pk, quantity in quantities.items():
+        by_quantity.setdefault(quantity, []).append(pk)
+    manager = Product.objects.using(using)
+    for quantity, pks in sorted(by_quantity.items()):
+        for chunk in _chunks(pks, chunk_size):
+            updated = manager.filter(pk__in=chunk, stock__gte=quantity).update(
+                stock=F('stock') - quantity, version=F('version') + 1,
+            )
+            if updated != len(chunk):
+                raise StockConflict(f"Stock of {len(chunk) - updated} product(s) changed concurrently")
+    stock_changed.send(Product, pks=list(quantities), using=using)
+
+
+def set_stock(product_id, stock, version, using=DEFAULT_DB_ALIAS):
+    """
+    Set the stock of a product last read at ``version``.
+
+    Raises StockConflict when the product changed since; returns the new
+    version otherwise.
+    """
+    updated = Product.objects.using(using).filter(pk=product_id, version=version).update(
+        stock=stock, version=F('version') + 1,
+    )
+    if not updated:
+        raise StockConflict("Product was modified concurrently")
+    bump_versions(Product, using=using)
+    stock_changed.send(Product, pks=[product_id], using=using)
+    return version + 1
+
+
+def retry_on_conflict(fn, *args, using=DEFAULT_DB_ALIAS, attempts=None, backoff=None, **kwargs):
+    """
+    Call ``fn(*args, **kwargs)`` in ``transaction.atomic``, retrying conflicts.
+
+    Lock errors (``database is locked``, deadlocks, serialization failures)
+    are only retried when no outer transaction is open: inside one, the
+    locks it already holds would make the retry fail the same way.
+    """
+    attempts = attempts or getattr(settings, 'CRM_STOCK_RETRY_ATTEMPTS', RETRY_ATTEMPTS)
+    backoff = getattr(settings, 'CRM_STOCK_RETRY_BACKOFF', RETRY_BACKOFF) if backoff is None else backoff
+    outermost = not connections[using].in_atomic_block
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic(using=using):
+                return fn(*args, **kwargs)
+        except (StockConflict, OperationalError) as error:
+            if attempt == attempts - 1 or (isinstance(error, OperationalError) and not outermost):
+                raise
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,262 @@
+"""
+GraphQL over WebSocket for the ``Subscription`` root type.
+
+``GraphQLWebSocketApp`` wraps the Django ASGI application (see ``asgi.py``)
+and serves WebSocket connections on ``CRM_SUBSCRIPTION_PATH`` with either
+the ``graphql-transport-ws`` protocol or the older ``graphql-ws`` protocol
+of subscriptions-transport-ws (used by GraphiQL), whichever the client
+offers.
+
+Subscription fields stream events from ``crm.broadcast``; each event is
+executed against the subscription's selection set in the GraphQL worker
+pool (``crm.views.graphql_executor``), like every resolver of the async
+view, so the event loop never touches the database. Queries and mutations
+sent over the socket run once and complete.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast
+from graphql.execution import create_source_event_stream
+
+from .broadcast import get_broadcast
+from .cost import analyze_operation
+from .db import read_from_replica
+from .documents import get_document, query_hash
+from .loaders import CRMLoaders
+from .views import graphql_executor
+
+GRAPHQL_TRANSPORT_WS = 'graphql-transport-ws'
+GRAPHQL_WS = 'graphql-ws'
+
+# Message types that differ between the two protocols.
+MESSAGES = {
+    GRAPHQL_TRANSPORT_WS: {'start': 'subscribe', 'stop': 'complete', 'data': 'next'},
+    GRAPHQL_WS: {'start': 'start', 'stop': 'stop', 'data': 'data'},
+}
+
+KEEPALIVE_INTERVAL = 15
+INIT_TIMEOUT = 10
+
+
+def _in_worker(fn, *args):
+    # Pool threads outlive connections: apply Django's connection lifetime
+    # rules around every call, as the async view does.
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_in_worker(fn, *args):
+    return await sync_to_async(_in_worker, thread_sensitive=False, executor=graphql_executor())(fn, *args)
+
+
+async def model_events(channel, load):
+    """Yield the objects ``load(pks)`` returns for every message on ``channel``."""
+    async for pks in get_broadcast().subscribe(channel):
+        for instance in await run_in_worker(load, pks):
+            yield instance
+
+
+def operation_context():
+    # A fresh context per execution: loaders must not cache across events.
+    return SimpleNamespace(loaders=CRMLoaders(), user=None)
+
+
+class ProtocolError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+class GraphQLWebSocket:
+    """One WebSocket connection and the operations running on it."""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.protocol = None
+        self.acknowledged = False
+        self.operations = {}
+        self.keepalive = None
+
+    async def send(self, message):
+        async with self._send_lock:
+            await self._send(message)
+
+    async def send_json(self, message):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def close(self, code=1000, reason=''):
+        await self.send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        offered = self.scope.get('subprotocols') or []
+        self.protocol = next((protocol for protocol in offered if protocol in MESSAGES), None)
+        if self.protocol is None:
+            await self.close(4406, "Subprotocol not acceptable")
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': self.protocol})
+        init_timeout = getattr(settings, 'CRM_SUBSCRIPTION_INIT_TIMEOUT', INIT_TIMEOUT)
+        try:
+            while True:
+                try:
+                    timeout = None if self.acknowledged else init_timeout
+                    message = await asyncio.wait_for(self.receive(), timeout)
+                except asyncio.TimeoutError:
+                    raise ProtocolError(4408, "Connection initialisation timeout")
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    await self.handle(message.get('text') or (message.get('bytes') or b'').decode())
+        except ProtocolError as error:
+            await self.close(error.code, error.reason)
+        finally:
+            if self.keepalive is not None:
+                self.keepalive.cancel()
+            for task in self.operations.values():
+                task.cancel()
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            kind = message['type']
+        except (ValueError, TypeError, KeyError):
+            raise ProtocolError(4400, "Invalid message")
+        messages = MESSAGES[self.protocol]
+
+        if kind == 'connection_init':
+            if self.acknowledged:
+                raise ProtocolError(4429, "Too many initialisation requests")
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+            if self.protocol == GRAPHQL_WS:
+                await self.send_json({'type': 'ka'})
+                self.keepalive = asyncio.create_task(self.send_keepalives())
+        elif kind == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif kind == 'pong':
+            pass
+        elif kind == messages['start']:
+            if not self.acknowledged:
+                raise ProtocolError(4401, "Unauthorized")
+            operation_id = message.get('id')
+            if not isinstance(operation_id, str) or not isinstance(message.get('payload'), dict):
+                raise ProtocolError(4400, "Invalid message")
+            if operation_id in self.operations:
+                raise ProtocolError(4409, f"Subscriber for {operation_id} already exists")
+            task = asyncio.create_task(self.run_operation(operation_id, message['payload']))
+            self.operations[operation_id] = task
+            task.add_done_callback(lambda task: self.forget(operation_id, task))
+        elif kind == messages['stop']:
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        elif kind == 'connection_terminate' and self.protocol == GRAPHQL_WS:
+            raise ProtocolError(1000, "")
+        else:
+            raise ProtocolError(4400, f"Unexpected message type {kind!r}")
+
+    def forget(self, operation_id, task):
+        # The id may already belong to a newer operation.
+        if self.operations.get(operation_id) is task:
+            del self.operations[operation_id]
+
+    async def send_keepalives(self):
+        interval = getattr(settings, 'CRM_SUBSCRIPTION_KEEPALIVE', KEEPALIVE_INTERVAL)
+        while True:
+            await asyncio.sleep(interval)
+            await self.send_json({'type': 'ka'})
+
+    async def send_result(self, operation_id, result):
+        payload = {'data': result.data}
+        if result.errors:
+            payload['errors'] = [GraphQLView.format_error(error) for error in result.errors]
+        await self.send_json({'type': MESSAGES[self.protocol]['data'], 'id': operation_id, 'payload': payload})
+
+    async def send_errors(self, operation_id, errors):
+        await self.send_json({
+            'type': 'error', 'id': operation_id, 'payload': [GraphQLView.format_error(error) for error in errors],
+        })
+
+    async def run_operation(self, operation_id, payload):
+        schema = graphene_settings.SCHEMA.graphql_schema
+        query = payload.get('query')
+        variables = payload.get('variables')
+        operation_name = payload.get('operationName')
+        if not isinstance(query, str):
+            await self.send_errors(operation_id, [GraphQLError("Must provide query string.")])
+            return
+        document, errors = get_document(schema, query, query_hash(query))
+        operation_ast = get_operation_ast(document, operation_name) if not errors else None
+        if not errors and operation_ast is not None:
+            errors = analyze_operation(schema, document, operation_ast, variables).errors
+        if errors:
+            await self.send_errors(operation_id, errors)
+            return
+
+        if operation_ast is None or operation_ast.operation != OperationType.SUBSCRIPTION:
+            query = operation_ast is not None and operation_ast.operation == OperationType.QUERY
+            execute = self.execute_query if query else self.execute
+            result = await run_in_worker(execute, schema, document, None, variables, operation_name)
+            await self.send_result(operation_id, result)
+        else:
+            stream = await create_source_event_stream(
+                schema, document, context_value=operation_context(),
+                variable_values=variables, operation_name=operation_name,
+            )
+            if isinstance(stream, ExecutionResult):
+                await self.send_errors(operation_id, stream.errors)
+                return
+            try:
+                async for event in stream:
+                    result = await run_in_worker(self.execute, schema, document, event, variables, operation_name)
+                    await self.send_result(operation_id, result)
+            finally:
+                await stream.aclose()
+        await self.send_json({'type': 'complete', 'id': operation_id})
+
+    @classmethod
+    def execute_query(cls, schema, document, root_value, variables, operation_name):
+        # Only queries read the replica, like in the HTTP views.
+        with read_from_replica():
+            return cls.execute(schema, document, root_value, variables, operation_name)
+
+    @staticmethod
+    def execute(schema, document, root_value, variables, operation_name):
+        return execute(
+            schema, document, root_value=root_value, context_value=operation_context(),
+            variable_values=variables, operation_name=operation_name,
+        )
+
+
+class GraphQLWebSocketApp:
+    """ASGI application: GraphQL WebSockets here, everything else to ``app``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await self.app(scope, receive, send)
+        if scope['path'] != getattr(settings, 'CRM_SUBSCRIPTION_PATH', '/graphql'):
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await GraphQLWebSocket(scope, receive, send).run()
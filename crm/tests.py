@@ -1,3 +1,1559 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from .db import ReplicaRouter, read_from_replica, replica_alias
+from .documents import PERSISTED_QUERY_KEY_PREFIX, LRUCache, document_cache, query_hash
+from .broadcast import ORDERS_CHANNEL, STOCK_CHANNEL, get_broadcast, reset_broadcast
+from .bulk import create_orders as bulk_create_orders, create_products
+from .export import export_chunks
+from .filters import CustomerFilter
+from .joblog import close_job_logs, flush_job_logs, job_logger
+from .loaders import CRMLoaders
+from .graphql_client import GraphQLClientError, HTTPClient, LocalClient, get_client, reset_client
+from .metrics import registry as metrics_registry
+from .models import Customer, CustomerDailySales, ImportCheckpoint, OrderLine, Product, ProductDailySales, Order
+from .reminders import StubSender, run_reminders
+from .reports import crm_summary, sales_series
+from .rollups import rebuild_rollups
+from .response_cache import bump_versions, response_front_cache
+from .search import (
+    IContainsBackend, SQLiteFTSBackend, check_search_backend, get_search_backend, install_search_backend,
+)
+from .stock import StockConflict, reserve_stock, retry_on_conflict
+from .subscriptions import GraphQLWebSocketApp
+from .tasks import generate_crm_report
+from .views import CRMGraphQLView
+
+
+def create_orders(count, products_per_order=2):
+    """Bulk-create ``count`` orders spread over a handful of customers."""
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com")
+        for i in range(10)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal("9.99"), stock=100)
+        for i in range(5)
+    )
+    orders = Order.objects.bulk_create(
+        Order(customer=customers[i % len(customers)], total_amount=Decimal("19.98"))
+        for i in range(count)
+    )
+    OrderLine.objects.bulk_create(
+        OrderLine(
+            order_id=order.pk, product_id=products[(i + j) % len(products)].pk,
+            unit_price=Decimal("9.99"), line_total=Decimal("9.99"),
+        )
+        for i, order in enumerate(orders)
+        for j in range(products_per_order)
+    )
+    return orders
+
+
+class GraphQLTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        document_cache.clear()
+        response_front_cache.clear()
+
+    def execute(self, query, variables=None):
+        response = self.client.post(
+            "/graphql",
+            json.dumps({"query": query, "variables": variables or {}}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+
+class OrderLoaderQueryCountTests(GraphQLTestCase):
+    ORDERS_QUERY = """
+        query ($first: Int) {
+            allOrders(first: $first) {
+                edges { node { id customer { name } products { name } lines { quantity product { id } } } }
+            }
+        }
+    """
+
+    # COUNT(*) + page of orders joined to customers + products and lines prefetches
+    EXPECTED_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        create_orders(1000)
+
+    def test_query_count_is_constant_in_page_size(self):
+        for page_size in (10, 100, 1000):
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(self.EXPECTED_QUERIES):
+                    result = self.execute(self.ORDERS_QUERY, {"first": page_size})
+                self.assertNotIn("errors", result)
+                edges = result["data"]["allOrders"]["edges"]
+                self.assertEqual(len(edges), page_size)
+
+    def test_loaders_resolve_the_right_relations(self):
+        result = self.execute(self.ORDERS_QUERY, {"first": 10})
+        for edge in result["data"]["allOrders"]["edges"]:
+            order = Order.objects.get(pk=edge["node"]["id"])
+            self.assertEqual(edge["node"]["customer"]["name"], order.customer.name)
+            self.assertEqual(
+                sorted(p["name"] for p in edge["node"]["products"]),
+                sorted(p.name for p in order.products.all()),
+            )
+
+
+class QueryOptimizerTests(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_orders(5)
+
+    def test_unselected_columns_and_relations_are_not_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute("{ allOrders(first: 5) { edges { node { id totalAmount } } } }")
+        self.assertNotIn("errors", result)
+        page_sql = queries.captured_queries[-1]["sql"]
+        self.assertIn('"crm_order"."total_amount"', page_sql)
+        self.assertNotIn('"crm_order"."order_date"', page_sql)
+        self.assertNotIn("crm_customer", page_sql)
+        self.assertEqual(len(queries), 2)
+
+    def test_fragments_are_followed(self):
+        query = """
+            query {
+                allOrders(first: 5) { edges { node { ...OrderFields } } }
+            }
+            fragment OrderFields on OrderType {
+                id
+                ... on OrderType { customer { email } }
+            }
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(query)
+        self.assertNotIn("errors", result)
+        page_sql = queries.captured_queries[-1]["sql"]
+        self.assertIn('"crm_customer"."email"', page_sql)
+        self.assertNotIn('"crm_customer"."name"', page_sql)
+        for edge in result["data"]["allOrders"]["edges"]:
+            self.assertTrue(edge["node"]["customer"]["email"].endswith("@example.com"))
+
+
+class BulkCreateCustomersTests(GraphQLTestCase):
+    MUTATION = """
+        mutation ($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) { customers { id email } errors }
+        }
+    """
+
+    def test_rows_are_validated_and_reported_in_order(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        rows = [
+            {"name": "Alice", "email": "alice@example.com", "phone": "+12345678901"},
+            {"name": "", "email": "noname@example.com"},
+            {"name": "Taken", "email": "taken@example.com"},
+            {"name": "Alice again", "email": "alice@example.com"},
+            {"name": "Bad phone", "email": "bad@example.com", "phone": "12"},
+            {"name": "Bob", "email": "bob@example.com", "phone": "123-456-7890"},
+        ]
+        result = self.execute(self.MUTATION, {"input": rows})
+        self.assertNotIn("errors", result)
+        payload = result["data"]["bulkCreateCustomers"]
+        self.assertEqual(
+            [c["email"] for c in payload["customers"]],
+            ["alice@example.com", "bob@example.com"],
+        )
+        self.assertTrue(all(c["id"] for c in payload["customers"]))
+        self.assertEqual(payload["errors"], [
+            "Row 2: Name and email required",
+            "Row 3: Email already exists",
+            "Row 4: Email already exists",
+            "Row 5: Invalid phone format",
+        ])
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_query_count_does_not_grow_per_row(self):
+        rows = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(200)]
+        # SAVEPOINT + email__in lookup + INSERT + search index INSERT + RELEASE
+        with self.assertNumQueries(5):
+            result = self.execute(self.MUTATION, {"input": rows})
+        self.assertEqual(len(result["data"]["bulkCreateCustomers"]["customers"]), 200)
+
+
+class UpdateLowStockProductsTests(GraphQLTestCase):
+    MUTATION = """
+        mutation ($threshold: Int, $increment: Int, $chunkSize: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment, chunkSize: $chunkSize) {
+                updatedProducts { id name price stock }
+                message
+                count
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("2.50"), stock=i) for i in range(25)
+        )
+
+    def test_restocks_low_stock_products_in_one_statement(self):
+        with self.assertNumQueries(3):  # SAVEPOINT + UPDATE ... RETURNING + RELEASE
+            result = self.execute(self.MUTATION)
+        payload = result["data"]["updateLowStockProducts"]
+        self.assertEqual(payload["count"], 10)
+        self.assertEqual(payload["message"], "Successfully updated 10 low-stock products")
+        self.assertEqual([p["stock"] for p in payload["updatedProducts"]], list(range(10, 20)))
+        self.assertEqual(payload["updatedProducts"][0]["price"], "2.50")
+        self.assertEqual(Product.objects.filter(stock__lt=10).count(), 0)
+
+    def test_threshold_increment_and_chunking(self):
+        result = self.execute(self.MUTATION, {"threshold": 20, "increment": 3, "chunkSize": 7})
+        payload = result["data"]["updateLowStockProducts"]
+        self.assertEqual(payload["count"], 20)
+        # Each product is restocked exactly once even though some stay below the threshold.
+        self.assertEqual(
+            [p["stock"] for p in payload["updatedProducts"]],
+            [i + 3 for i in range(20)],
+        )
+        self.assertEqual(
+            sorted(Product.objects.values_list("stock", flat=True)),
+            sorted([i + 3 for i in range(20)] + list(range(20, 25))),
+        )
+
+    def test_fallback_without_returning_matches(self):
+        with mock.patch("crm.bulk.supports_update_returning", return_value=False):
+            result = self.execute(self.MUTATION, {"chunkSize": 4})
+        payload = result["data"]["updateLowStockProducts"]
+        self.assertEqual([p["stock"] for p in payload["updatedProducts"]], list(range(10, 20)))
+
+    def test_rejects_non_positive_increment(self):
+        result = self.execute(self.MUTATION, {"increment": 0})
+        self.assertEqual(result["data"]["updateLowStockProducts"]["message"], "Increment must be positive")
+
+
+class CreateOrderTests(GraphQLTestCase):
+    CREATE = """
+        mutation ($customerId: ID!, $productIds: [ID]!) {
+            createOrder(customerId: $customerId, productIds: $productIds) {
+                order { id totalAmount customer { name } products { name } }
+                message
+            }
+        }
+    """
+    BULK_CREATE = """
+        mutation ($input: [OrderInput]!) {
+            bulkCreateOrders(input: $input) {
+                orders { id totalAmount customer { email } products { id } }
+                errors
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"), stock=5)
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal("25.50"), stock=1)
+
+    def test_creates_order_with_total_links_and_stock(self):
+        result = self.execute(self.CREATE, {
+            "customerId": self.customer.pk,
+            "productIds": [self.laptop.pk, self.mouse.pk],
+        })
+        payload = result["data"]["createOrder"]
+        self.assertEqual(payload["message"], "Order created successfully")
+        self.assertEqual(payload["order"]["totalAmount"], "1025.49")
+        self.assertEqual(payload["order"]["customer"]["name"], "Alice")
+        self.assertEqual([p["name"] for p in payload["order"]["products"]], ["Laptop", "Mouse"])
+        order = Order.objects.get(pk=payload["order"]["id"])
+        self.assertEqual(order.total_amount, Decimal("1025.49"))
+        self.laptop.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.mouse.stock), (4, 0))
+
+    def test_rejects_invalid_input_without_writing(self):
+        cases = [
+            ({"customerId": 999, "productIds": [self.laptop.pk]}, "Invalid customer ID"),
+            ({"customerId": self.customer.pk, "productIds": []}, "At least one product must be selected"),
+            ({"customerId": self.customer.pk, "productIds": [self.laptop.pk, 999]}, "One or more product IDs are invalid"),
+        ]
+        for variables, message in cases:
+            with self.subTest(message=message):
+                result = self.execute(self.CREATE, variables)
+                self.assertEqual(result["data"]["createOrder"]["message"], message)
+        self.assertEqual(Order.objects.count(), 0)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 5)
+
+    def test_bulk_create_orders(self):
+        rows = [
+            {"customerId": self.customer.pk, "productIds": [self.laptop.pk, self.mouse.pk]},
+            {"customerId": self.customer.pk, "productIds": [self.mouse.pk]},
+            {"customerId": 999, "productIds": [self.laptop.pk]},
+            {"customerId": self.customer.pk, "productIds": [self.laptop.pk]},
+        ]
+        result = self.execute(self.BULK_CREATE, {"input": rows})
+        self.assertNotIn("errors", result)
+        payload = result["data"]["bulkCreateOrders"]
+        self.assertEqual(payload["errors"], [
+            "Row 2: Insufficient stock for one or more products",
+            "Row 3: Invalid customer ID",
+        ])
+        self.assertEqual([o["totalAmount"] for o in payload["orders"]], ["1025.49", "999.99"])
+        self.assertEqual(payload["orders"][0]["customer"]["email"], "alice@example.com")
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 3)
+
+    def test_bulk_create_query_count_does_not_grow_per_row(self):
+        Product.objects.filter(pk=self.laptop.pk).update(stock=1000)
+        rows = [{"customerId": self.customer.pk, "productIds": [self.laptop.pk]} for _ in range(300)]
+        # SAVEPOINT, customers, products, stock UPDATE, orders INSERT, two
+        # order line INSERTs (SQLite's 999-parameter limit), two rollup
+        # upserts, RELEASE, then the customers and products loaders.
+        with self.assertNumQueries(12):
+            result = self.execute(self.BULK_CREATE, {"input": rows})
+        self.assertEqual(len(result["data"]["bulkCreateOrders"]["orders"]), 300)
+
+
+@override_settings(CRM_STOCK_RETRY_BACKOFF=0)
+class StockReservationTests(GraphQLTestCase):
+    CREATE = CreateOrderTests.CREATE
+    SET_STOCK = """
+        mutation ($id: ID!, $stock: Int!, $version: Int!) {
+            updateProductStock(id: $id, stock: $stock, version: $version) {
+                product { stock version }
+                message
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"), stock=5)
+        cls.mouse = Product.objects.create(name="Mouse", price=Decimal("25.50"), stock=1)
+
+    def test_short_reservation_conflicts_and_rolls_back(self):
+        with self.assertRaises(StockConflict), transaction.atomic():
+            reserve_stock({self.laptop.pk: 2, self.mouse.pk: 2})
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("stock", "version")), [(5, 0), (1, 0)]
+        )
+        reserve_stock({self.laptop.pk: 2, self.mouse.pk: 1})
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("stock", "version")), [(3, 1), (0, 1)]
+        )
+
+    def test_order_is_retried_after_a_conflict(self):
+        calls = []
+
+        def take_stock_first(quantities, **kwargs):
+            # The first attempt finds the last mouse gone between the read and
+            # the reservation; the rollback undoes that write too.
+            if not calls:
+                Product.objects.filter(pk=self.mouse.pk).update(stock=0)
+            calls.append(quantities)
+            return reserve_stock(quantities, **kwargs)
+
+        with mock.patch("crm.bulk.reserve_stock", take_stock_first):
+            result = self.execute(self.CREATE, {
+                "customerId": self.customer.pk, "productIds": [self.laptop.pk, self.mouse.pk],
+            })
+        self.assertEqual(result["data"]["createOrder"]["message"], "Order created successfully")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("stock", "version")), [(4, 1), (0, 1)]
+        )
+
+    def test_persistent_conflicts_give_up(self):
+        with mock.patch("crm.bulk.reserve_stock", side_effect=StockConflict("busy")) as reserve:
+            result = self.execute(self.CREATE, {"customerId": self.customer.pk, "productIds": [self.laptop.pk]})
+        self.assertEqual(result["errors"][0]["message"], "busy")
+        self.assertEqual(reserve.call_count, 5)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_stock_writes_compare_versions(self):
+        variables = {"id": self.laptop.pk, "stock": 50, "version": 0}
+        payload = self.execute(self.SET_STOCK, variables)["data"]["updateProductStock"]
+        self.assertEqual(payload, {"product": {"stock": 50, "version": 1}, "message": "Stock updated successfully"})
+        # A stale version loses instead of overwriting the change.
+        self.execute(self.CREATE, {"customerId": self.customer.pk, "productIds": [self.laptop.pk]})
+        payload = self.execute(self.SET_STOCK, {**variables, "version": 1})["data"]["updateProductStock"]
+        self.assertEqual(payload["message"], "Product was modified concurrently")
+        self.assertEqual(payload["product"], {"stock": 49, "version": 2})
+
+    def test_stock_write_with_a_non_numeric_id_is_not_found(self):
+        payload = self.execute(self.SET_STOCK, {"id": "abc", "stock": 5, "version": 0})["data"]["updateProductStock"]
+        self.assertEqual(payload, {"product": None, "message": "Product not found"})
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_test_mirror_is_not_a_replica(self):
+        self.assertIsNone(replica_alias())
+        with override_settings(CRM_READ_REPLICA=None):
+            self.assertIsNone(replica_alias())
+
+    @mock.patch("crm.db.replica_alias", return_value="replica")
+    def test_only_reads_in_the_replica_context_go_to_the_replica(self, _):
+        self.assertEqual(self.router.db_for_read(Order), "default")
+        self.assertEqual(self.router.db_for_read(User), "default")
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Order), "replica")
+            self.assertEqual(self.router.db_for_write(Order), "default")
+            with mock.patch.object(connection, "in_atomic_block", True):
+                self.assertEqual(self.router.db_for_read(Order), "default")
+        self.assertEqual(self.router.db_for_read(Order), "default")
+
+    def test_migrations_skip_the_replica(self):
+        self.assertTrue(self.router.allow_migrate("default", "crm"))
+        self.assertFalse(self.router.allow_migrate("replica", "crm"))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # The test replica mirrors default; made read-only, any write routed to
+    # it fails, and its queries show what the router sent there.
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.product = Product.objects.create(name="Widget", price=Decimal("1.00"), stock=3)
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        with connections["replica"].cursor() as cursor:
+            cursor.execute("PRAGMA query_only = ON")
+        self.addCleanup(connections["replica"].close)
+        patcher = mock.patch("crm.db.replica_alias", return_value="replica")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replica_is_read_only(self):
+        self.assertEqual(Product.objects.get().name, "Widget")
+        with self.assertRaises(OperationalError):
+            Product.objects.using("replica").update(stock=0)
+
+    def test_plain_orm_reads_use_the_writer(self):
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            self.assertEqual(Product.objects.get().name, "Widget")
+            self.assertFalse(User.objects.exists())
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_queries_read_the_replica_and_mutations_the_writer(self):
+        client = LocalClient()
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            data = client.execute("{ allProducts(first: 5) { edges { node { name } } } }")
+        self.assertEqual(data["allProducts"]["edges"], [{"node": {"name": "Widget"}}])
+        self.assertTrue(replica.captured_queries)
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            variables = {"id": self.product.pk, "stock": 7, "version": 0}
+            payload = client.execute(StockReservationTests.SET_STOCK, variables)
+            self.assertEqual(payload["updateProductStock"]["product"], {"stock": 7, "version": 1})
+            payload = client.execute('mutation { createCustomer(name: "Al", email: "alice@example.com") { message } }')
+            self.assertEqual(payload["createCustomer"]["message"], "Email already exists")
+        self.assertEqual(replica.captured_queries, [])
+
+
+class ExplainFiltersCommandTests(TestCase):
+    def test_indexed_filters_do_not_scan(self):
+        out = StringIO()
+        call_command("explain_filters", "--max-combination", "1", stdout=out, no_color=True)
+        output = out.getvalue()
+        for name in ("phone_pattern", "low_stock", "price__gte", "stock__lte",
+                     "order_date__gte", "total_amount__lte", "name", "search"):
+            self.assertRegex(output, rf"INDEX\s+{name}\n")
+
+
+class PhonePatternFilterTests(TestCase):
+    def test_prefix_range_only_on_sqlite(self):
+        Customer.objects.create(name="Ann", email="ann@example.com", phone="555-123-4567")
+        Customer.objects.create(name="Ben", email="ben@example.com", phone="556-000-0000")
+        queryset = CustomerFilter({"phone_pattern": "555"}, queryset=Customer.objects.all()).qs
+        self.assertNotIn("LIKE", str(queryset.query))
+        self.assertEqual([c.name for c in queryset], ["Ann"])
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            queryset = CustomerFilter({"phone_pattern": "555"}, queryset=Customer.objects.all()).qs
+            self.assertIn("LIKE", str(queryset.query))
+        self.assertEqual([c.name for c in queryset], ["Ann"])
+
+
+class SearchFilterTests(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice Johnson", email="alice@example.com")
+        cls.bob = Customer.objects.create(name="Bob Smith", email="bob@sample.org")
+        cls.laptop = Product.objects.create(name="Gaming Laptop", price=Decimal("999.99"), stock=10)
+        cls.mouse = Product.objects.create(name="Wireless Mouse", price=Decimal("25.00"), stock=10)
+        order = Order.objects.create(customer=cls.alice)
+        OrderLine.objects.create(order=order, product=cls.laptop, unit_price=Decimal("999.99"), line_total=Decimal("999.99"))
+        order = Order.objects.create(customer=cls.bob)
+        OrderLine.objects.create(order=order, product=cls.mouse, unit_price=Decimal("25.00"), line_total=Decimal("25.00"))
+        OrderLine.objects.create(order=order, product=cls.laptop, unit_price=Decimal("999.99"), line_total=Decimal("999.99"))
+
+    def names(self, field, arguments):
+        result = self.execute(f"{{ {field}({arguments}) {{ edges {{ node {{ id }} }} }} }}")
+        self.assertNotIn("errors", result)
+        return sorted(int(edge["node"]["id"]) for edge in result["data"][field]["edges"])
+
+    def test_name_filters_match_substrings_case_insensitively(self):
+        self.assertEqual(self.names("allCustomers", 'name: "JOHN"'), [self.alice.pk])
+        self.assertEqual(self.names("allProducts", 'name: "less mo"'), [self.mouse.pk])
+        self.assertEqual(self.names("allCustomers", 'email: "sample"'), [self.bob.pk])
+
+    def test_short_terms_fall_back_to_icontains(self):
+        self.assertEqual(self.names("allCustomers", 'name: "sm"'), [self.bob.pk])
+
+    def test_search_argument_spans_fields_and_relations(self):
+        self.assertEqual(self.names("allCustomers", 'search: "example"'), [self.alice.pk])
+        orders = self.names("allOrders", 'search: "laptop"')
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(len(self.names("allOrders", 'productName: "mouse"')), 1)
+        self.assertEqual(len(self.names("allOrders", 'productName: "o"')), 2)
+        self.assertEqual(len(self.names("allOrders", 'customerName: "alice"')), 1)
+
+    def test_index_follows_updates_deletes_and_bulk_inserts(self):
+        self.alice.name = "Alicia Keys"
+        self.alice.save()
+        self.assertEqual(self.names("allCustomers", 'name: "johnson"'), [])
+        self.assertEqual(self.names("allCustomers", 'name: "keys"'), [self.alice.pk])
+        self.mouse.delete()
+        self.assertEqual(self.names("allProducts", 'search: "mouse"'), [])
+        self.execute(
+            'mutation { bulkCreateCustomers(input: [{name: "Carol Danvers", email: "carol@example.com"}]) { errors } }'
+        )
+        self.assertEqual(len(self.names("allCustomers", 'name: "danvers"')), 1)
+
+    def test_falls_back_to_icontains_until_installed(self):
+        install_search_backend(uninstall=True)
+        self.addCleanup(install_search_backend)
+        self.assertIs(type(get_search_backend()), IContainsBackend)
+        self.assertEqual([w.id for w in check_search_backend(None, databases=["default"])], ["crm.W001"])
+        self.assertEqual(self.names("allCustomers", 'name: "JOHN"'), [self.alice.pk])
+        Customer.objects.create(name="Dana Scully", email="dana@example.com")
+
+        call_command("install_search_index", stdout=StringIO())
+        self.assertIs(type(get_search_backend()), SQLiteFTSBackend)
+        self.assertEqual(check_search_backend(None, databases=["default"]), [])
+        self.assertEqual(len(self.names("allCustomers", 'name: "scully"')), 1)
+        self.assertEqual(self.names("allCustomers", 'name: "JOHN"'), [self.alice.pk])
+
+
+class KeysetPaginationTests(GraphQLTestCase):
+    QUERY = """
+        query ($first: Int, $last: Int, $after: String, $before: String, $orderBy: [String]) {
+            allOrders(keyset: true, first: $first, last: $last, after: $after,
+                      before: $before, orderBy: $orderBy) {
+                edges { cursor node { id totalAmount } }
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        orders = create_orders(25)
+        # Repeated totals exercise the primary-key tie-breaker.
+        for i, order in enumerate(orders):
+            order.total_amount = Decimal(i % 5)
+        Order.objects.bulk_update(orders, ["total_amount"])
+
+    def walk(self, order_by=None, page_size=7):
+        ids, after = [], None
+        while True:
+            result = self.execute(self.QUERY, {"first": page_size, "after": after, "orderBy": order_by})
+            self.assertNotIn("errors", result)
+            connection = result["data"]["allOrders"]
+            ids += [int(edge["node"]["id"]) for edge in connection["edges"]]
+            if not connection["pageInfo"]["hasNextPage"]:
+                return ids
+            after = connection["pageInfo"]["endCursor"]
+
+    def test_forward_walk_matches_orm_ordering(self):
+        self.assertEqual(self.walk(), list(Order.objects.order_by("pk").values_list("pk", flat=True)))
+        self.assertEqual(
+            self.walk(["-totalAmount"]),
+            list(Order.objects.order_by("-total_amount", "-pk").values_list("pk", flat=True)),
+        )
+        self.assertEqual(
+            self.walk(["orderDate"], page_size=4),
+            list(Order.objects.order_by("order_date", "pk").values_list("pk", flat=True)),
+        )
+
+    def test_pages_seek_instead_of_offset_and_skip_count(self):
+        first = self.execute(self.QUERY, {"first": 10, "orderBy": ["totalAmount"]})
+        cursor = first["data"]["allOrders"]["pageInfo"]["endCursor"]
+        with CaptureQueriesContext(connection) as queries:
+            self.execute(self.QUERY, {"first": 10, "after": cursor, "orderBy": ["totalAmount"]})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("OFFSET", queries[0]["sql"])
+        self.assertNotIn("COUNT", queries[0]["sql"])
+
+    def test_backward_page(self):
+        ids = list(Order.objects.order_by("pk").values_list("pk", flat=True))
+        forward = self.execute(self.QUERY, {"first": 20})
+        before = forward["data"]["allOrders"]["edges"][-1]["cursor"]
+        result = self.execute(self.QUERY, {"last": 5, "before": before})
+        connection = result["data"]["allOrders"]
+        self.assertEqual([int(e["node"]["id"]) for e in connection["edges"]], ids[14:19])
+        self.assertTrue(connection["pageInfo"]["hasPreviousPage"])
+        self.assertTrue(connection["pageInfo"]["hasNextPage"])
+
+    def test_total_count_is_lazy_and_optionally_approximate(self):
+        query = "{ allOrders(keyset: true, first: 1) { totalCount edges { node { id } } } }"
+        self.assertEqual(self.execute(query)["data"]["allOrders"]["totalCount"], 25)
+        query = "{ allOrders(keyset: true, first: 1) { totalCount(approximate: true) } }"
+        self.assertEqual(self.execute(query)["data"]["allOrders"]["totalCount"], 25)
+
+    def test_rejects_mismatched_cursor_and_nullable_ordering(self):
+        first = self.execute(self.QUERY, {"first": 1, "orderBy": ["totalAmount"]})
+        cursor = first["data"]["allOrders"]["pageInfo"]["endCursor"]
+        result = self.execute(self.QUERY, {"first": 1, "after": cursor, "orderBy": ["orderDate"]})
+        self.assertEqual(result["errors"][0]["message"], "Cursor does not match the requested orderBy")
+        result = self.execute('{ allCustomers(keyset: true, orderBy: ["phone"]) { edges { node { id } } } }')
+        self.assertIn("nullable", result["errors"][0]["message"])
+
+    def test_order_by_applies_to_offset_pagination(self):
+        result = self.execute('{ allOrders(first: 3, orderBy: ["-totalAmount"]) { edges { node { totalAmount } } } }')
+        amounts = [edge["node"]["totalAmount"] for edge in result["data"]["allOrders"]["edges"]]
+        self.assertEqual(amounts, ["4.00", "4.00", "4.00"])
+
+
+class PersistedQueryTests(GraphQLTestCase):
+    QUERY = "{ allProducts(first: 5) { edges { node { name } } } }"
+
+    def post(self, payload):
+        return self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+
+    def persisted(self, sha256, query=None):
+        payload = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256}}}
+        if query is not None:
+            payload["query"] = query
+        return self.post(payload)
+
+    def test_register_on_miss_then_hash_only(self):
+        Product.objects.create(name="Widget", price=Decimal("1.00"), stock=1)
+        sha256 = query_hash(self.QUERY)
+        miss = self.persisted(sha256).json()
+        self.assertEqual(miss["errors"][0]["message"], "PersistedQueryNotFound")
+
+        registered = self.persisted(sha256, self.QUERY)
+        self.assertEqual(registered.status_code, 200)
+        result = self.persisted(sha256).json()
+        self.assertEqual(result["data"]["allProducts"]["edges"], [{"node": {"name": "Widget"}}])
+
+        # A fresh process only has the shared store, not the parsed document.
+        document_cache.clear()
+        self.assertEqual(self.persisted(sha256).status_code, 200)
+
+    @override_settings(CRM_PERSISTED_QUERY_TIMEOUT=60)
+    def test_only_valid_texts_are_registered_with_a_timeout(self):
+        invalid = "{ allProducts { nope } }"
+        self.assertIn("errors", self.persisted(query_hash(invalid), invalid).json())
+        self.assertIsNone(cache.get(PERSISTED_QUERY_KEY_PREFIX + query_hash(invalid)))
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.persisted(query_hash(self.QUERY), self.QUERY)
+        cache_set.assert_called_once_with(
+            PERSISTED_QUERY_KEY_PREFIX + query_hash(self.QUERY), self.QUERY, timeout=60,
+        )
+
+    def test_rejects_hash_that_does_not_match_query(self):
+        result = self.persisted("0" * 64, self.QUERY).json()
+        self.assertEqual(result["errors"][0]["message"], "provided sha does not match query")
+
+    def test_repeated_query_skips_parse_and_validate(self):
+        self.execute(self.QUERY)
+        with mock.patch("crm.documents.parse") as parse, mock.patch("crm.documents.validate") as validate:
+            self.execute(self.QUERY)
+        parse.assert_not_called()
+        validate.assert_not_called()
+        self.assertEqual(document_cache.hits, 1)
+
+    def test_invalid_documents_are_not_cached(self):
+        self.assertIn("errors", self.post({"query": "{ allProducts { nope } }"}).json())
+        self.assertEqual(len(document_cache), 0)
+
+    def test_lru_is_bounded(self):
+        cache = LRUCache(maxsize=2)
+        for key in "abc":
+            cache.set(key, key)
+        cache.get("b")
+        cache.set("d", "d")
+        self.assertEqual(list(cache._entries), ["b", "d"])
+
+
+@override_settings(CRM_RESPONSE_CACHE="default")
+class ResponseCacheTests(GraphQLTestCase):
+    PRODUCTS = "{ allProducts(first: 10) { edges { node { name stock } } } }"
+    CUSTOMERS = "{ allCustomers(first: 10) { totalCount } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Widget", price=Decimal("1.00"), stock=1)
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.execute(self.PRODUCTS)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.execute(self.PRODUCTS), first)
+        # Whitespace differences share the normalized document.
+        with self.assertNumQueries(0):
+            self.execute(" ".join(self.PRODUCTS.split()).replace("{ ", "{"))
+
+    def test_save_invalidates_only_dependent_queries(self):
+        self.execute(self.PRODUCTS)
+        self.execute(self.CUSTOMERS)
+        self.product.stock = 5
+        self.product.save()
+        with self.assertNumQueries(0):
+            self.execute(self.CUSTOMERS)
+        result = self.execute(self.PRODUCTS)
+        self.assertEqual(result["data"]["allProducts"]["edges"][0]["node"]["stock"], 5)
+
+    def test_mutations_are_not_cached_and_bump_versions(self):
+        self.execute(self.PRODUCTS)
+        mutation = """
+            mutation ($input: [OrderInput]!) { bulkCreateOrders(input: $input) { orders { id } } }
+        """
+        variables = {"input": [{"customerId": self.customer.pk, "productIds": [self.product.pk]}]}
+        self.execute(mutation, variables)
+        with CaptureQueriesContext(connection) as queries:
+            self.execute(mutation, variables)
+        self.assertGreater(len(queries), 0)
+        result = self.execute(self.PRODUCTS)
+        self.assertEqual(result["data"]["allProducts"]["edges"][0]["node"]["stock"], 0)
+
+    def test_nested_selections_depend_on_related_models(self):
+        query = "{ allOrders(first: 5) { edges { node { customer { name } products { name } } } } }"
+        order = Order.objects.create(customer=self.customer, total_amount=Decimal("1.00"))
+        self.execute(query)
+        self.customer.name = "Alicia"
+        self.customer.save()
+        node = self.execute(query)["data"]["allOrders"]["edges"][0]["node"]
+        self.assertEqual(node["customer"]["name"], "Alicia")
+        order.products.add(self.product, through_defaults={"unit_price": self.product.price, "line_total": self.product.price})
+        node = self.execute(query)["data"]["allOrders"]["edges"][0]["node"]
+        self.assertEqual(node["products"], [{"name": "Widget"}])
+
+    def test_writes_that_bypass_signals_bump_explicitly(self):
+        self.execute(self.PRODUCTS)
+        Product.objects.update(stock=7)
+        bump_versions(Product)
+        result = self.execute(self.PRODUCTS)
+        self.assertEqual(result["data"]["allProducts"]["edges"][0]["node"]["stock"], 7)
+
+
+class QueryCostTests(GraphQLTestCase):
+    ORDERS = """
+        query ($first: Int) {
+            allOrders(first: $first) { edges { node { customer { name } products { name } } } }
+        }
+    """
+
+    def post(self, query, variables=None):
+        return self.client.post(
+            "/graphql", json.dumps({"query": query, "variables": variables or {}}), content_type="application/json"
+        )
+
+    def test_cost_and_depth_are_reported(self):
+        cost = self.execute(self.ORDERS, {"first": 20})["extensions"]["cost"]
+        # 20 orders + 20 customers + 20 * CRM_QUERY_LIST_SIZE products
+        self.assertEqual(cost["requestedQueryCost"], 240)
+        self.assertEqual(cost["depth"], 5)
+        # Without first/last a connection costs its largest page.
+        cost = self.execute("{ allProducts { edges { node { name } } } }")["extensions"]["cost"]
+        self.assertEqual(cost["requestedQueryCost"], 1000)
+
+    def test_oversized_page_is_rejected_before_execution(self):
+        with self.assertNumQueries(0):
+            response = self.post(self.ORDERS, {"first": 100000})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "PAGE_SIZE_EXCEEDED")
+
+    @override_settings(CRM_QUERY_MAX_COST=100)
+    def test_costly_query_is_rejected(self):
+        response = self.post(self.ORDERS, {"first": 20})
+        self.assertEqual(response.status_code, 400)
+        result = response.json()
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "QUERY_TOO_COMPLEX")
+        self.assertEqual(result["extensions"]["cost"]["requestedQueryCost"], 240)
+        self.assertNotIn("errors", self.execute(self.ORDERS, {"first": 5}))
+
+    @override_settings(CRM_QUERY_MAX_DEPTH=4)
+    def test_deep_query_is_rejected(self):
+        response = self.post(self.ORDERS, {"first": 1})
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
+        self.assertNotIn("errors", self.execute("{ allOrders(first: 1) { edges { node { id } } } }"))
+
+    @override_settings(CRM_QUERY_COST_RATE=(500, 60), CRM_RESPONSE_CACHE=None)
+    def test_client_budget_is_throttled(self):
+        status = self.execute(self.ORDERS, {"first": 20})["extensions"]["cost"]["throttleStatus"]
+        self.assertEqual(status["currentlyAvailable"], 260)
+        self.execute(self.ORDERS, {"first": 20})
+        response = self.post(self.ORDERS, {"first": 20})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "QUERY_COST_THROTTLED")
+
+
+class BatchRequestTests(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_orders(5)
+
+    def post(self, payload):
+        return self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+
+    def test_operations_run_in_order_and_share_loaders(self):
+        batch = [
+            {"id": "a", "query": "{ hello }"},
+            {"id": "b", "query": "{ allProducts(first: 2) { totalCount edges { node { name } } } }"},
+            {"id": "c", "query": "query ($n: Int) { allOrders(first: $n) { edges { node { customer { name } } } } }",
+             "variables": {"n": 3}},
+        ]
+        with mock.patch("crm.views.CRMLoaders", wraps=CRMLoaders) as loaders:
+            response = self.post(batch)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([(r["id"], r["status"]) for r in results], [("a", 200), ("b", 200), ("c", 200)])
+        self.assertEqual(results[0]["data"], {"hello": "Hello, GraphQL!"})
+        self.assertEqual(results[1]["data"]["allProducts"]["totalCount"], 5)
+        self.assertEqual(len(results[2]["data"]["allOrders"]["edges"]), 3)
+        self.assertEqual(loaders.call_count, 1)
+
+    def test_mutations_get_fresh_loaders(self):
+        customer = Customer.objects.first()
+        batch = [
+            {"query": "{ allOrders(first: 1) { edges { node { customer { name } } } } }"},
+            {"query": f'mutation {{ createCustomer(name: "Zed", email: "zed@example.com") {{ message }} }}'},
+            {"query": "{ allCustomers(first: 1) { totalCount } }"},
+        ]
+        with mock.patch("crm.views.CRMLoaders", wraps=CRMLoaders) as loaders:
+            results = self.post(batch).json()
+        self.assertEqual(results[0]["data"]["allOrders"]["edges"][0]["node"]["customer"]["name"], customer.name)
+        self.assertEqual(results[2]["data"]["allCustomers"]["totalCount"], 11)
+        self.assertEqual(loaders.call_count, 2)
+
+    def test_errors_are_reported_per_operation(self):
+        results = self.post([{"query": "{ hello }"}, {"query": "{ nope }"}])
+        self.assertEqual(results.status_code, 400)
+        first, second = results.json()
+        self.assertEqual((first["status"], first["data"]), (200, {"hello": "Hello, GraphQL!"}))
+        self.assertEqual(second["status"], 400)
+        self.assertIn("nope", second["errors"][0]["message"])
+
+    @override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_rejects_oversized_empty_and_malformed_batches(self):
+        cases = [
+            ([{"query": "{ hello }"}] * 3, "Batch of 3 operations exceeds the limit of 2."),
+            ([], "Received an empty list in the batch request."),
+            (["{ hello }"], "Every operation of a batch must be a JSON object."),
+        ]
+        for payload, message in cases:
+            with self.subTest(message=message):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["errors"][0]["message"], message)
+
+
+class TracingTests(GraphQLTestCase):
+    QUERY = "{ allOrders(first: 5) { edges { node { id customer { name } } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_orders(5)
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.clear()
+
+    def traced(self, query):
+        payload = {"query": query, "extensions": {"tracing": True}}
+        response = self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+        return response.json()
+
+    @override_settings(CRM_TRACING_IN_RESPONSE=True, CRM_TRACING_SAMPLE_RATE=0)
+    def test_requested_trace_is_returned(self):
+        with CaptureQueriesContext(connection) as queries:
+            tracing = self.traced(self.QUERY)["extensions"]["tracing"]
+        self.assertEqual(tracing["version"], 1)
+        self.assertGreater(tracing["parsing"]["duration"], 0)
+        self.assertEqual(tracing["sql"]["count"], len(queries))
+        resolvers = {".".join(map(str, r["path"])): r for r in tracing["execution"]["resolvers"]}
+        self.assertEqual(resolvers["allOrders"]["parentType"], "Query")
+        self.assertGreater(resolvers["allOrders"]["sqlCount"], 0)
+        self.assertIn("allOrders.edges.0.node.customer", resolvers)
+
+    @override_settings(CRM_TRACING_IN_RESPONSE=False, CRM_TRACING_SAMPLE_RATE=0)
+    def test_unsampled_operations_are_not_traced(self):
+        with mock.patch("crm.tracing.TracingMiddleware.resolve") as resolve:
+            result = self.traced(self.QUERY)
+        resolve.assert_not_called()
+        self.assertNotIn("tracing", result["extensions"])
+
+    @override_settings(CRM_TRACING_IN_RESPONSE=False, CRM_TRACING_SAMPLE_RATE=1)
+    def test_sampled_operations_feed_metrics(self):
+        self.execute(self.QUERY)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('crm_graphql_resolver_duration_seconds_count{field="Query.allOrders"} 1\n', body)
+        self.assertIn('crm_graphql_operation_duration_seconds_bucket{le="+Inf"} 1\n', body)
+        self.assertIn('crm_graphql_resolver_sql_queries_total{field="Query.allOrders"}', body)
+
+
+class GraphQLClientTests(TestCase):
+    def tearDown(self):
+        reset_client()
+
+    def test_default_client_runs_in_process(self):
+        create_orders(3)
+        client = get_client()
+        self.assertIsInstance(client, LocalClient)
+        self.assertIs(get_client(), client)
+        self.assertEqual(client.execute("{ hello }"), {"hello": "Hello, GraphQL!"})
+        # COUNT(*) + orders joined to customers, batched as over HTTP.
+        with self.assertNumQueries(2):
+            data = client.execute("{ allOrders(first: 3) { edges { node { customer { name } } } } }")
+        self.assertEqual(len(data["allOrders"]["edges"]), 3)
+
+    def test_errors_raise(self):
+        with self.assertRaises(GraphQLClientError):
+            get_client().execute("{ nope }")
+
+    @override_settings(CRM_GRAPHQL_URL="http://crm.invalid/graphql")
+    def test_http_client_reuses_its_session_and_validates_locally(self):
+        client = get_client()
+        self.assertIsInstance(client, HTTPClient)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"data": {"hello": "Hello, GraphQL!"}}
+        with mock.patch.object(client.session, "post", return_value=response) as post:
+            self.assertEqual(client.execute("{ hello }"), {"hello": "Hello, GraphQL!"})
+            client.execute("{ hello }")
+            with self.assertRaises(GraphQLClientError):
+                client.execute("{ nope }")
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args.kwargs["json"], {"query": "{ hello }", "variables": {}})
+
+    @override_settings(CRM_GRAPHQL_URL="http://crm.invalid/graphql")
+    def test_http_client_retries_gateway_errors_for_queries_only(self):
+        client = get_client()
+        bad_gateway = mock.Mock(status_code=502)
+        bad_gateway.json.side_effect = ValueError
+        bad_gateway.raise_for_status.side_effect = RuntimeError("502")
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = {"data": {"hello": "Hello, GraphQL!"}}
+        with mock.patch("crm.graphql_client.time.sleep"):
+            with mock.patch.object(client.session, "post", side_effect=[bad_gateway, ok]) as post:
+                self.assertEqual(client.execute("{ hello }"), {"hello": "Hello, GraphQL!"})
+            self.assertEqual(post.call_count, 2)
+            mutation = 'mutation { createCustomer(name: "Zed", email: "zed@example.com") { message } }'
+            with mock.patch.object(client.session, "post", return_value=bad_gateway) as post:
+                with self.assertRaises(RuntimeError):
+                    client.execute(mutation)
+            self.assertEqual(post.call_count, 1)
+
+
+class OrderRemindersTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state = os.path.join(tmp.name, "state.json")
+
+    def run_reminders(self, sender, client=None, **kwargs):
+        log = logging.getLogger("crm.tests.reminders")
+        kwargs.setdefault("page_size", 4)
+        with self.assertLogs(log) as logs:
+            result = run_reminders(self.state, log, client=client or LocalClient(), sender=sender, **kwargs)
+        return result, "\n".join(logs.output)
+
+    def test_one_reminder_per_customer_then_only_new_orders(self):
+        orders = create_orders(25)
+        old = orders[0]
+        Order.objects.filter(pk=old.pk).update(order_date=timezone.now() - timedelta(days=30))
+        sender = StubSender()
+        (count, sent, failed), log = self.run_reminders(sender, page_size=50)
+        self.assertEqual((count, sent, failed), (24, 10, 0))
+        self.assertEqual(len({reminder["customer_id"] for reminder in sender.sent}), 10)
+        self.assertEqual(sum(len(reminder["order_ids"]) for reminder in sender.sent), 24)
+        self.assertEqual(log.count("Reminder for"), 10)
+
+        self.assertEqual(self.run_reminders(StubSender())[0], (0, 0, 0))
+        Order.objects.create(customer=old.customer, total_amount=Decimal("5.00"))
+        sender = StubSender()
+        self.assertEqual(self.run_reminders(sender)[0], (1, 1, 0))
+        self.assertEqual(sender.sent[0]["total"], Decimal("5.00"))
+
+    def test_failed_sends_are_logged(self):
+        create_orders(3)
+        sender = mock.Mock()
+        sender.send.side_effect = RuntimeError("mailbox full")
+        (count, sent, failed), log = self.run_reminders(sender, workers=2)
+        self.assertEqual((count, sent, failed), (3, 0, 3))
+        self.assertEqual(log.count("FAILED: mailbox full"), 3)
+
+    def test_failed_reminders_are_retried_on_the_next_run(self):
+        create_orders(3)
+
+        def send(reminder):
+            if reminder["email"] == "customer1@example.com":
+                raise RuntimeError("mailbox full")
+
+        sender = mock.Mock()
+        sender.send.side_effect = send
+        self.assertEqual(self.run_reminders(sender)[0], (3, 2, 1))
+        # Only the failed reminder is sent again.
+        sender = StubSender()
+        self.assertEqual(self.run_reminders(sender)[0], (1, 1, 0))
+        self.assertEqual([r["email"] for r in sender.sent], ["customer1@example.com"])
+        self.assertEqual(self.run_reminders(StubSender())[0], (0, 0, 0))
+
+    def test_late_orders_within_the_safety_window_are_found(self):
+        orders = create_orders(2)
+        self.assertEqual(self.run_reminders(StubSender())[0], (2, 2, 0))
+        # Committed after the run, but dated before the newest order it saw.
+        Order.objects.create(customer=orders[0].customer, order_date=orders[1].order_date - timedelta(minutes=1))
+        sender = StubSender()
+        self.assertEqual(self.run_reminders(sender)[0], (1, 1, 0))
+        self.assertEqual(sender.sent[0]["customer_id"], str(orders[0].customer_id))
+
+    def test_each_page_is_sent_before_the_next_is_fetched(self):
+        create_orders(8)
+        client = LocalClient()
+        fetched = []
+        execute = client.execute
+        client.execute = lambda *args: fetched.append(1) or execute(*args)
+        pages_at_send = []
+        sender = mock.Mock()
+        sender.send.side_effect = lambda reminder: pages_at_send.append(len(fetched))
+        self.assertEqual(self.run_reminders(sender, client=client, workers=1)[0], (8, 8, 0))
+        self.assertEqual(pages_at_send, [1, 1, 1, 1, 2, 2, 2, 2])
+
+
+class JobLogTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        close_job_logs()
+        self.addCleanup(close_job_logs)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read()
+
+    def test_writes_are_buffered_until_flushed(self):
+        with override_settings(CRM_JOB_LOG_DIR=self.dir, CRM_JOB_LOG_FLUSH_INTERVAL=3600):
+            log = job_logger("heartbeat")
+            with mock.patch("builtins.open") as opened:
+                for _ in range(100):
+                    log.info("CRM is alive")
+            opened.assert_not_called()
+            self.assertEqual(self.read("crm_heartbeat_log.txt"), "")
+            flush_job_logs()
+        lines = self.read("crm_heartbeat_log.txt").splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertRegex(lines[0], r"^\d\d/\d\d/\d{4}-\d\d:\d\d:\d\d CRM is alive$")
+
+    def test_rotates_by_size(self):
+        with override_settings(CRM_JOB_LOG_DIR=self.dir, CRM_JOB_LOG_MAX_BYTES=1000, CRM_JOB_LOG_BACKUP_COUNT=2):
+            log = job_logger("low_stock")
+            for i in range(200):
+                log.info(f"Restocked product {i}")
+            close_job_logs()
+        names = sorted(os.listdir(self.dir))
+        self.assertEqual(names, ["low_stock_updates_log.txt", "low_stock_updates_log.txt.1", "low_stock_updates_log.txt.2"])
+        for name in names:
+            self.assertLess(os.path.getsize(os.path.join(self.dir, name)), 1100)
+        self.assertIn("Restocked product 199", self.read("low_stock_updates_log.txt"))
+
+    def test_size_counts_bytes_of_non_ascii_lines(self):
+        with override_settings(CRM_JOB_LOG_DIR=self.dir, CRM_JOB_LOG_MAX_BYTES=1000, CRM_JOB_LOG_BACKUP_COUNT=5):
+            log = job_logger("low_stock")
+            for i in range(60):
+                log.info(f"Réassort du produit {i} – ✓✓✓")
+            close_job_logs()
+        for name in os.listdir(self.dir):
+            self.assertLess(os.path.getsize(os.path.join(self.dir, name)), 1100)
+
+    def test_rotates_by_time_period(self):
+        with override_settings(CRM_JOB_LOG_DIR=self.dir, CRM_JOB_LOG_ROTATE_INTERVAL=60, CRM_JOB_LOG_BACKUP_COUNT=1):
+            log = job_logger("report")
+            log.info("first")
+            with mock.patch("crm.joblog.time.time", return_value=time.time() + 120):
+                log.info("second")
+            close_job_logs()
+        self.assertIn("first", self.read("crm_report_log.txt.1"))
+        self.assertIn("second", self.read("crm_report_log.txt"))
+
+    def test_json_lines(self):
+        with override_settings(CRM_JOB_LOG_DIR=self.dir, CRM_JOB_LOG_FORMAT="json"):
+            job_logger("report").info("Report", extra={"fields": {"revenue": Decimal("10.35")}})
+            close_job_logs()
+        entry = json.loads(self.read("crm_report_log.txt"))
+        self.assertEqual(
+            {key: entry[key] for key in ("job", "level", "message", "revenue")},
+            {"job": "report", "level": "info", "message": "Report", "revenue": "10.35"},
+        )
+
+
+class CRMSummaryTests(GraphQLTestCase):
+    QUERY = """
+        query ($groupBy: SummaryGroupBy) {
+            crmSummary(groupBy: $groupBy) {
+                customerCount orderCount revenue
+                groups { key label orderCount revenue }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        Customer.objects.create(name="Carol", email="carol@example.com")
+        amounts = [(alice, "2024-01-01", "0.10"), (alice, "2024-01-02", "0.20"), (bob, "2024-01-09", "10.05")]
+        orders = Order.objects.bulk_create(
+            Order(customer=customer, total_amount=Decimal(amount)) for customer, _, amount in amounts
+        )
+        # order_date is auto_now_add, so backdate with an update.
+        for order, (_, day, _) in zip(orders, amounts):
+            Order.objects.filter(pk=order.pk).update(order_date=f"{day}T12:00:00Z")
+
+    def test_totals_are_exact_and_cost_constant_queries(self):
+        with self.assertNumQueries(2):
+            summary = crm_summary()
+        self.assertEqual(summary["customer_count"], 3)
+        self.assertEqual(summary["order_count"], 3)
+        self.assertEqual(summary["customers_with_orders"], 2)
+        self.assertEqual(summary["revenue"], Decimal("10.35"))
+
+    def test_grouped_by_week_and_customer(self):
+        result = self.execute(self.QUERY, {"groupBy": "WEEK"})["data"]["crmSummary"]
+        self.assertEqual(result["revenue"], "10.35")
+        self.assertEqual(
+            [(g["key"], g["orderCount"], g["revenue"]) for g in result["groups"]],
+            [("2024-01-01", 2, "0.30"), ("2024-01-08", 1, "10.05")],
+        )
+        result = self.execute(self.QUERY, {"groupBy": "CUSTOMER"})["data"]["crmSummary"]
+        self.assertEqual([(g["label"], g["orderCount"]) for g in result["groups"]], [("Alice", 2), ("Bob", 1)])
+
+    def test_report_task_uses_aggregates(self):
+        with self.assertLogs("crm.jobs.report") as logs:
+            line = generate_crm_report()
+        self.assertIn("3 customers, 3 orders, 10.35 revenue", line)
+        self.assertEqual(logs.records[0].fields["revenue"], Decimal("10.35"))
+
+
+class SalesRollupTests(GraphQLTestCase):
+    CREATE_ORDER = """
+        mutation ($customerId: ID!, $productIds: [ID]!) {
+            createOrder(customerId: $customerId, productIds: $productIds) { message }
+        }
+    """
+    SERIES = """
+        query ($productId: ID) {
+            salesSeries(interval: MONTH, productId: $productId) { period orderCount revenue units }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.pen = Product.objects.create(name="Pen", price=Decimal("1.50"), stock=10)
+        cls.ink = Product.objects.create(name="Ink", price=Decimal("4.25"), stock=10)
+
+    def create_order(self, *products):
+        variables = {"customerId": self.alice.pk, "productIds": [p.pk for p in products]}
+        return self.execute(self.CREATE_ORDER, variables)["data"]["createOrder"]["message"]
+
+    def test_create_order_updates_rollups_incrementally(self):
+        self.create_order(self.pen, self.ink)
+        self.create_order(self.pen)
+        self.assertEqual(self.create_order(self.pen, self.pen), "One or more product IDs are invalid")
+        customer = CustomerDailySales.objects.get()
+        self.assertEqual(
+            (customer.customer_id, customer.order_count, customer.revenue, customer.units),
+            (self.alice.pk, 2, Decimal("7.25"), 3),
+        )
+        pen = ProductDailySales.objects.get(product=self.pen)
+        self.assertEqual((pen.order_count, pen.revenue, pen.units), (2, Decimal("3.00"), 2))
+
+        series = self.execute(self.SERIES)["data"]["salesSeries"]
+        self.assertEqual([(p["orderCount"], p["revenue"], p["units"]) for p in series], [(2, "7.25", 3)])
+        series = self.execute(self.SERIES, {"productId": self.ink.pk})["data"]["salesSeries"]
+        self.assertEqual([(p["orderCount"], p["revenue"]) for p in series], [(1, "4.25")])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_order(self.pen, self.ink)
+        self.create_order(self.ink)
+        incremental = sales_series("day")
+        CustomerDailySales.objects.all().delete()
+        ProductDailySales.objects.update(units=0)
+        out = StringIO()
+        call_command("rebuild_rollups", stdout=out)
+        self.assertIn("Rebuilt rollups", out.getvalue())
+        self.assertEqual(sales_series("day"), incremental)
+        self.assertEqual(sales_series("day", product_id=self.ink.pk)[0]["units"], 2)
+
+    def test_rebuild_only_touches_the_requested_range(self):
+        self.create_order(self.pen)
+        today = CustomerDailySales.objects.get().day
+        written = rebuild_rollups(start=today.replace(year=today.year - 1), end=today)
+        self.assertEqual(written[CustomerDailySales], 0)
+        self.assertEqual(CustomerDailySales.objects.count(), 1)
+
+    def test_order_lines_keep_the_price_sold_at(self):
+        self.create_order(self.pen, self.ink)
+        Product.objects.filter(pk=self.pen.pk).update(price=Decimal("9.00"))
+        bump_versions(Product)
+        OrderLine.objects.filter(product=self.pen).update(quantity=3, line_total=Decimal("4.50"))
+        result = self.execute(
+            "{ allOrders(first: 1) { edges { node { lines { product { name } quantity unitPrice lineTotal } } } } }"
+        )
+        lines = result["data"]["allOrders"]["edges"][0]["node"]["lines"]
+        self.assertEqual(lines, [
+            {"product": {"name": "Pen"}, "quantity": 3, "unitPrice": "1.50", "lineTotal": "4.50"},
+            {"product": {"name": "Ink"}, "quantity": 1, "unitPrice": "4.25", "lineTotal": "4.25"},
+        ])
+        rebuild_rollups()
+        pen = ProductDailySales.objects.get(product=self.pen)
+        self.assertEqual((pen.revenue, pen.units), (Decimal("4.50"), 3))
+        self.assertEqual(CustomerDailySales.objects.get().units, 4)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders = create_orders(25)
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_requires_a_staff_user(self):
+        self.client.logout()
+        response = self.client.get("/export/customers")
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/admin/login/", response["Location"])
+        self.client.force_login(User.objects.create_user("clerk"))
+        self.assertEqual(self.client.get("/export/customers").status_code, 302)
+
+    def test_ndjson_stream_applies_filters(self):
+        Customer.objects.create(name="Zelda", email="zelda@example.com", phone="555-123-4567")
+        response = self.client.get("/export/customers", {"search": "zeld"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Zelda"])
+        self.assertEqual(set(rows[0]), {"id", "name", "email", "phone"})
+
+    def test_ndjson_keeps_full_timestamp_precision(self):
+        order = self.orders[0]
+        order_date = timezone.now().replace(microsecond=123456)
+        Order.objects.filter(pk=order.pk).update(order_date=order_date)
+        response = self.client.get("/export/orders", {"format": "ndjson"})
+        rows = {row["id"]: row for row in map(json.loads, b"".join(response.streaming_content).splitlines())}
+        self.assertEqual(datetime.fromisoformat(rows[order.pk]["order_date"]), order_date)
+
+    def test_gzipped_csv_with_product_ids(self):
+        response = self.client.get("/export/orders", {"format": "csv", "gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        text = gzip.decompress(b"".join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(text.splitlines()))
+        self.assertEqual(len(rows), 25)
+        expected = sorted(self.orders[0].products.values_list("pk", flat=True))
+        self.assertEqual(sorted(map(int, rows[0]["product_ids"].split())), expected)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get("/export/invoices").status_code, 404)
+        self.assertEqual(self.client.get("/export/orders", {"format": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get("/export/orders", {"total_amount__gte": "x"}).status_code, 400)
+
+    def test_queries_per_chunk_are_constant(self):
+        # One streamed orders query plus one through-table query per chunk.
+        with self.assertNumQueries(4):
+            chunks = list(export_chunks("orders", chunk_size=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orders.ndjson")
+            out = StringIO()
+            call_command("export_crm", "orders", "--output", path, "--filter", "total_amount__gte=3", stdout=out)
+            with open(path) as exported:
+                rows = [json.loads(line) for line in exported]
+        self.assertIn("Wrote", out.getvalue())
+        self.assertTrue(rows)
+        self.assertTrue(all(Decimal(row["total_amount"]) >= 3 for row in rows))
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt") as output:
+            output.write(text)
+        return path
+
+    def import_crm(self, *args):
+        out = StringIO()
+        call_command("import_crm", *args, stdout=out)
+        return out.getvalue()
+
+    def test_customers_are_validated_and_rejects_go_to_sidecar(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        path = self.write("customers.csv", "\n".join([
+            "name,email,phone",
+            "Ann,ann@example.com,+12345678901",
+            "Dup,taken@example.com,",
+            "Bad,bad@example.com,12",
+            "Ben,ben@example.com,",
+        ]))
+        output = self.import_crm("customers", path)
+        self.assertIn("Imported 2 customers, rejected 2", output)
+        self.assertIn("rows/s", output)
+        self.assertIsNone(Customer.objects.get(email="ben@example.com").phone)
+        with open(path + ".errors.ndjson") as errors:
+            rejected = [json.loads(line) for line in errors]
+        self.assertEqual(
+            [(row["row"], row["error"]) for row in rejected],
+            [(2, "Email already exists"), (3, "Invalid phone format")],
+        )
+
+    def test_products_resume_after_the_last_committed_chunk(self):
+        rows = [{"name": f"P{i}", "price": "2.50", "stock": i} for i in range(10)]
+        rows[4]["price"] = "0"
+        path = self.write("products.ndjson.gz", "".join(json.dumps(row) + "\n" for row in rows))
+        calls = []
+
+        def fail_on_third_chunk(chunk, chunk_size):
+            calls.append(len(chunk))
+            if len(calls) == 3:
+                raise RuntimeError("worker killed")
+            return create_products(chunk, chunk_size)
+
+        with mock.patch("crm.importer.create_products", fail_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                self.import_crm("products", path, "--chunk-size", "3")
+        self.assertEqual(ImportCheckpoint.objects.get().rows, 6)
+        self.assertEqual(Product.objects.count(), 5)
+
+        output = self.import_crm("products", path, "--chunk-size", "3")
+        self.assertIn("Imported 9 products, rejected 1", output)
+        self.assertEqual(Product.objects.count(), 9)
+        self.assertEqual(sorted(Product.objects.values_list("stock", flat=True)), [0, 1, 2, 3, 5, 6, 7, 8, 9])
+        self.assertIn("Imported 9 products", self.import_crm("products", path))
+
+    def test_historical_orders_keep_their_date_and_stock(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        product = Product.objects.create(name="Pen", price=Decimal("1.50"), stock=0)
+        path = self.write("orders.csv", "\n".join([
+            "customer_id,product_ids,order_date",
+            f"{customer.pk},{product.pk},2021-03-04T10:00:00+00:00",
+            f"{customer.pk},{product.pk},not-a-date",
+        ]))
+        self.assertIn("Imported 1 orders, rejected 1", self.import_crm("orders", path))
+        order = Order.objects.get()
+        self.assertEqual(order.order_date.year, 2021)
+        self.assertEqual(order.total_amount, Decimal("1.50"))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(str(CustomerDailySales.objects.get().day), "2021-03-04")
+
+
+class AsyncGraphQLViewTests(TransactionTestCase):
+    # Workers use their own connections, so test data must be committed.
+
+    def setUp(self):
+        cache.clear()
+        response_front_cache.clear()
+        Product.objects.create(name="Widget", price=Decimal("1.00"), stock=3)
+
+    async def post(self, client, query):
+        response = await client.post(
+            "/graphql/async", json.dumps({"query": query}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_queries_and_mutations_run_in_the_worker_pool(self):
+        threads = []
+        original = CRMGraphQLView.get_context
+
+        def record_thread(view, request):
+            threads.append(threading.current_thread().name)
+            return original(view, request)
+
+        async def run():
+            client = AsyncClient()
+            created = await self.post(
+                client, 'mutation { createProduct(name: "Gadget", price: "2.50", stock: 1) { message } }'
+            )
+            results = await asyncio.gather(*(
+                self.post(client, "{ allProducts(orderBy: [\"name\"]) { edges { node { name } } } }")
+                for _ in range(5)
+            ))
+            return created, results
+
+        with mock.patch.object(CRMGraphQLView, "get_context", record_thread):
+            created, results = asyncio.run(run())
+        self.assertEqual(created["data"]["createProduct"]["message"], "Product created successfully")
+        for result in results:
+            names = [edge["node"]["name"] for edge in result["data"]["allProducts"]["edges"]]
+            self.assertEqual(names, ["Gadget", "Widget"])
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith("crm-graphql") for name in threads))
+
+
+class WebSocketClient:
+    """Drives an ASGI WebSocket application in-process."""
+
+    def __init__(self, app, path="/graphql", subprotocols=("graphql-transport-ws",)):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "subprotocols": list(subprotocols), "headers": []}
+        self.task = asyncio.create_task(app(scope, self.inbox.get, self.outbox.put))
+
+    async def connect(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        return await self.receive()
+
+    async def send_json(self, message):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), 5)
+
+    async def receive_json(self):
+        return json.loads((await self.receive())["text"])
+
+    async def disconnect(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+async def wait_until(predicate):
+    for _ in range(500):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+class SubscriptionTests(TransactionTestCase):
+    # Events are executed by pool workers on their own connections.
+
+    def setUp(self):
+        reset_broadcast()
+        cache.clear()
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.widget = Product.objects.create(name="Widget", price=Decimal("1.00"), stock=3)
+        self.gadget = Product.objects.create(name="Gadget", price=Decimal("2.50"), stock=10)
+        self.app = GraphQLWebSocketApp(None)
+
+    def test_order_and_stock_events_are_pushed(self):
+        def place_order():
+            retry_on_conflict(bulk_create_orders, [
+                {"customer_id": self.customer.pk, "product_ids": [self.widget.pk, self.gadget.pk]},
+            ])
+
+        async def run():
+            broadcast = get_broadcast()
+            ws = WebSocketClient(self.app)
+            accepted = await ws.connect()
+            self.assertEqual(accepted, {"type": "websocket.accept", "subprotocol": "graphql-transport-ws"})
+            await ws.send_json({"type": "connection_init"})
+            self.assertEqual(await ws.receive_json(), {"type": "connection_ack"})
+            await ws.send_json({"id": "orders", "type": "subscribe", "payload": {
+                "query": "subscription { orderCreated { totalAmount customer { name } lines { quantity } } }",
+            }})
+            await ws.send_json({"id": "stock", "type": "subscribe", "payload": {
+                "query": "subscription ($t: Int) { stockChanged(threshold: $t) { name stock } }",
+                "variables": {"t": 3},
+            }})
+            await wait_until(lambda: broadcast.subscribers(ORDERS_CHANNEL) and broadcast.subscribers(STOCK_CHANNEL))
+
+            await sync_to_async(place_order, thread_sensitive=False)()
+            pushed = sorted([await ws.receive_json(), await ws.receive_json()], key=lambda m: m["id"])
+            self.assertEqual(pushed, [
+                {"id": "orders", "type": "next", "payload": {"data": {"orderCreated": {
+                    "totalAmount": "3.50", "customer": {"name": "Alice"}, "lines": [{"quantity": 1}] * 2,
+                }}}},
+                # Gadget changed too, but is not below the threshold.
+                {"id": "stock", "type": "next", "payload": {"data": {"stockChanged": {"name": "Widget", "stock": 2}}}},
+            ])
+
+            await ws.send_json({"id": "orders", "type": "complete"})
+            await wait_until(lambda: not broadcast.subscribers(ORDERS_CHANNEL))
+            await ws.disconnect()
+            await wait_until(lambda: not broadcast.subscribers(STOCK_CHANNEL))
+
+        asyncio.run(run())
+
+    def test_graphql_ws_protocol_queries_and_errors(self):
+        async def run():
+            ws = WebSocketClient(self.app, subprotocols=["graphql-ws"])
+            self.assertEqual((await ws.connect())["subprotocol"], "graphql-ws")
+            await ws.send_json({"type": "connection_init", "payload": {}})
+            self.assertEqual(await ws.receive_json(), {"type": "connection_ack"})
+            self.assertEqual(await ws.receive_json(), {"type": "ka"})
+            await ws.send_json({"id": "1", "type": "start", "payload": {"query": "{ hello }"}})
+            self.assertEqual(await ws.receive_json(), {
+                "id": "1", "type": "data", "payload": {"data": {"hello": "Hello, GraphQL!"}},
+            })
+            self.assertEqual(await ws.receive_json(), {"id": "1", "type": "complete"})
+            await ws.send_json({"id": "2", "type": "start", "payload": {"query": "subscription { nope }"}})
+            error = await ws.receive_json()
+            self.assertEqual((error["id"], error["type"]), ("2", "error"))
+            self.assertIn("nope", error["payload"][0]["message"])
+            await ws.send_json({"type": "connection_terminate"})
+            self.assertEqual((await ws.receive())["type"], "websocket.close")
+            await ws.disconnect()
+
+        asyncio.run(run())
+
+    def test_protocol_violations_close_the_socket(self):
+        async def close_code(subprotocols, *messages, path="/graphql"):
+            ws = WebSocketClient(self.app, path=path, subprotocols=subprotocols)
+            response = await ws.connect()
+            if response["type"] == "websocket.accept":
+                for message in messages:
+                    await ws.send_json(message)
+                response = await ws.receive()
+                while response["type"] != "websocket.close":
+                    response = await ws.receive()
+            await ws.disconnect()
+            return response["code"]
+
+        async def run():
+            subscribe = {"id": "1", "type": "subscribe", "payload": {"query": "{ hello }"}}
+            self.assertEqual(await close_code(["graphql-transport-ws"], path="/other"), 4404)
+            self.assertEqual(await close_code(["chat"]), 4406)
+            self.assertEqual(await close_code(["graphql-transport-ws"], subscribe), 4401)
+            init = {"type": "connection_init"}
+            self.assertEqual(await close_code(["graphql-transport-ws"], init, init), 4429)
+            self.assertEqual(await close_code(["graphql-transport-ws"], {"type": "bogus"}), 4400)
+
+        asyncio.run(run())
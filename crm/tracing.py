@@ -0,0 +1,162 @@
+"""
+Sampled tracing of GraphQL operations.
+
+A traced operation records how long parsing, validation and every
+resolver took, and how many SQL queries (and how much SQL time) each
+resolver caused, using a ``connection.execute_wrapper``. The results feed
+the histograms served by ``/metrics``. When ``CRM_TRACING_IN_RESPONSE`` is
+on, a client can also send ``extensions: {"tracing": true}`` to get an
+Apollo-tracing-style report under ``extensions.tracing`` of the response.
+
+Only ``CRM_TRACING_SAMPLE_RATE`` of the operations (plus the ones that ask
+for a report) are traced; the rest run without the middleware or the SQL
+wrapper, so tracing costs nothing for them.
+"""
+
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .metrics import registry
+
+OPERATION_DURATION = registry.histogram(
+    'crm_graphql_operation_duration_seconds', "Duration of traced GraphQL operations.",
+)
+OPERATION_SQL_QUERIES = registry.histogram(
+    'crm_graphql_operation_sql_queries', "SQL queries per traced GraphQL operation.",
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100, 250),
+)
+OPERATION_ERRORS = registry.counter(
+    'crm_graphql_operation_errors_total', "Traced GraphQL operations that returned errors.",
+)
+RESOLVER_DURATION = registry.histogram(
+    'crm_graphql_resolver_duration_seconds', "Duration of resolvers in traced operations.", ('field',),
+)
+RESOLVER_SQL_QUERIES = registry.counter(
+    'crm_graphql_resolver_sql_queries_total', "SQL queries run by resolvers in traced operations.", ('field',),
+)
+RESOLVER_SQL_SECONDS = registry.counter(
+    'crm_graphql_resolver_sql_seconds_total', "SQL time of resolvers in traced operations.", ('field',),
+)
+
+APOLLO_TRACING_VERSION = 1
+
+
+def start_trace(request, extensions):
+    """Return a Tracer when this operation is sampled or asks for tracing."""
+    in_response = getattr(settings, 'CRM_TRACING_IN_RESPONSE', False) and bool(
+        (extensions or {}).get('tracing')
+    )
+    rate = getattr(settings, 'CRM_TRACING_SAMPLE_RATE', 0)
+    if not in_response and not (rate and random.random() < rate):
+        return None
+    return Tracer(in_response)
+
+
+class Tracer:
+    """Timings of one operation; offsets and durations are in nanoseconds."""
+
+    def __init__(self, in_response=False):
+        self.in_response = in_response
+        self.start_time = timezone.now()
+        self.start = time.perf_counter_ns()
+        self.duration = None
+        self.phases = {}
+        self.resolvers = []
+        self.sql_count = 0
+        self.sql_duration = 0
+        self._active = []
+
+    def offset(self):
+        return time.perf_counter_ns() - self.start
+
+    @contextmanager
+    def phase(self, name):
+        start = self.offset()
+        try:
+            yield
+        finally:
+            self.phases[name] = {'startOffset': start, 'duration': self.offset() - start}
+
+    def execute_sql(self, execute, sql, params, many, context):
+        start = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.sql_count += 1
+            self.sql_duration += elapsed
+            if self._active:
+                # Charged to the innermost running resolver.
+                self._active[-1]['sqlCount'] += 1
+                self._active[-1]['sqlDuration'] += elapsed
+
+    @contextmanager
+    def capture_sql(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self.execute_sql))
+            yield
+
+    def middleware(self):
+        return TracingMiddleware(self)
+
+    def finish(self, result):
+        """Stop the clock and add the trace to the metrics."""
+        self.duration = self.offset()
+        OPERATION_DURATION.observe(self.duration / 1e9)
+        OPERATION_SQL_QUERIES.observe(self.sql_count)
+        if result is not None and result.errors:
+            OPERATION_ERRORS.inc()
+        for record in self.resolvers:
+            field = (f"{record['parentType']}.{record['fieldName']}",)
+            RESOLVER_DURATION.observe(record['duration'] / 1e9, field)
+            if record['sqlCount']:
+                RESOLVER_SQL_QUERIES.inc(field, record['sqlCount'])
+                RESOLVER_SQL_SECONDS.inc(field, record['sqlDuration'] / 1e9)
+
+    def as_apollo(self):
+        """The trace in the Apollo tracing format, plus SQL counts and times."""
+        idle = {'startOffset': 0, 'duration': 0}
+        return {
+            'version': APOLLO_TRACING_VERSION,
+            'startTime': self.start_time.isoformat(),
+            'endTime': (self.start_time + timedelta(microseconds=self.duration / 1000)).isoformat(),
+            'duration': self.duration,
+            'parsing': self.phases.get('parsing', idle),
+            'validation': self.phases.get('validation', idle),
+            'execution': {'resolvers': self.resolvers},
+            'sql': {'count': self.sql_count, 'duration': self.sql_duration},
+        }
+
+
+class TracingMiddleware:
+    """Graphene middleware recording every resolver call of a Tracer."""
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def resolve(self, next, root, info, **args):
+        tracer = self.tracer
+        record = {
+            'path': info.path.as_list(),
+            'parentType': info.parent_type.name,
+            'fieldName': info.field_name,
+            'returnType': str(info.return_type),
+            'startOffset': tracer.offset(),
+            'duration': 0,
+            'sqlCount': 0,
+            'sqlDuration': 0,
+        }
+        tracer._active.append(record)
+        try:
+            return next(root, info, **args)
+        finally:
+            tracer._active.pop()
+            record['duration'] = tracer.offset() - record['startOffset']
+            tracer.resolvers.append(record)
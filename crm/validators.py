@@ -0,0 +1,4 @@
+from django.core.validators import RegexValidator
+
+# Shared by every customer write path so the pattern is compiled once.
+phone_validator = RegexValidator(regex=r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
@@ -1,3 +1,336 @@
-from django.shortcuts import render
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import close_old_connections, connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.utils.utils import set_rollback
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, validate_schema
+
+from . import response_cache
+from .cost import analyze_operation, charge
+from .db import read_from_replica
+from .documents import get_document, register_persisted_query, resolve_persisted_query
+from .export import EXPORTS, ExportError, export_stream
+from .loaders import CRMLoaders
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry
+from .tracing import start_trace
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that attaches a fresh set of DataLoaders to every request,
+    serves persisted queries from the parsed-document cache, rejects
+    operations over the cost limits (see ``crm.cost``) and answers
+    repeated read-only queries from the response cache.
+
+    The cost estimate of every operation is reported under
+    ``extensions.cost`` of the response. Sampled operations are traced
+    (see ``crm.tracing``).
+
+    A POST whose JSON body is an array is a batch: its operations (at most
+    ``CRM_GRAPHQL_MAX_BATCH_SIZE``) run in order, share one set of
+    DataLoaders until a mutation runs, and the response is the array of
+    their results, each with its ``id`` and ``status``.
+    """
+
+    def get_context(self, request):
+        if not self.batch or getattr(request, 'loaders', None) is None:
+            request.loaders = CRMLoaders()
+        return request
+
+    def parse_body(self, request):
+        if self.get_content_type(request) == "application/json" and request.body.lstrip().startswith(b"["):
+            # A fresh view serves every request, so this only affects this one.
+            self.batch = True
+        data = super().parse_body(request)
+        if self.batch:
+            max_size = getattr(settings, 'CRM_GRAPHQL_MAX_BATCH_SIZE', None)
+            if max_size is not None and len(data) > max_size:
+                raise HttpError(HttpResponseBadRequest(
+                    f"Batch of {len(data)} operations exceeds the limit of {max_size}."
+                ))
+            if not all(isinstance(entry, dict) for entry in data):
+                raise HttpError(HttpResponseBadRequest("Every operation of a batch must be a JSON object."))
+        return data
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        tracer = getattr(request, 'crm_tracer', None)
+        if tracer is not None:
+            middleware = [tracer.middleware(), *(middleware or [])]
+        return middleware
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions if isinstance(extensions, dict) else None
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        tracer = start_trace(request, self.get_extensions(request, data))
+        # Set even when not sampled, so a batch does not reuse the tracer
+        # of an earlier operation.
+        request.crm_tracer = tracer
+        if tracer is None:
+            return self._execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        with tracer.capture_sql():
+            result = self._execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        tracer.finish(result)
+        if result is not None and tracer.in_response:
+            result.extensions = {**(result.extensions or {}), 'tracing': tracer.as_apollo()}
+        return result
+
+    def _execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        extensions = self.get_extensions(request, data)
+        if not query and not extensions:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            query, sha256 = resolve_persisted_query(query, extensions)
+        except GraphQLError as error:
+            return ExecutionResult(data=None, errors=[error])
+        document, errors = get_document(
+            schema, query, sha256, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS,
+            tracer=getattr(request, 'crm_tracer', None),
+        )
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        if query is not None and (extensions or {}).get('persistedQuery'):
+            register_persisted_query(sha256, query)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        query_cost = None
+        if operation_ast is not None:
+            query_cost = analyze_operation(schema, document, operation_ast, variables)
+            if query_cost.errors:
+                return self.with_cost(ExecutionResult(data=None, errors=query_cost.errors), query_cost)
+
+        cache_key = None
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+            and response_cache.response_cache() is not None
+        ):
+            plan = response_cache.operation_plan(schema, document, sha256, operation_ast)
+            cache_key = response_cache.response_key(
+                plan, operation_name, variables, getattr(request, "user", None)
+            )
+            cached = response_cache.get_response(cache_key)
+            if cached is not None:
+                return self.with_cost(ExecutionResult(data=cached), query_cost)
+
+        if query_cost is not None:
+            # Cached responses are free; only executed operations are charged.
+            charge(query_cost, request)
+            if query_cost.errors:
+                return self.with_cost(ExecutionResult(data=None, errors=query_cost.errors), query_cost)
+
+        reads = nullcontext()
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            # In a batch, a mutation and the operations after it get loaders
+            # that have not cached anything from before its writes.
+            request.loaders = None
+        elif operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            # Only queries may read the replica; a mutation reads what it writes.
+            reads = read_from_replica()
+
+        try:
+            with reads:
+                execute_options = {
+                    "root_value": self.get_root_value(request),
+                    "context_value": self.get_context(request),
+                    "variable_values": variables,
+                    "operation_name": operation_name,
+                    "middleware": self.get_middleware(request),
+                }
+                if self.execution_context_class:
+                    execute_options["execution_context_class"] = self.execution_context_class
+
+                if (
+                    operation_ast is not None
+                    and operation_ast.operation == OperationType.MUTATION
+                    and (
+                        graphene_settings.ATOMIC_MUTATIONS is True
+                        or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                    )
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return self.with_cost(result, query_cost)
+
+                result = execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        if cache_key is not None and not result.errors:
+            response_cache.set_response(cache_key, result.data)
+        return self.with_cost(result, query_cost)
+
+    @staticmethod
+    def with_cost(result, query_cost):
+        if query_cost is not None:
+            result.extensions = {**(result.extensions or {}), 'cost': query_cost.as_extension()}
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        # GraphQLView.get_response, plus the result's extensions.
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+_graphql_executor = None
+
+
+def graphql_executor():
+    """The bounded pool AsyncCRMGraphQLView runs operations in."""
+    global _graphql_executor
+    if _graphql_executor is None:
+        _graphql_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CRM_GRAPHQL_ASYNC_WORKERS', None),
+            thread_name_prefix='crm-graphql',
+        )
+    return _graphql_executor
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    ASGI-native variant of CRMGraphQLView.
+
+    graphene-django resolves connection and model fields synchronously, so
+    rather than hopping threads for every resolver, each operation runs
+    whole in a worker of a bounded pool. The event loop is never blocked,
+    slow operations only hold a pool worker, and the pool size
+    (``CRM_GRAPHQL_ASYNC_WORKERS``) caps the database connections the view
+    opens.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        return await sync_to_async(self._dispatch_in_worker, thread_sensitive=False, executor=graphql_executor())(
+            request, *args, **kwargs
+        )
+
+    def _dispatch_in_worker(self, request, *args, **kwargs):
+        # Pool threads outlive requests, so apply the same connection
+        # lifetime rules Django applies around a synchronous request.
+        close_old_connections()
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+@require_GET
+def metrics_view(request):
+    """GraphQL tracing metrics in the Prometheus text format."""
+    return HttpResponse(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+@require_GET
+@staff_member_required
+def export_view(request, kind):
+    """
+    Stream a CRM table as NDJSON (default) or CSV. Staff only.
+
+    ``?format=csv`` selects CSV, ``?gzip=1`` compresses on the fly, and every
+    other parameter is a filter of the table's filter set.
+    """
+    if kind not in EXPORTS:
+        raise Http404(f"Unknown export '{kind}'")
+    params = request.GET.copy()
+    fmt = params.pop('format', ['ndjson'])[-1]
+    compress = params.pop('gzip', ['0'])[-1] in ('1', 'true')
+    try:
+        stream = export_stream(kind, params, fmt, compress)
+    except ExportError as error:
+        return HttpResponseBadRequest(str(error))
+    filename = f"{kind}.{fmt}" + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        stream, content_type='application/gzip' if compress else EXPORT_CONTENT_TYPES[fmt]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response